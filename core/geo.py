@@ -0,0 +1,317 @@
+# core/geo.py
+"""
+Distances and spatial lookups for shops and riders.
+
+- ``haversine_km()``: great-circle distance; ``distance_matrix()`` for
+  every origin/destination pair at once.
+- ``geohash_encode()`` / ``geohash_filter()``: rows store the geohash of
+  their position in an indexed column (``Shop.geohash``,
+  ``RiderProfile.geohash``). A radius search becomes a few indexed
+  ``LIKE 'prefix%'`` lookups instead of a scan; callers still check the exact
+  distance, since the cells cover more than the circle.
+- ``KDTree``: an in-memory 3-d tree over points on the unit sphere. Chord
+  length grows with great-circle distance, so plain Euclidean pruning is
+  exact and there is no special case at the antimeridian.
+- ``SpatialIndex``: a KDTree of one kind of row that rebuilds itself after
+  ``invalidate()``. Call that when positions change; other processes notice
+  through a version number in the cache, or after ``max_age`` seconds when
+  the cache is per process.
+
+Pure Python: no GIS database or numpy needed.
+"""
+import heapq
+import math
+import threading
+import time
+from operator import itemgetter
+
+from django.core.cache import cache
+from django.db.models import Q
+
+EARTH_RADIUS_KM = 6371.0088
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # about 4.8 m x 4.8 m
+_GEOHASH_BITS = {char: index for index, char in enumerate(GEOHASH_ALPHABET)}
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def has_position(lat, lon):
+    return lat is not None and lon is not None and -90 <= lat <= 90 and -180 <= lon <= 180
+
+
+def distance_matrix(origins, destinations):
+    """
+    Great-circle km from each ``(lat, lon)`` in ``origins`` to each in
+    ``destinations``, as one row per origin. The trigonometry is done once
+    per point rather than once per pair: each cell is a chord between two
+    unit vectors, as in KDTree.
+    """
+    targets = [_unit_vector(lat, lon) for lat, lon in destinations]
+    rows = []
+    for lat, lon in origins:
+        x, y, z = _unit_vector(lat, lon)
+        rows.append([
+            _chord_to_km(math.sqrt((x - tx) ** 2 + (y - ty) ** 2 + (z - tz) ** 2)) for tx, ty, tz in targets
+        ])
+    return rows
+
+
+# -------------------------
+# Geohash
+# -------------------------
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash):
+    """``(min_lat, min_lon, max_lat, max_lon)`` of the cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = _GEOHASH_BITS[char]
+        for shift in range(4, -1, -1):
+            bounds = lon_range if even else lat_range
+            middle = (bounds[0] + bounds[1]) / 2
+            if bits >> shift & 1:
+                bounds[0] = middle
+            else:
+                bounds[1] = middle
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def cell_size_deg(precision):
+    """``(height, width)`` of a geohash cell of ``precision`` characters, in degrees."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def geohash_cells(lat, lon, radius_km):
+    """
+    Geohash prefixes whose cells together cover every point within
+    ``radius_km`` of ``(lat, lon)``: the point's cell and its neighbours, at
+    the finest precision whose cells are at least ``radius_km`` across.
+    """
+    km_per_deg_lat = math.pi * EARTH_RADIUS_KM / 180
+    km_per_deg_lon = km_per_deg_lat * max(math.cos(math.radians(min(abs(lat) + 1, 89.9))), 1e-6)
+    precision = 1
+    for candidate in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size_deg(candidate)
+        if height * km_per_deg_lat >= radius_km and width * km_per_deg_lon >= radius_km:
+            precision = candidate
+            break
+    height, width = cell_size_deg(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        for dlon in (-width, 0, width):
+            cell_lat = max(-90.0, min(90.0, lat + dlat))
+            cell_lon = (lon + dlon + 180) % 360 - 180
+            cells.add(geohash_encode(cell_lat, cell_lon, precision))
+    return sorted(cells)
+
+
+def geohash_filter(lat, lon, radius_km, field="geohash"):
+    """A Q object narrowing rows to the cells around ``(lat, lon)``; see geohash_cells()."""
+    query = Q()
+    for cell in geohash_cells(lat, lon, radius_km):
+        query |= Q(**{f"{field}__startswith": cell})
+    return query
+
+
+# -------------------------
+# KD-tree
+# -------------------------
+def _unit_vector(lat, lon):
+    phi, lam = math.radians(lat), math.radians(lon)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def _chord_to_km(chord):
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def _km_to_chord(km):
+    return 2 * math.sin(min(km, math.pi * EARTH_RADIUS_KM) / (2 * EARTH_RADIUS_KM))
+
+
+class KDTree:
+    """
+    Static tree over ``(key, lat, lon)`` points. Build once, query many
+    times; rebuild to change it.
+    """
+    leaf_size = 16
+
+    def __init__(self, points):
+        self.keys = []
+        self.coords = []
+        for key, lat, lon in points:
+            if has_position(lat, lon):
+                self.keys.append(key)
+                self.coords.append(_unit_vector(lat, lon))
+        self.root = self._build(list(range(len(self.coords))), 0)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _build(self, indices, depth):
+        # Node: ("leaf", indices) or (axis, split value, left, right).
+        if len(indices) <= self.leaf_size:
+            return ("leaf", indices)
+        axis = depth % 3
+        coords = self.coords
+        indices.sort(key=lambda i: coords[i][axis])
+        middle = len(indices) // 2
+        return (
+            axis,
+            coords[indices[middle]][axis],
+            self._build(indices[:middle], depth + 1),
+            self._build(indices[middle:], depth + 1),
+        )
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """Up to ``k`` ``(key, km)`` pairs, nearest first."""
+        if not self.keys or k <= 0:
+            return []
+        target = _unit_vector(lat, lon)
+        limit = _km_to_chord(max_km) ** 2 if max_km is not None else math.inf
+        heap = []  # (-squared chord, index): the k best so far, worst on top
+        coords = self.coords
+
+        def visit(node):
+            worst = -heap[0][0] if len(heap) == k else limit
+            if node[0] == "leaf":
+                for i in node[1]:
+                    x, y, z = coords[i]
+                    d = (x - target[0]) ** 2 + (y - target[1]) ** 2 + (z - target[2]) ** 2
+                    if d <= worst:
+                        if len(heap) == k:
+                            heapq.heapreplace(heap, (-d, i))
+                        else:
+                            heapq.heappush(heap, (-d, i))
+                        worst = -heap[0][0] if len(heap) == k else limit
+                return
+            axis, split, left, right = node
+            gap = target[axis] - split
+            near, far = (left, right) if gap < 0 else (right, left)
+            visit(near)
+            worst = -heap[0][0] if len(heap) == k else limit
+            if gap * gap <= worst:
+                visit(far)
+
+        visit(self.root)
+        found = sorted((-d, i) for d, i in heap)
+        return [(self.keys[i], _chord_to_km(math.sqrt(d))) for d, i in found]
+
+    def within(self, lat, lon, radius_km):
+        """Every ``(key, km)`` pair within ``radius_km``, nearest first."""
+        if not self.keys:
+            return []
+        target = _unit_vector(lat, lon)
+        limit = _km_to_chord(radius_km) ** 2
+        found = []
+        stack = [self.root]
+        coords = self.coords
+        while stack:
+            node = stack.pop()
+            if node[0] == "leaf":
+                for i in node[1]:
+                    x, y, z = coords[i]
+                    d = (x - target[0]) ** 2 + (y - target[1]) ** 2 + (z - target[2]) ** 2
+                    if d <= limit:
+                        found.append((d, i))
+                continue
+            axis, split, left, right = node
+            gap = target[axis] - split
+            stack.append(left if gap < 0 else right)
+            if gap * gap <= limit:
+                stack.append(right if gap < 0 else left)
+        found.sort(key=itemgetter(0))
+        return [(self.keys[i], _chord_to_km(math.sqrt(d))) for d, i in found]
+
+
+# -------------------------
+# Self-rebuilding index
+# -------------------------
+class SpatialIndex:
+    """
+    A KDTree over ``load()``, an iterable of ``(key, lat, lon)``, rebuilt on
+    the first query after ``invalidate()``.
+
+    ``min_interval`` bounds how often a busy index (rider positions) is
+    rebuilt: queries in between use the previous tree. ``max_age`` is the
+    longest a tree is trusted without hearing of a change, for processes
+    that do not share a cache.
+    """
+
+    def __init__(self, name, load, min_interval=0.0, max_age=300.0):
+        self.name = name
+        self.load = load
+        self.min_interval = min_interval
+        self.max_age = max_age
+        self._tree = None
+        self._version = None
+        self._built_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return f"geo-index:{self.name}:version"
+
+    def invalidate(self):
+        self._stale = True
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+
+    def _needs_rebuild(self, now):
+        if self._tree is None:
+            return True
+        if now - self._built_at < self.min_interval:
+            return False
+        return self._stale or now - self._built_at > self.max_age or cache.get(self.version_key) != self._version
+
+    def tree(self):
+        now = time.monotonic()
+        if self._needs_rebuild(now):
+            with self._lock:
+                if self._needs_rebuild(now):
+                    # Read the version first: a change during the load is picked up next time.
+                    version = cache.get(self.version_key)
+                    self._stale = False
+                    self._tree = KDTree(self.load())
+                    self._version = version
+                    self._built_at = time.monotonic()
+        return self._tree
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        return self.tree().nearest(lat, lon, k, max_km)
+
+    def within(self, lat, lon, radius_km):
+        return self.tree().within(lat, lon, radius_km)
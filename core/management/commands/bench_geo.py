@@ -0,0 +1,103 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from core.geo import KDTree, geohash_encode, haversine_km
+
+# Rough population centres, so points cluster the way shops and riders do.
+CITIES = [
+    (-1.2921, 36.8219, 0.08),  # Nairobi
+    (-4.0435, 39.6682, 0.05),  # Mombasa
+    (-0.0917, 34.7680, 0.04),  # Kisumu
+    (-0.3031, 36.0800, 0.04),  # Nakuru
+    (0.5143, 35.2698, 0.04),  # Eldoret
+]
+
+
+def sample_points(count, seed):
+    rng = random.Random(seed)
+    points = []
+    for key in range(count):
+        if rng.random() < 0.8:
+            lat, lon, spread = rng.choice(CITIES)
+            points.append((key, rng.gauss(lat, spread), rng.gauss(lon, spread)))
+        else:
+            points.append((key, rng.uniform(-4.6, 4.6), rng.uniform(34.0, 41.5)))
+    return points
+
+
+def per_query_ms(queries, run):
+    timings = []
+    for lat, lon in queries:
+        started = time.perf_counter()
+        run(lat, lon)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.mean(timings), sorted(timings)[int(len(timings) * 0.95)]
+
+
+class Command(BaseCommand):
+    help = "Compare KD-tree and geohash lookups with full scans for 10k shops and 50k riders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shops", type=int, default=10_000)
+        parser.add_argument("--riders", type=int, default=50_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=5)
+        parser.add_argument("--radius-km", type=float, default=3.0)
+        parser.add_argument("--with-db", action="store_true", help="Also time geohash lookups on real Shop rows.")
+
+    def handle(self, *args, **options):
+        k, radius = options["k"], options["radius_km"]
+        queries = [(lat, lon) for _, lat, lon in sample_points(options["queries"], seed=99)]
+
+        self.stdout.write(f"{options['queries']} queries, k={k}, radius={radius} km")
+        self.stdout.write(f"{'dataset':<16}{'lookup':<22}{'mean ms':>10}{'p95 ms':>10}")
+        for label, count in (("shops", options["shops"]), ("riders", options["riders"])):
+            points = sample_points(count, seed=count)
+            started = time.perf_counter()
+            tree = KDTree(points)
+            build_ms = (time.perf_counter() - started) * 1000
+            self.stdout.write(f"{label:<16}{'build tree':<22}{build_ms:>10.1f}")
+
+            def scan_nearest(lat, lon):
+                return sorted((haversine_km(lat, lon, plat, plon), key) for key, plat, plon in points)[:k]
+
+            def scan_within(lat, lon):
+                return [key for key, plat, plon in points if haversine_km(lat, lon, plat, plon) <= radius]
+
+            for name, run in (
+                ("scan k-nearest", scan_nearest),
+                ("tree k-nearest", lambda lat, lon: tree.nearest(lat, lon, k)),
+                ("scan radius", scan_within),
+                ("tree radius", lambda lat, lon: tree.within(lat, lon, radius)),
+            ):
+                mean, p95 = per_query_ms(queries, run)
+                self.stdout.write(f"{f'{label} ({count})':<16}{name:<22}{mean:>10.3f}{p95:>10.3f}")
+
+        if options["with_db"]:
+            self.bench_db(options["shops"], queries, radius)
+
+    def bench_db(self, count, queries, radius):
+        from shops.geo import shops_within_db
+        from shops.models import Shop
+
+        prefix = f"bench-{uuid.uuid4().hex[:8]}-"
+        Shop.objects.bulk_create([
+            Shop(name=f"{prefix}{key}", latitude=lat, longitude=lon, geohash=geohash_encode(lat, lon))
+            for key, lat, lon in sample_points(count, seed=count)
+        ], batch_size=1000)
+        try:
+            def scan(lat, lon):
+                return [
+                    shop for shop in Shop.objects.exclude(latitude=None)
+                    if haversine_km(lat, lon, shop.latitude, shop.longitude) <= radius
+                ]
+
+            for name, run in (("db full scan", scan), ("db geohash cells", lambda lat, lon: shops_within_db(lat, lon, radius))):
+                mean, p95 = per_query_ms(queries[:50], run)
+                self.stdout.write(f"{'shops (db)':<16}{name:<22}{mean:>10.3f}{p95:>10.3f}")
+        finally:
+            Shop.objects.filter(name__startswith=prefix).delete()
@@ -1,3 +1,19 @@
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
 
 # Create your models here.
+
+
+class PubSubEvent(models.Model):
+    """
+    One published event, for core.pubsub.DatabaseBackend. Short-lived: every
+    worker process polls new rows and they are pruned after PUBSUB_RETENTION.
+    """
+    channel = models.CharField(max_length=200)
+    event = models.CharField(max_length=50)
+    data = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"{self.channel}: {self.event}"
@@ -0,0 +1,227 @@
+# core/pubsub.py
+"""
+Publish/subscribe for server-sent event streams (see core.sse).
+
+``publish(channel, event, data)`` is called from ordinary synchronous code,
+usually once a transaction has committed. Subscribers are async SSE views
+holding ``subscribe(*channels)``. Each process keeps one registry of its
+subscribers, so handing an event to a channel is a dict lookup plus a queue
+put per listener: thousands of idle connections cost memory, not queries.
+
+Events reach other worker processes through the backend named by
+``PUBSUB_BACKEND``:
+
+- ``LocalBackend`` delivers straight into this process (one worker, tests).
+- ``DatabaseBackend`` stores ``PubSubEvent`` rows. Every process that has
+  subscribers polls them once per ``PUBSUB_POLL_INTERVAL`` and delivers them
+  locally, so there is one query per process, not per connection. Rows older
+  than ``PUBSUB_RETENTION`` seconds are pruned. Redis or Postgres
+  LISTEN/NOTIFY can replace it behind the same two methods.
+"""
+import asyncio
+import itertools
+import os
+import threading
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import Any, NamedTuple
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+PUBSUB_BACKEND = getattr(settings, "PUBSUB_BACKEND", "core.pubsub.LocalBackend")
+PUBSUB_POLL_INTERVAL = getattr(settings, "PUBSUB_POLL_INTERVAL", 1.0)  # seconds
+PUBSUB_RETENTION = getattr(settings, "PUBSUB_RETENTION", 300)  # seconds
+
+# Events a subscriber may fall behind by before the oldest are dropped.
+SUBSCRIBER_BUFFER = 100
+
+
+class Message(NamedTuple):
+    id: Any
+    channel: str
+    event: str
+    data: Any
+
+
+class Subscription:
+    """One listener's queue, bound to the event loop that created it."""
+
+    def __init__(self, channels, maxsize=SUBSCRIBER_BUFFER):
+        self.channels = tuple(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, message):
+        # Runs on self.loop. A slow reader loses its oldest events, never blocks the publisher.
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+    async def get(self, timeout=None):
+        """The next message, or None after ``timeout`` seconds without one."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+_subscribers = defaultdict(set)  # channel -> {Subscription}
+_lock = threading.Lock()
+
+
+def has_subscribers():
+    return bool(_subscribers)
+
+
+def subscriber_count(channel=None):
+    with _lock:
+        if channel is not None:
+            return len(_subscribers.get(channel, ()))
+        return len({subscription for subscriptions in _subscribers.values() for subscription in subscriptions})
+
+
+def deliver(message):
+    """Hand ``message`` to this process' subscribers of its channel. Thread-safe."""
+    with _lock:
+        targets = list(_subscribers.get(message.channel, ()))
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    for subscription in targets:
+        if subscription.loop is running:
+            subscription.put(message)
+        else:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.put, message)
+            except RuntimeError:
+                pass  # its loop has shut down; the subscription is going away
+
+
+# -------------------------
+# Backends
+# -------------------------
+class LocalBackend:
+    """Only this process' subscribers hear events."""
+
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def publish_many(self, messages):
+        for channel, event, data in messages:
+            deliver(Message(next(self._ids), channel, event, data))
+
+    async def start(self):
+        pass
+
+
+class DatabaseBackend:
+    """Events go through the PubSubEvent table; one poller per process."""
+
+    # Ids are allocated at INSERT but become visible at COMMIT, so a smaller id
+    # can appear after a larger one. Recent rows up to this many ids behind the
+    # newest seen are re-read, and the ones already delivered are skipped.
+    lookback = 200
+    late_commit = timedelta(seconds=10)
+
+    def __init__(self, poll_interval=PUBSUB_POLL_INTERVAL, retention=PUBSUB_RETENTION):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._task = None
+
+    def publish_many(self, messages):
+        from .models import PubSubEvent
+
+        PubSubEvent.objects.bulk_create(
+            [PubSubEvent(channel=channel, event=event, data=data) for channel, event, data in messages],
+            batch_size=500,
+        )
+
+    async def start(self):
+        if self._task is None or self._task.done() or self._task.get_loop() is not asyncio.get_running_loop():
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def _poll(self):
+        from .models import PubSubEvent
+
+        latest = await PubSubEvent.objects.order_by("-id").values_list("id", flat=True).afirst()
+        newest = latest or 0
+        seen = deque(maxlen=self.lookback * 4)
+        seen_ids = set()
+        pruned_at = timezone.now()
+        # Stop once nobody listens; the next subscribe() starts a new poller.
+        while has_subscribers():
+            recent = Q(id__gt=newest - self.lookback, created_at__gte=timezone.now() - self.late_commit)
+            rows = PubSubEvent.objects.filter(Q(id__gt=newest) | recent).order_by("id")
+            async for row in rows.values_list("id", "channel", "event", "data"):
+                if row[0] in seen_ids:
+                    continue
+                if len(seen) == seen.maxlen:
+                    seen_ids.discard(seen[0])
+                seen.append(row[0])
+                seen_ids.add(row[0])
+                newest = max(newest, row[0])
+                deliver(Message(*row))
+
+            now = timezone.now()
+            if now - pruned_at > timedelta(seconds=self.retention):
+                pruned_at = now
+                await PubSubEvent.objects.filter(created_at__lt=now - timedelta(seconds=self.retention)).adelete()
+            await asyncio.sleep(self.poll_interval)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(PUBSUB_BACKEND)()
+    return _backend
+
+
+def _reset_after_fork():
+    global _backend
+    _backend = None
+    _subscribers.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# -------------------------
+# API
+# -------------------------
+def publish(channel, event, data=None):
+    get_backend().publish_many([(channel, event, data)])
+
+
+def publish_many(messages):
+    """Publish ``(channel, event, data)`` triples; one INSERT per batch on the database backend."""
+    messages = list(messages)
+    if messages:
+        get_backend().publish_many(messages)
+
+
+@asynccontextmanager
+async def subscribe(*channels, maxsize=SUBSCRIBER_BUFFER):
+    subscription = Subscription(channels, maxsize)
+    with _lock:
+        for channel in channels:
+            _subscribers[channel].add(subscription)
+    try:
+        await get_backend().start()
+        yield subscription
+    finally:
+        with _lock:
+            for channel in channels:
+                _subscribers[channel].discard(subscription)
+                if not _subscribers[channel]:
+                    del _subscribers[channel]
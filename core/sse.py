@@ -0,0 +1,58 @@
+# core/sse.py
+"""
+Server-sent event responses fed by core.pubsub.
+
+``event_stream(channels, initial=...)`` returns a ``StreamingHttpResponse``
+whose body is an async generator. Under ASGI (uvicorn workers, see the
+procfile) an idle stream is one suspended coroutine and no thread, so a
+worker holds thousands of them. The stream sends a keep-alive comment every
+``SSE_HEARTBEAT`` seconds and ends after ``SSE_MAX_AGE`` seconds. Browsers
+reconnect on their own, which spreads clients across workers after deploys.
+
+Streams need the ASGI server. Under WSGI (``runserver``) the response would
+never finish; use ``uvicorn dropagent.asgi:application --reload`` locally.
+"""
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .pubsub import subscribe
+
+SSE_HEARTBEAT = getattr(settings, "SSE_HEARTBEAT", 15)  # seconds
+SSE_MAX_AGE = getattr(settings, "SSE_MAX_AGE", 30 * 60)  # seconds
+SSE_RETRY = 5000  # milliseconds browsers wait before reconnecting
+
+
+def format_event(event, data, id=None):
+    lines = [f"id: {id}"] if id is not None else []
+    lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in json.dumps(data, cls=DjangoJSONEncoder).splitlines())
+    return "\n".join(lines) + "\n\n"
+
+
+async def _events(channels, initial, heartbeat, max_age):
+    loop = asyncio.get_running_loop()
+    async with subscribe(*channels) as subscription:
+        yield f"retry: {SSE_RETRY}\n\n"
+        for event, data in initial:
+            yield format_event(event, data)
+        deadline = loop.time() + max_age
+        while loop.time() < deadline:
+            message = await subscription.get(timeout=min(heartbeat, deadline - loop.time()))
+            if message is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield format_event(message.event, message.data, message.id)
+
+
+def event_stream(channels, initial=(), heartbeat=SSE_HEARTBEAT, max_age=SSE_MAX_AGE):
+    """Stream ``(event, data)`` pairs from ``initial``, then everything published to ``channels``."""
+    response = StreamingHttpResponse(
+        _events(list(channels), list(initial), heartbeat, max_age), content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: do not buffer the stream
+    return response
@@ -1,3 +1,129 @@
-from django.test import TestCase
+import asyncio
+import random
+import threading
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+
+from parcels.models import Parcel
+
+from . import geo, pubsub, views
+from .sse import _events, format_event
+
+
+@mock.patch.object(pubsub, "_backend", pubsub.LocalBackend())
+class PubSubTests(TestCase):
+
+    async def test_local_backend_delivers_across_threads(self):
+        backend = pubsub.get_backend()
+        async with pubsub.subscribe("parcel:REF-1") as subscription:
+            thread = threading.Thread(target=backend.publish_many, args=([("parcel:REF-1", "status", {"s": 1})],))
+            thread.start()
+            message = await subscription.get(timeout=2)
+            thread.join()
+        self.assertEqual((message.event, message.data), ("status", {"s": 1}))
+        self.assertEqual(pubsub.subscriber_count(), 0)
+
+    async def test_database_backend_polls_new_rows_once_per_process(self):
+        with mock.patch.object(pubsub, "_backend", pubsub.DatabaseBackend(poll_interval=0.01)):
+            async with pubsub.subscribe("jobs") as first, pubsub.subscribe("jobs") as second:
+                await asyncio.sleep(0.05)  # let the poller note where the table ends
+                await sync_to_async(pubsub.publish)("jobs", "job_available", {"id": 7})
+                messages = [await first.get(timeout=2), await second.get(timeout=2)]
+        self.assertEqual([message.data for message in messages], [{"id": 7}, {"id": 7}])
+
+    async def test_slow_subscriber_drops_oldest(self):
+        async with pubsub.subscribe("c", maxsize=2) as subscription:
+            for n in range(3):
+                pubsub.deliver(pubsub.Message(n, "c", "e", n))
+            self.assertEqual(subscription.dropped, 1)
+            self.assertEqual((await subscription.get(timeout=1)).data, 1)
+
+
+@mock.patch.object(pubsub, "_backend", pubsub.LocalBackend())
+class EventStreamTests(TestCase):
+
+    def test_format_event(self):
+        self.assertEqual(format_event("status", {"a": 1}, id=3), 'id: 3\nevent: status\ndata: {"a": 1}\n\n')
+
+    async def test_stream_sends_initial_state_then_published_events(self):
+        stream = _events(["parcel:REF-1"], [("status", {"status": "created"})], heartbeat=1, max_age=5)
+        self.assertTrue((await anext(stream)).startswith("retry:"))
+        self.assertIn('"created"', await anext(stream))
+        pubsub.publish("parcel:REF-1", "status", {"status": "in_transit"})
+        self.assertIn('"in_transit"', await anext(stream))
+        await stream.aclose()
+
+
+class GeoTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(7)
+        cls.points = [(key, rng.uniform(-1.5, -1.0), rng.uniform(36.6, 37.1)) for key in range(2000)]
+        cls.tree = geo.KDTree(cls.points)
+
+    def brute_force(self, lat, lon):
+        return sorted((geo.haversine_km(lat, lon, plat, plon), key) for key, plat, plon in self.points)
+
+    def test_tree_matches_brute_force(self):
+        for lat, lon in [(-1.2921, 36.8219), (-1.0, 36.6), (-1.45, 37.05)]:
+            expected = self.brute_force(lat, lon)
+            self.assertEqual([key for key, _ in self.tree.nearest(lat, lon, 7)], [key for _, key in expected[:7]])
+            within = self.tree.within(lat, lon, 2.5)
+            self.assertEqual(sorted(key for key, _ in within), sorted(key for km, key in expected if km <= 2.5))
+            self.assertAlmostEqual(within[0][1], expected[0][0], places=6)
+
+    def test_geohash_cells_cover_the_radius(self):
+        self.assertEqual(geo.geohash_encode(-1.2921, 36.8219), "kzf0tuubu")
+        lat, lon, radius = -1.2921, 36.8219, 4.0
+        cells = geo.geohash_cells(lat, lon, radius)
+        for km, key in self.brute_force(lat, lon):
+            if km > radius:
+                break
+            _, plat, plon = self.points[key]
+            self.assertTrue(any(geo.geohash_encode(plat, plon).startswith(cell) for cell in cells))
+
+    def test_index_rebuilds_after_invalidate(self):
+        points = [(1, -1.29, 36.82)]
+        index = geo.SpatialIndex("test", lambda: list(points))
+        self.assertEqual(index.nearest(-1.3, 36.8)[0][0], 1)
+        points.append((2, -1.3, 36.8))
+        self.assertEqual(index.nearest(-1.3, 36.8)[0][0], 1)
+        index.invalidate()
+        self.assertEqual(index.nearest(-1.3, 36.8)[0][0], 2)
+
+
+@mock.patch.object(views, "render", lambda request, template, context: context)
+class HomeLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.parcel = Parcel.objects.create(reference="REF-2025-0001", customer_name="Jane", destination="Nairobi")
+
+    def setUp(self):
+        cache.clear()
+
+    def lookup(self, query):
+        return views.home(RequestFactory().get("/", {"q": query}))["parcels"]
+
+    def test_reference_is_served_from_the_cache(self):
+        self.assertEqual(self.lookup("REF-2025-0001")[0]["reference"], "REF-2025-0001")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.lookup(" REF-2025-0001 ")[0]["status"], self.parcel.status)
+
+    def test_unknown_reference_is_remembered_and_never_searched(self):
+        with mock.patch.object(views, "search") as search:
+            self.assertEqual(self.lookup("REF-2025-9999"), [])
+            with self.assertNumQueries(0):
+                self.assertEqual(self.lookup("REF-2025-9999"), [])
+        search.assert_not_called()
+
+    def test_names_and_fragments_are_searched(self):
+        with mock.patch.object(views, "search", return_value=[self.parcel]) as search:
+            self.assertEqual(self.lookup("Nairobi"), [self.parcel])
+            self.lookup("0001")
+            self.lookup("Jane Doe 12345")
+        self.assertEqual([call.args[0] for call in search.call_args_list], ["Nairobi", "0001", "Jane Doe 12345"])
@@ -3,11 +3,18 @@ from django.shortcuts import render
 # Create your views here.
 # core/views.py
 from django.shortcuts import render
-from parcels.models import Parcel
+from parcels.search import search
+from parcels.tracking import get_tracking_snapshot, looks_like_reference
 
 def home(request):
     query = request.GET.get("q")
     parcels = None
     if query:
-        parcels = Parcel.objects.filter(reference__icontains=query)
+        # An exact reference is by far the common case; serve it from the
+        # cache, misses included. Names and fragments go to the search index.
+        if looks_like_reference(query):
+            snapshot = get_tracking_snapshot(query)
+            parcels = [snapshot] if snapshot else []
+        else:
+            parcels = search(query)
     return render(request, "core/home.html", {"parcels": parcels})
@@ -77,6 +77,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "dropagent.wsgi.application"
+ASGI_APPLICATION = "dropagent.asgi.application"  # what the procfile serves; needed for live streams
 
 # Database
 # Default: SQLite (for local dev)
@@ -141,3 +142,139 @@ LOGOUT_REDIRECT_URL = "/login/"
 # Twilio (optional)
 # --------------------------------------------------------------------
 TWILIO_FROM = os.getenv("TWILIO_FROM", "")
+
+# --------------------------------------------------------------------
+# QR codes (parcels.qr)
+# --------------------------------------------------------------------
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", "1024"))  # PNGs kept in memory per process
+
+# --------------------------------------------------------------------
+# Tracking / receipt / invoice numbers (parcels.numbering)
+# --------------------------------------------------------------------
+NUMBER_BLOCK_SIZE = int(os.getenv("NUMBER_BLOCK_SIZE", "100"))  # numbers reserved per worker round trip
+
+# --------------------------------------------------------------------
+# Bulk parcel import (parcels.importer)
+# --------------------------------------------------------------------
+PARCEL_IMPORT_TOKEN = os.getenv("PARCEL_IMPORT_TOKEN", "")  # X-Import-Token for scripted imports; empty disables them
+
+# --------------------------------------------------------------------
+# Cache (tracking snapshots, ...). Point CACHE_LOCATION at a shared
+# memcached/redis via CACHE_BACKEND in production so workers share entries.
+# --------------------------------------------------------------------
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": os.getenv("CACHE_LOCATION", "dropagent"),
+    }
+}
+
+TRACKING_CACHE_TTL = int(os.getenv("TRACKING_CACHE_TTL", "300"))  # seconds a tracking snapshot lives
+TRACKING_NEGATIVE_TTL = int(os.getenv("TRACKING_NEGATIVE_TTL", "30"))  # seconds an unknown reference is remembered
+
+# --------------------------------------------------------------------
+# Label sheets (parcels.labels)
+# --------------------------------------------------------------------
+LABEL_RENDER_WORKERS = int(os.getenv("LABEL_RENDER_WORKERS", "0"))  # QR encoding processes; 0 = one per CPU
+
+# --------------------------------------------------------------------
+# Receipt / delivery note PDFs (riders.pdf)
+# --------------------------------------------------------------------
+PDF_RENDER_WORKERS = int(os.getenv("PDF_RENDER_WORKERS", "2"))  # render processes per web worker
+PDF_QUEUE_LIMIT = int(os.getenv("PDF_QUEUE_LIMIT", "8"))  # renders in flight before answering 503
+PDF_RENDER_WAIT = int(os.getenv("PDF_RENDER_WAIT", "2"))  # seconds a request waits before answering 202
+
+# --------------------------------------------------------------------
+# E-mail (queued in notifications.outbox, sent by `manage.py drain_outbox`)
+# --------------------------------------------------------------------
+EMAIL_BACKEND = os.getenv(
+    "EMAIL_BACKEND",
+    "django.core.mail.backends.console.EmailBackend" if DEBUG else "django.core.mail.backends.smtp.EmailBackend",
+)
+EMAIL_HOST = os.getenv("EMAIL_HOST", "localhost")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
+EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "True") == "True"
+EMAIL_TIMEOUT = int(os.getenv("EMAIL_TIMEOUT", "20"))
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "noreply@dropagent.com")
+
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))  # then the e-mail is marked dead
+OUTBOX_BACKOFF_BASE = int(os.getenv("OUTBOX_BACKOFF_BASE", "30"))  # seconds before the first retry, doubling
+
+# --------------------------------------------------------------------
+# Notification digests (notifications.digest, sent by `manage.py send_digests`)
+# --------------------------------------------------------------------
+NOTIFICATION_DIGEST_WINDOW = int(os.getenv("NOTIFICATION_DIGEST_WINDOW", "15"))  # minutes; users may override
+
+# --------------------------------------------------------------------
+# SMS (queued in notifications.sms, sent by `manage.py drain_sms`)
+# --------------------------------------------------------------------
+SMS_BACKEND = os.getenv(
+    "SMS_BACKEND",
+    "notifications.sms.ConsoleGateway" if DEBUG else "notifications.sms.HttpGateway",
+)
+# fake_sms_gateway's address in development; production must name its gateway
+# (drain_sms refuses to start without one).
+SMS_GATEWAY_URL = os.getenv("SMS_GATEWAY_URL", "http://127.0.0.1:8025/messages" if DEBUG else "")
+SMS_GATEWAY_API_KEY = os.getenv("SMS_GATEWAY_API_KEY", "")
+SMS_SENDER_ID = os.getenv("SMS_SENDER_ID", "DROPAGENT")
+SMS_GATEWAY_BATCH = int(os.getenv("SMS_GATEWAY_BATCH", "100"))  # messages per provider call
+SMS_RATE_LIMIT = float(os.getenv("SMS_RATE_LIMIT", "10"))  # messages per second per drainer
+SMS_MAX_ATTEMPTS = int(os.getenv("SMS_MAX_ATTEMPTS", "6"))  # then the message is marked dead
+SMS_WEBHOOK_TOKEN = os.getenv("SMS_WEBHOOK_TOKEN", "")  # X-Gateway-Token on delivery receipts
+SMS_DEFAULT_COUNTRY_CODE = os.getenv("SMS_DEFAULT_COUNTRY_CODE", "254")
+
+# --------------------------------------------------------------------
+# Live updates (core.pubsub / core.sse): tracking and rider job streams
+# --------------------------------------------------------------------
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "core.pubsub.DatabaseBackend")  # LocalBackend for a single process
+PUBSUB_POLL_INTERVAL = float(os.getenv("PUBSUB_POLL_INTERVAL", "1"))  # seconds between polls, per process
+PUBSUB_RETENTION = int(os.getenv("PUBSUB_RETENTION", "300"))  # seconds published events are kept
+SSE_HEARTBEAT = int(os.getenv("SSE_HEARTBEAT", "15"))  # seconds between keep-alive comments
+SSE_MAX_AGE = int(os.getenv("SSE_MAX_AGE", "1800"))  # seconds before a stream ends and the browser reconnects
+
+# --------------------------------------------------------------------
+# Rider wallet ledger (riders.wallet, checkpointed by `manage.py checkpoint_wallets`)
+# --------------------------------------------------------------------
+WALLET_CHECKPOINT_EVERY = int(os.getenv("WALLET_CHECKPOINT_EVERY", "100"))  # postings between balance checkpoints
+
+# --------------------------------------------------------------------
+# Rider marketplace (riders.claims, expired holds released by `manage.py release_job_claims`)
+# --------------------------------------------------------------------
+JOB_CLAIM_TTL = int(os.getenv("JOB_CLAIM_TTL", "90"))  # seconds a rider holds a job while bidding
+
+# --------------------------------------------------------------------
+# Spatial lookups (core.geo): nearest shops and riders
+# --------------------------------------------------------------------
+RIDER_POSITION_MAX_AGE = int(os.getenv("RIDER_POSITION_MAX_AGE", "900"))  # seconds before a rider drops out of lookups
+RIDER_INDEX_MIN_INTERVAL = int(os.getenv("RIDER_INDEX_MIN_INTERVAL", "5"))  # seconds between rider index rebuilds
+
+# --------------------------------------------------------------------
+# Rider GPS ingest (riders.location): buffered per process, written in bulk
+# --------------------------------------------------------------------
+LOCATION_FLUSH_INTERVAL = int(os.getenv("LOCATION_FLUSH_INTERVAL", "5"))  # seconds between bulk writes of GPS pings
+LOCATION_TRAIL_MIN_METERS = int(os.getenv("LOCATION_TRAIL_MIN_METERS", "25"))  # trail keeps a ping after this much movement
+LOCATION_TRAIL_MAX_GAP = int(os.getenv("LOCATION_TRAIL_MAX_GAP", "60"))  # ...or after this many seconds
+LOCATION_MAX_ACCURACY_M = int(os.getenv("LOCATION_MAX_ACCURACY_M", "200"))  # coarser GPS fixes are dropped
+
+# --------------------------------------------------------------------
+# Automatic dispatch (riders.dispatch, run by `manage.py dispatch_jobs --loop`)
+# --------------------------------------------------------------------
+DISPATCH_AFTER = int(os.getenv("DISPATCH_AFTER", "60"))  # seconds a new job is left to rider bids first
+DISPATCH_MAX_KM = float(os.getenv("DISPATCH_MAX_KM", "8"))  # furthest pickup a rider is given
+DISPATCH_CANDIDATES = int(os.getenv("DISPATCH_CANDIDATES", "15"))  # nearest riders scored per job
+DISPATCH_MAX_LOAD = int(os.getenv("DISPATCH_MAX_LOAD", "3"))  # jobs in hand before a rider is given no more
+DISPATCH_MAX_PER_CYCLE = int(os.getenv("DISPATCH_MAX_PER_CYCLE", "2"))  # new jobs per rider per cycle
+DISPATCH_BATCH = int(os.getenv("DISPATCH_BATCH", "5000"))  # oldest open jobs planned per cycle
+
+# --------------------------------------------------------------------
+# Delivery tariffs (parcels.tariffs): quotes, parcel delivery costs and rider pay
+# --------------------------------------------------------------------
+TARIFF_RIDER_PER_KM = os.getenv("TARIFF_RIDER_PER_KM", "60.00")  # KES per km for zones without a tariff
+TARIFF_MAX_AGE = int(os.getenv("TARIFF_MAX_AGE", "300"))  # seconds a process trusts its tables without the shared cache
+
+# --------------------------------------------------------------------
+# Rider app job feed (riders.feed)
+# --------------------------------------------------------------------
+JOB_FEED_PAGE_SIZE = int(os.getenv("JOB_FEED_PAGE_SIZE", "20"))  # jobs per page unless the app asks for fewer
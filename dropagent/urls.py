@@ -9,7 +9,7 @@ from django.contrib.auth import views as auth_views
 from dashboard import views 
 
 # App-specific imports
-from parcels.views import track_parcel_view
+from parcels.views import track_parcel_stream, track_parcel_view
 from users.views import (
     RoleLoginView,
     SuperadminDashboardView,
@@ -39,7 +39,12 @@ urlpatterns = [
 
     # Parcel tracking (public)
     path("track-parcel/", track_parcel_view, name="track_parcel"),
+    path("track-parcel/stream/", track_parcel_stream, name="track_parcel_stream"),
+    path("parcels/", include("parcels.urls")),
 
     # Riders
     path("riders/", include("riders.urls")),
+
+    # Notifications inbox
+    path("notifications/", include("notifications.urls")),
 ]
@@ -1,8 +1,51 @@
 from django.contrib import admin
-from .models import Notification
+from django.utils import timezone
+from .models import Notification, NotificationPreference, OutboxEmail, OutboxStatus, SmsMessage, SmsStatus
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ("user", "message", "created_at", "read")
+    list_display = ("user", "message", "kind", "item_count", "created_at", "read")
     search_fields = ("user__username", "message")
-    list_filter = ("read", "created_at")
+    list_filter = ("read", "kind", "created_at")
+
+
+@admin.register(NotificationPreference)
+class NotificationPreferenceAdmin(admin.ModelAdmin):
+    list_display = ("user", "email_enabled", "sms_enabled", "digest_window", "quiet_hours_start", "quiet_hours_end")
+    list_filter = ("email_enabled", "sms_enabled")
+    search_fields = ("user__username",)
+
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ("subject", "status", "attempts", "next_attempt_at", "created_at", "sent_at")
+    list_filter = ("status",)
+    search_fields = ("subject", "dedupe_key")
+    readonly_fields = ("attempts", "claimed_at", "last_error", "created_at", "sent_at")
+    actions = ["retry_now"]
+
+    def retry_now(self, request, queryset):
+        count = queryset.exclude(status=OutboxStatus.SENT).update(
+            status=OutboxStatus.PENDING, attempts=0, next_attempt_at=timezone.now(), claimed_at=None
+        )
+        self.message_user(request, f"{count} e-mail(s) queued for another attempt.")
+
+    retry_now.short_description = "Retry selected e-mails now"
+
+
+@admin.register(SmsMessage)
+class SmsMessageAdmin(admin.ModelAdmin):
+    list_display = ("to", "status", "priority", "attempts", "next_attempt_at", "sent_at", "delivered_at")
+    list_filter = ("status", "priority")
+    search_fields = ("to", "dedupe_key", "provider_id")
+    readonly_fields = ("attempts", "claimed_at", "last_error", "provider_id", "created_at", "sent_at", "delivered_at")
+    actions = ["retry_now"]
+
+    def retry_now(self, request, queryset):
+        count = queryset.filter(status__in=[SmsStatus.PENDING, SmsStatus.DEAD, SmsStatus.UNDELIVERED]).update(
+            status=SmsStatus.PENDING, attempts=0, next_attempt_at=timezone.now(), claimed_at=None,
+            provider_id=None,
+        )
+        self.message_user(request, f"{count} SMS queued for another attempt.")
+
+    retry_now.short_description = "Retry selected SMS now"
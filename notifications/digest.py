@@ -0,0 +1,156 @@
+# notifications/digest.py
+"""
+Coalescing stage for high-volume notices.
+
+``queue()`` and ``queue_many()`` store ``PendingNotice`` rows instead of
+creating a notification and e-mail each. ``flush()`` (run by ``manage.py
+send_digests``) groups due notices by user and kind. A group of one becomes
+an ordinary notification. A larger group becomes a single digest, for
+example "14 new parcels assigned", whose items stay linked to it for the
+expanded view. Both get at most one e-mail.
+
+A group is due once its oldest notice is older than the user's digest window
+(``NotificationPreference.digest_window``, else ``NOTIFICATION_DIGEST_WINDOW``
+minutes). Nothing is delivered during the user's quiet hours; the group keeps
+collecting until they end. E-mail copies respect ``email_enabled``.
+"""
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .inbox import add_unread
+from .models import Notification, NotificationPreference, NoticeKind, PendingNotice
+from .outbox import enqueue_many
+
+NOTIFICATION_DIGEST_WINDOW = getattr(settings, "NOTIFICATION_DIGEST_WINDOW", 15)
+
+# Items listed in a digest's message and e-mail; the rest are behind "expand".
+DIGEST_PREVIEW = 5
+
+DIGEST_TITLES = {
+    NoticeKind.PARCEL_ASSIGNED: "{count} new parcels assigned",
+    NoticeKind.PARCEL_REGISTERED: "{count} of your parcels were registered",
+    NoticeKind.GENERAL: "{count} new notifications",
+}
+
+
+def queue(user_id, message, title="", kind=NoticeKind.GENERAL, link=None):
+    queue_many([(user_id, message, title, kind, link)])
+
+
+def queue_many(notices, batch_size=500):
+    """Store ``(user_id, message, title, kind, link)`` notices in one INSERT per batch."""
+    PendingNotice.objects.bulk_create([
+        PendingNotice(user_id=user_id, message=message, title=title or "", kind=kind, link=link)
+        for user_id, message, title, kind, link in notices
+        if user_id
+    ], batch_size=batch_size)
+
+
+def preferences(user_ids):
+    return NotificationPreference.objects.in_bulk(list(user_ids))
+
+
+def in_quiet_hours(preference, now):
+    if preference is None or preference.quiet_hours_start is None or preference.quiet_hours_end is None:
+        return False
+    start, end = preference.quiet_hours_start, preference.quiet_hours_end
+    current = timezone.localtime(now).time()
+    if start <= end:
+        return start <= current < end
+    # Overnight, e.g. 22:00-06:00.
+    return current >= start or current < end
+
+
+def window(preference):
+    minutes = NOTIFICATION_DIGEST_WINDOW
+    if preference is not None and preference.digest_window is not None:
+        minutes = preference.digest_window
+    return timedelta(minutes=minutes)
+
+
+def due_groups(now=None):
+    """``(user_id, kind)`` pairs ready to be delivered now."""
+    now = now or timezone.now()
+    groups = list(
+        PendingNotice.objects.filter(digest__isnull=True).order_by()
+        .values("user_id", "kind").annotate(oldest=Min("created_at"))
+    )
+    prefs = preferences({group["user_id"] for group in groups})
+    return [
+        (group["user_id"], group["kind"])
+        for group in groups
+        if group["oldest"] <= now - window(prefs.get(group["user_id"]))
+        and not in_quiet_hours(prefs.get(group["user_id"]), now)
+    ]
+
+
+def _render(kind, items):
+    if len(items) == 1:
+        item = items[0]
+        return item.title or None, item.message, item.link
+    title = DIGEST_TITLES.get(kind, DIGEST_TITLES[NoticeKind.GENERAL]).format(count=len(items))
+    lines = [item.message for item in items[:DIGEST_PREVIEW]]
+    if len(items) > DIGEST_PREVIEW:
+        lines.append(f"... and {len(items) - DIGEST_PREVIEW} more")
+    return title, "\n".join(lines), None
+
+
+@transaction.atomic
+def deliver(groups):
+    """Turn the pending notices of ``groups`` into notifications. Returns how many."""
+    if not groups:
+        return 0
+    wanted = set(groups)
+    items = defaultdict(list)
+    pending = (
+        PendingNotice.objects.filter(digest__isnull=True, user_id__in={user_id for user_id, _ in groups})
+        .select_for_update().order_by("created_at", "id")
+    )
+    for item in pending:
+        if (item.user_id, item.kind) in wanted:
+            items[(item.user_id, item.kind)].append(item)
+    if not items:
+        return 0
+
+    keys = list(items)
+    notifications = []
+    for user_id, kind in keys:
+        title, message, link = _render(kind, items[(user_id, kind)])
+        notifications.append(Notification(
+            user_id=user_id, kind=kind, title=title, message=message, link=link,
+            item_count=len(items[(user_id, kind)]),
+        ))
+    Notification.objects.bulk_create(notifications)
+    for key, notification in zip(keys, notifications):
+        PendingNotice.objects.filter(id__in=[item.id for item in items[key]]).update(digest=notification)
+    add_unread(Counter(user_id for user_id, _ in keys))
+
+    prefs = preferences({user_id for user_id, _ in keys})
+    emails = dict(
+        get_user_model().objects.filter(id__in={user_id for user_id, _ in keys})
+        .exclude(email="").values_list("id", "email")
+    )
+    messages, dedupe_keys = [], []
+    for notification in notifications:
+        preference = prefs.get(notification.user_id)
+        if notification.user_id in emails and (preference is None or preference.email_enabled):
+            subject = notification.title or "New Notification"
+            messages.append((subject, notification.message, [emails[notification.user_id]]))
+            dedupe_keys.append(f"notification:{notification.pk}")
+    enqueue_many(messages, dedupe_keys=dedupe_keys)
+    return len(notifications)
+
+
+def flush(now=None, batch_size=500):
+    """Deliver every due group, ``batch_size`` groups per transaction."""
+    groups = due_groups(now)
+    delivered = 0
+    for start in range(0, len(groups), batch_size):
+        delivered += deliver(groups[start:start + batch_size])
+    return delivered
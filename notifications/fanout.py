@@ -0,0 +1,150 @@
+# notifications/fanout.py
+"""
+Send one notice to many users.
+
+``fanout(audience, title, message)`` renders a personalised ``Notification``
+per user and inserts them with ``bulk_create`` in chunks. Optional channels
+(``"email"``, ``"sms"``) queue the copies in their outbox, also in bulk,
+honouring the user's ``NotificationPreference`` (SMS is opt-in). A broadcast
+to 20k customers is a few dozen statements on Postgres (a few hundred on
+SQLite, which caps the rows per INSERT), not 20k round trips.
+
+An audience is any queryset of users; ``by_role``, ``superadmins`` and
+``shop_riders`` build the common ones. ``title`` and ``message`` are
+``str.format`` templates, filled in with the user's ``username``,
+``first_name``, ``last_name`` and ``email``, plus any extra ``context``; a
+user field wins over a context key of the same name. Unknown names are left
+as written. Templates are checked before the first user is notified, so a
+stray brace fails the whole broadcast up front, not halfway through.
+"""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .inbox import add_unread
+from .models import Notification, NotificationPreference, SmsPriority
+from .outbox import enqueue_many
+from .sms import enqueue_many as enqueue_sms, phone_numbers
+
+USER_FIELDS = ("id", "username", "first_name", "last_name", "email")
+
+
+def by_role(role):
+    return get_user_model().objects.filter(role=role, is_active=True)
+
+
+def superadmins():
+    return get_user_model().objects.filter(is_superuser=True, is_active=True)
+
+
+def shop_riders(shop):
+    """Riders who have carried parcels for ``shop``."""
+    return get_user_model().objects.filter(
+        is_active=True, riderprofile__job__parcel__origin_shop=shop,
+    ).distinct()
+
+
+# Stand-in user for checking templates before a broadcast starts.
+SAMPLE_USER = {"id": 0, "username": "", "first_name": "", "last_name": "", "email": ""}
+
+
+class InvalidTemplate(ValueError):
+    pass
+
+
+class _Fields(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+def render(template, user, context):
+    fields = _Fields(context)
+    fields.update(user)
+    return template.format_map(fields)
+
+
+def check_template(template, context):
+    """Raise ``InvalidTemplate`` if ``template`` cannot be rendered for a user."""
+    try:
+        render(template, SAMPLE_USER, context)
+    except (AttributeError, IndexError, KeyError, TypeError, ValueError) as e:
+        raise InvalidTemplate(f"Cannot use {template!r} as a notice: {e}") from e
+
+
+def _email(rows, dedupe):
+    opted_out = set(
+        NotificationPreference.objects.filter(user_id__in=[row["id"] for row in rows], email_enabled=False)
+        .values_list("user_id", flat=True)
+    )
+    rows = [row for row in rows if row["id"] not in opted_out]
+    messages = [(row["title"] or "New Notification", row["message"], [row["email"]]) for row in rows if row["email"]]
+    keys = [f"{dedupe}:{row['id']}" for row in rows if row["email"]] if dedupe else None
+    enqueue_many(messages, dedupe_keys=keys)
+
+
+def _sms(rows, dedupe):
+    # Broadcast SMS is opt-in: only users who turned it on get a text.
+    opted_in = NotificationPreference.objects.filter(
+        user_id__in=[row["id"] for row in rows], sms_enabled=True,
+    ).values_list("user_id", flat=True)
+    phones = phone_numbers(opted_in)
+    rows = [row for row in rows if row["id"] in phones]
+    messages = [(phones[row["id"]], row["message"]) for row in rows]
+    keys = [f"{dedupe}:sms:{row['id']}" for row in rows] if dedupe else None
+    enqueue_sms(messages, priority=SmsPriority.BULK, dedupe_keys=keys)
+
+
+CHANNELS = {
+    "email": _email,
+    "sms": _sms,
+}
+
+
+def fanout(audience, title, message, link=None, channels=(), context=None, dedupe=None, chunk_size=1000):
+    """
+    Notify every user in ``audience``. Returns the number of users notified.
+    Raises ``InvalidTemplate`` before sending anything if ``title`` or
+    ``message`` is not a usable template.
+
+    ``dedupe`` (e.g. ``"notice:2025-10-maintenance"``) keys the channel copies
+    per user, so re-running an interrupted broadcast does not send twice.
+    """
+    unknown = set(channels) - set(CHANNELS)
+    if unknown:
+        raise ValueError(f"Unknown notification channel(s): {', '.join(sorted(unknown))}")
+    context = context or {}
+    for template in (title, message):
+        if template:
+            check_template(template, context)
+
+    total = 0
+    chunk = []
+    users = audience.order_by().values(*USER_FIELDS).iterator(chunk_size=chunk_size)
+    for user in users:
+        chunk.append(user)
+        if len(chunk) >= chunk_size:
+            total += _send_chunk(chunk, title, message, link, channels, context, dedupe)
+            chunk = []
+    if chunk:
+        total += _send_chunk(chunk, title, message, link, channels, context, dedupe)
+    return total
+
+
+def _send_chunk(users, title, message, link, channels, context, dedupe):
+    rows = [
+        {
+            "id": user["id"],
+            "email": user["email"],
+            "title": render(title, user, context) if title else None,
+            "message": render(message, user, context),
+        }
+        for user in users
+    ]
+    with transaction.atomic():
+        Notification.objects.bulk_create([
+            Notification(user_id=row["id"], title=row["title"], message=row["message"], link=link)
+            for row in rows
+        ], batch_size=len(rows))
+        add_unread({row["id"]: 1 for row in rows})
+        for channel in channels:
+            CHANNELS[channel](rows, dedupe)
+    return len(rows)
@@ -0,0 +1,129 @@
+# notifications/inbox.py
+"""
+Notification inbox: keyset pages, unread counters, mark-as-read.
+
+Pages are keyed on ``(created_at, id)`` rather than OFFSET, so page 500 costs
+the same as page 1 and rows arriving meanwhile do not shift the page. Both
+orderings are served by the composite indexes on ``Notification``.
+
+``NotificationCounter.unread`` is adjusted with ``F()`` updates wherever
+notifications are created or read, so the badge is one primary-key read.
+``Notification.save()`` counts single rows, including a ``read`` flag
+flipped on a loaded instance (the admin's checkbox); bulk writers call
+``add_unread``/``subtract_unread`` themselves. Deleting an unread
+notification uncounts it (a ``post_delete`` receiver in
+``notifications.models``). ``manage.py rebuild_notification_counters`` recounts from
+scratch if they ever drift.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.db import transaction
+from django.db.models import Count, F, Prefetch, Q, Value
+from django.db.models.functions import Greatest
+
+from .models import Notification, NotificationCounter, PendingNotice
+
+PAGE_SIZE = 20
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def add_unread(counts):
+    """Add ``{user_id: n}`` to the unread counters, creating missing ones."""
+    counts = {user_id: n for user_id, n in counts.items() if user_id and n}
+    if not counts:
+        return
+    existing = set(NotificationCounter.objects.filter(user_id__in=counts).values_list("user_id", flat=True))
+    missing = [user_id for user_id in counts if user_id not in existing]
+    if missing:
+        # Zero rows first, then the same UPDATE as everyone else: a counter
+        # created concurrently by another request cannot lose increments.
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in missing], ignore_conflicts=True,
+        )
+
+    by_amount = defaultdict(list)
+    for user_id, n in counts.items():
+        by_amount[n].append(user_id)
+    for n, user_ids in by_amount.items():
+        NotificationCounter.objects.filter(user_id__in=user_ids).update(unread=F("unread") + n)
+
+
+def subtract_unread(user, n):
+    """Take ``n`` off ``user``'s (a user or id) unread counter, never below zero."""
+    if n:
+        NotificationCounter.objects.filter(user=user).update(unread=Greatest(F("unread") - n, Value(0)))
+
+
+def unread_count(user):
+    """The badge number: a single primary-key read."""
+    return (
+        NotificationCounter.objects.filter(user=user).values_list("unread", flat=True).first() or 0
+    )
+
+
+def encode_cursor(notification):
+    # Whole microseconds, so the cursor round-trips to the exact created_at.
+    return f"{(notification.created_at - EPOCH) // MICROSECOND}_{notification.pk}"
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = cursor.split("_", 1)
+        return EPOCH + int(micros) * MICROSECOND, int(pk)
+    except (AttributeError, ValueError, OverflowError):
+        return None
+
+
+def page(user, before=None, unread_only=False, size=PAGE_SIZE):
+    """
+    One inbox page, newest first, starting after cursor ``before``.
+    Returns ``(notifications, next_cursor)``; ``next_cursor`` is None on the
+    last page.
+    """
+    notifications = Notification.objects.filter(user=user)
+    if unread_only:
+        notifications = notifications.filter(read=False)
+    position = decode_cursor(before) if before else None
+    if position:
+        created_at, pk = position
+        notifications = notifications.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+    # Digest items for the expanded view, in one extra query per page.
+    notifications = notifications.prefetch_related(
+        Prefetch("items", queryset=PendingNotice.objects.order_by("created_at", "id"))
+    )
+    rows = list(notifications.order_by("-created_at", "-pk")[:size + 1])
+    next_cursor = encode_cursor(rows[size - 1]) if len(rows) > size else None
+    return rows[:size], next_cursor
+
+
+def mark_read(user, ids):
+    """Mark ``ids`` (of ``user``) read. Returns how many were unread."""
+    with transaction.atomic():
+        changed = Notification.objects.filter(user=user, pk__in=ids, read=False).update(read=True)
+        subtract_unread(user, changed)
+    return changed
+
+
+def mark_all_read(user):
+    """Mark every notification of ``user`` read in one UPDATE."""
+    with transaction.atomic():
+        changed = Notification.objects.filter(user=user, read=False).update(read=True)
+        subtract_unread(user, changed)
+    return changed
+
+
+def rebuild_counters():
+    """Recount every user's unread notifications. Returns counters written."""
+    counts = dict(
+        Notification.objects.filter(read=False).order_by().values("user_id")
+        .annotate(n=Count("id")).values_list("user_id", "n")
+    )
+    NotificationCounter.objects.exclude(user_id__in=list(counts)).update(unread=0)
+    NotificationCounter.objects.bulk_create(
+        [NotificationCounter(user_id=user_id, unread=n) for user_id, n in counts.items()],
+        update_conflicts=True, unique_fields=["user"], update_fields=["unread"],
+    )
+    return len(counts)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.fanout import CHANNELS, InvalidTemplate, by_role, fanout
+from users.models import Roles
+
+
+class Command(BaseCommand):
+    help = "Send a notice to every active user with a role, e.g. a service notice to all customers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--role", required=True, choices=Roles.values)
+        parser.add_argument("--title", required=True, help="May use {username}, {first_name}, ...")
+        parser.add_argument("--message", required=True, help="May use {username}, {first_name}, ...")
+        parser.add_argument("--link", default=None)
+        parser.add_argument("--channel", action="append", default=[], choices=sorted(CHANNELS),
+                            help="Also queue a copy on this channel (repeatable).")
+        parser.add_argument("--dedupe", default=None,
+                            help="Key for this broadcast, so a re-run does not send channel copies twice.")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["channel"] and not options["dedupe"]:
+            raise CommandError("--channel needs --dedupe so an interrupted broadcast can be re-run safely.")
+        try:
+            count = fanout(
+                by_role(options["role"]),
+                options["title"],
+                options["message"],
+                link=options["link"],
+                channels=options["channel"],
+                dedupe=options["dedupe"],
+                chunk_size=options["chunk_size"],
+            )
+        except InvalidTemplate as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Notified {count} user(s)."))
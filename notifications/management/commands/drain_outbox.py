@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.outbox import drain, requeue_dead
+
+
+class Command(BaseCommand):
+    help = "Send queued e-mails from the outbox in batches over one connection per batch."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--retry-dead", action="store_true", help="Give DEAD e-mails a fresh set of attempts first.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new e-mails.")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds to wait when nothing is due.")
+
+    def handle(self, *args, **options):
+        if options["retry_dead"]:
+            self.stdout.write(f"Requeued {requeue_dead()} dead e-mail(s)")
+
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = drain(batch_size=options["batch_size"])
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                self.stdout.write(f"Batch done: {sent} sent, {failed} failed")
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {total_sent} e-mail(s), {total_failed} failed."))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.sms import drain, get_gateway, requeue_dead
+
+
+class Command(BaseCommand):
+    help = "Send queued SMS through the configured gateway, one provider call per batch, within the rate limit."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Messages per gateway call (default: the gateway's maximum).")
+        parser.add_argument("--retry-dead", action="store_true", help="Give DEAD messages a fresh set of attempts first.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new messages.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Seconds to wait when nothing is due.")
+
+    def handle(self, *args, **options):
+        if options["retry_dead"]:
+            self.stdout.write(f"Requeued {requeue_dead()} dead message(s)")
+
+        try:
+            gateway = get_gateway()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+        total_sent = total_failed = 0
+        try:
+            while True:
+                sent, failed = drain(batch_size=options["batch_size"], gateway=gateway)
+                total_sent += sent
+                total_failed += failed
+                if sent or failed:
+                    self.stdout.write(f"Batch done: {sent} sent, {failed} failed")
+                    continue
+                if not options["loop"]:
+                    break
+                time.sleep(options["sleep"])
+        finally:
+            gateway.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {total_sent} SMS, {total_failed} failed."))
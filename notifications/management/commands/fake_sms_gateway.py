@@ -0,0 +1,135 @@
+"""
+A local stand-in for the SMS provider, speaking the notifications.sms.HttpGateway
+protocol, so the whole SMS path can be exercised offline:
+
+    python manage.py fake_sms_gateway --port 8025 \
+        --receipts-url http://127.0.0.1:8000/notifications/sms/receipts/
+
+Accepted messages are printed and, after --receipt-delay seconds, confirmed
+with batched delivery receipts. --reject-rate, --undelivered-rate and
+--rate-limit simulate the failures the sender has to survive.
+"""
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from notifications.sms import normalize_phone
+
+
+class Command(BaseCommand):
+    help = "Run a fake SMS gateway (with delivery receipts) for local testing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8025)
+        parser.add_argument("--receipts-url", default="", help="Where to POST delivery receipts; none if empty.")
+        parser.add_argument("--token", default=getattr(settings, "SMS_WEBHOOK_TOKEN", ""), help="X-Gateway-Token sent with receipts.")
+        parser.add_argument("--receipt-delay", type=float, default=2.0, help="Seconds before receipts are sent.")
+        parser.add_argument("--reject-rate", type=float, default=0.0, help="Share of messages rejected (retryable).")
+        parser.add_argument("--undelivered-rate", type=float, default=0.0, help="Share of accepted messages reported undelivered.")
+        parser.add_argument("--rate-limit", type=int, default=0, help="Messages per second before answering 429; 0 = unlimited.")
+        parser.add_argument("--quiet", action="store_true", help="Do not print each message.")
+
+    def handle(self, *args, **options):
+        receipts = queue.Queue()
+        command = self
+        window = {"second": 0, "count": 0}
+        window_lock = threading.Lock()
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def reply(self, status, payload, headers=None):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                try:
+                    payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                    messages = payload["messages"]
+                except (ValueError, KeyError, TypeError):
+                    return self.reply(400, {"error": "Expected {\"messages\": [...]}"})
+
+                if options["rate_limit"]:
+                    with window_lock:
+                        second = int(time.time())
+                        if window["second"] != second:
+                            window.update(second=second, count=0)
+                        window["count"] += len(messages)
+                        over = window["count"] > options["rate_limit"]
+                    if over:
+                        return self.reply(429, {"error": "Rate limit exceeded"}, {"Retry-After": "1"})
+
+                results = []
+                for message in messages:
+                    if not normalize_phone(message.get("to")):
+                        results.append({"id": message.get("id"), "status": "rejected", "error": "Invalid number", "permanent": True})
+                    elif random.random() < options["reject_rate"]:
+                        results.append({"id": message.get("id"), "status": "rejected", "error": "Temporarily unavailable"})
+                    else:
+                        provider_id = uuid.uuid4().hex
+                        results.append({"id": message.get("id"), "status": "accepted", "provider_id": provider_id})
+                        receipts.put((time.monotonic() + options["receipt_delay"], provider_id))
+                        if not options["quiet"]:
+                            command.stdout.write(f"[{message.get('to')}] {message.get('body')}")
+                self.reply(200, {"results": results})
+
+        def send_receipts():
+            session = requests.Session()
+            pending = None
+            while True:
+                due_at, provider_id = pending or receipts.get()
+                pending = None
+                time.sleep(max(due_at - time.monotonic(), 0))
+                # Batch whatever else is due by now; the queue is in due order.
+                batch = [provider_id]
+                while len(batch) < 500:
+                    try:
+                        pending = receipts.get_nowait()
+                    except queue.Empty:
+                        break
+                    if pending[0] > time.monotonic():
+                        break
+                    batch.append(pending[1])
+                    pending = None
+                if not options["receipts_url"]:
+                    continue
+                payload = {"receipts": [
+                    {"provider_id": pid, "status": "failed", "error": "Handset unreachable"}
+                    if random.random() < options["undelivered_rate"] else {"provider_id": pid, "status": "delivered"}
+                    for pid in batch
+                ]}
+                try:
+                    session.post(options["receipts_url"], json=payload, timeout=10,
+                                 headers={"X-Gateway-Token": options["token"]})
+                except requests.RequestException as exc:
+                    command.stderr.write(f"Could not deliver {len(batch)} receipt(s): {exc}")
+
+        threading.Thread(target=send_receipts, daemon=True).start()
+        server = ThreadingHTTPServer((options["host"], options["port"]), Handler)
+        self.stdout.write(self.style.SUCCESS(
+            f"Fake SMS gateway on http://{options['host']}:{options['port']}/ (Ctrl+C to stop)"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from notifications.inbox import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recount every user's unread notifications from the Notification table."
+
+    def handle(self, *args, **options):
+        count = rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt unread counters; {count} user(s) have unread notifications."))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from notifications.digest import flush
+
+
+class Command(BaseCommand):
+    help = "Deliver queued notices whose digest window has passed, one notification per user and kind."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="User/kind groups per transaction.")
+        parser.add_argument("--loop", action="store_true", help="Keep delivering as windows close.")
+        parser.add_argument("--sleep", type=float, default=30.0, help="Seconds between passes.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            delivered = flush(batch_size=options["batch_size"])
+            total += delivered
+            if delivered:
+                self.stdout.write(f"Delivered {delivered} notification(s)")
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Delivered {total} notification(s)."))
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_inbox_indexes_counter'),
+        ('users', '0002_alter_user_role'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationPreference',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='notification_preference', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('email_enabled', models.BooleanField(default=True)),
+                ('sms_enabled', models.BooleanField(default=False)),
+                ('digest_window', models.PositiveIntegerField(blank=True, null=True)),
+                ('quiet_hours_start', models.TimeField(blank=True, null=True)),
+                ('quiet_hours_end', models.TimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='item_count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='kind',
+            field=models.CharField(choices=[('general', 'General'), ('parcel_assigned', 'Parcel assigned'), ('parcel_registered', 'Parcel registered')], default='general', max_length=30),
+        ),
+        migrations.CreateModel(
+            name='PendingNotice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('general', 'General'), ('parcel_assigned', 'Parcel assigned'), ('parcel_registered', 'Parcel registered')], default='general', max_length=30)),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('message', models.TextField()),
+                ('link', models.URLField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('digest', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='items', to='notifications.notification')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['digest', 'user', 'kind', 'created_at'], name='pendingnotice_queue')],
+            },
+        ),
+    ]
@@ -1,6 +1,14 @@
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.conf import settings
-from django.core.mail import send_mail
+from django.utils import timezone
+
+
+class NoticeKind(models.TextChoices):
+    GENERAL = "general", "General"
+    PARCEL_ASSIGNED = "parcel_assigned", "Parcel assigned"
+    PARCEL_REGISTERED = "parcel_registered", "Parcel registered"
 
 
 class Notification(models.Model):
@@ -14,10 +22,65 @@ class Notification(models.Model):
     link = models.URLField(blank=True, null=True)  # optional deep link
     created_at = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
+    kind = models.CharField(max_length=30, choices=NoticeKind.choices, default=NoticeKind.GENERAL)
+    item_count = models.PositiveIntegerField(default=1)  # > 1 for digests; see .items
+
+    class Meta:
+        indexes = [
+            # Inbox pages (newest first) and unread-only views, see notifications.inbox.
+            models.Index(fields=["user", "read", "-created_at"], name="notification_user_read_time"),
+            models.Index(fields=["user", "-created_at"], name="notification_user_time"),
+        ]
 
     def __str__(self):
         return f"Notification for {self.user} - {self.message[:20]}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the unread counter already reflects, for save().
+        instance._counted_read = instance.__dict__.get("read")
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .inbox import add_unread, subtract_unread
+
+        created = self._state.adding
+        was_read = True if created else getattr(self, "_counted_read", None)
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if was_read is None or (update_fields is not None and "read" not in update_fields):
+            return
+        if was_read and not self.read:
+            add_unread({self.user_id: 1})
+        elif self.read and not was_read:
+            subtract_unread(self.user_id, 1)
+        self._counted_read = self.read
+
+
+@receiver(post_delete, sender=Notification)
+def uncount_deleted_notification(sender, instance, **kwargs):
+    # Deleting an unread notification (admin, queryset.delete(), user
+    # cascade) takes it off the badge too.
+    if not instance.read:
+        from .inbox import subtract_unread
+
+        subtract_unread(instance.user_id, 1)
+
+
+class NotificationCounter(models.Model):
+    """Unread notifications per user, kept in step by notifications.inbox."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="notification_counter",
+    )
+    unread = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user}: {self.unread} unread"
+
 
 # --- Helper Function ---
 def create_notification(user, title, message, link=None, email=True, sms=False):
@@ -28,18 +91,144 @@ def create_notification(user, title, message, link=None, email=True, sms=False):
         link=link
     )
 
-    # send email
+    # queue email; it is sent by the outbox drainer once this transaction commits
     if email and user.email:
-        send_mail(
-            subject=title or "New Notification",
-            message=message,
-            from_email="noreply@dropagent.com",
-            recipient_list=[user.email],
-            fail_silently=True,
-        )
-
-    # send SMS (stub - replace with Twilio/Africa’s Talking later)
+        from .outbox import enqueue
+
+        enqueue(title or "New Notification", message, [user.email])
+
+    # queue SMS; it is sent in batches by `manage.py drain_sms`
     if sms:
-        print(f"[SMS to {user.username}] {message}")
+        from .sms import enqueue as enqueue_sms, phone_numbers
+
+        phone = phone_numbers([user.pk]).get(user.pk)
+        if phone:
+            enqueue_sms(phone, message)
 
     return notif
+
+
+class OutboxStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    SENDING = "sending", "Sending"
+    SENT = "sent", "Sent"
+    DEAD = "dead", "Dead"
+
+
+class OutboxEmail(models.Model):
+    """
+    An e-mail waiting to be sent. Rows are written in the same transaction as
+    the change they announce and sent later by ``manage.py drain_outbox``.
+    """
+    dedupe_key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+
+    status = models.CharField(max_length=20, choices=OutboxStatus.choices, default=OutboxStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"], name="outbox_due"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+class SmsStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    SENDING = "sending", "Sending"
+    SENT = "sent", "Accepted by gateway"
+    DELIVERED = "delivered", "Delivered"
+    UNDELIVERED = "undelivered", "Undelivered"
+    DEAD = "dead", "Dead"
+
+
+class SmsPriority(models.IntegerChoices):
+    URGENT = 0, "Urgent"  # e.g. pickup-ready alerts
+    NORMAL = 5, "Normal"
+    BULK = 9, "Bulk"
+
+
+class SmsMessage(models.Model):
+    """
+    A text message waiting for (or back from) the SMS gateway. Queued like
+    OutboxEmail and sent in batches by ``manage.py drain_sms``; the gateway's
+    delivery receipts move it from SENT to DELIVERED / UNDELIVERED.
+    """
+    dedupe_key = models.CharField(max_length=255, unique=True, blank=True, null=True)
+    to = models.CharField(max_length=20)
+    body = models.TextField()
+    priority = models.PositiveSmallIntegerField(choices=SmsPriority.choices, default=SmsPriority.NORMAL)
+
+    status = models.CharField(max_length=20, choices=SmsStatus.choices, default=SmsStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    provider_id = models.CharField(max_length=100, blank=True, null=True, unique=True)
+
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    delivered_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "priority", "next_attempt_at"], name="sms_due"),
+        ]
+
+    def __str__(self):
+        return f"SMS to {self.to} ({self.status})"
+
+
+class NotificationPreference(models.Model):
+    """How and when a user wants to hear from us; missing row = defaults."""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="notification_preference",
+    )
+    email_enabled = models.BooleanField(default=True)
+    sms_enabled = models.BooleanField(default=False)
+    # Minutes notices of one kind are collected before one digest goes out; 0 = at once.
+    digest_window = models.PositiveIntegerField(blank=True, null=True)
+    quiet_hours_start = models.TimeField(blank=True, null=True)
+    quiet_hours_end = models.TimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Notification preferences for {self.user}"
+
+
+class PendingNotice(models.Model):
+    """
+    One notice waiting to be coalesced by notifications.digest. Once delivered
+    it points at the Notification (single or digest) that carried it, which
+    keeps the per-item detail of a digest.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    kind = models.CharField(max_length=30, choices=NoticeKind.choices, default=NoticeKind.GENERAL)
+    title = models.CharField(max_length=255, blank=True)
+    message = models.TextField()
+    link = models.URLField(blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    digest = models.ForeignKey(
+        Notification, on_delete=models.CASCADE, blank=True, null=True, related_name="items",
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["digest", "user", "kind", "created_at"], name="pendingnotice_queue"),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.user_id}: {self.message[:20]}"
@@ -0,0 +1,150 @@
+# notifications/outbox.py
+"""
+Transactional e-mail outbox.
+
+``enqueue()`` only inserts ``OutboxEmail`` rows, inside whatever transaction
+the caller is in: if the business change rolls back, so do its e-mails, and
+an SMTP outage can no longer fail a parcel save. ``drain()`` (run by
+``manage.py drain_outbox``) claims due rows in batches and sends each batch
+over one reused connection. Failures are retried with exponential backoff
+and end up DEAD after ``OUTBOX_MAX_ATTEMPTS``; a ``dedupe_key`` makes
+enqueueing the same notice twice a no-op.
+"""
+import logging
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import OutboxEmail, OutboxStatus
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_MAX_ATTEMPTS = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+OUTBOX_BACKOFF_BASE = getattr(settings, "OUTBOX_BACKOFF_BASE", 30)  # seconds
+OUTBOX_BACKOFF_MAX = getattr(settings, "OUTBOX_BACKOFF_MAX", 6 * 60 * 60)
+
+# A SENDING claim older than this belongs to a dead drainer and is re-claimed.
+STALE_CLAIM_AFTER = timedelta(minutes=10)
+
+
+def _email(subject, body, to, from_email=None, dedupe_key=None):
+    if isinstance(to, str):
+        to = [to]
+    return OutboxEmail(
+        subject=subject[:255],
+        body=body,
+        to=list(to),
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        dedupe_key=dedupe_key,
+    )
+
+
+def enqueue(subject, body, to, from_email=None, dedupe_key=None):
+    """Queue one e-mail. With ``dedupe_key``, a second enqueue is ignored."""
+    return enqueue_many([(subject, body, to)], from_email=from_email, dedupe_keys=[dedupe_key])
+
+
+def enqueue_many(messages, from_email=None, dedupe_keys=None, batch_size=500):
+    """
+    Queue many ``(subject, body, to)`` e-mails with one INSERT per batch.
+    Returns the number of rows handed to the database (duplicates included).
+    """
+    dedupe_keys = dedupe_keys or [None] * len(messages)
+    rows = [
+        _email(subject, body, to, from_email, key)
+        for (subject, body, to), key in zip(messages, dedupe_keys)
+        if to
+    ]
+    OutboxEmail.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+    return len(rows)
+
+
+def backoff(attempts):
+    """Seconds to wait before attempt ``attempts + 1``: exponential, with jitter."""
+    delay = min(OUTBOX_BACKOFF_BASE * 2 ** max(attempts - 1, 0), OUTBOX_BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_batch(batch_size=100):
+    """Mark up to ``batch_size`` due e-mails as SENDING and return them."""
+    now = timezone.now()
+    claimable = Q(status=OutboxStatus.PENDING, next_attempt_at__lte=now) | Q(
+        status=OutboxStatus.SENDING, claimed_at__lt=now - STALE_CLAIM_AFTER,
+    )
+    candidate_ids = list(
+        OutboxEmail.objects.filter(claimable).order_by("next_attempt_at", "id")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not candidate_ids:
+        return []
+    OutboxEmail.objects.filter(claimable, id__in=candidate_ids).update(status=OutboxStatus.SENDING, claimed_at=now)
+    return list(OutboxEmail.objects.filter(id__in=candidate_ids, status=OutboxStatus.SENDING, claimed_at=now))
+
+
+def _failed(email, error):
+    attempts = email.attempts + 1
+    if attempts >= OUTBOX_MAX_ATTEMPTS:
+        logger.error("Outbox e-mail %s is dead after %d attempts: %s", email.pk, attempts, error)
+        update = {"status": OutboxStatus.DEAD}
+    else:
+        update = {
+            "status": OutboxStatus.PENDING,
+            "next_attempt_at": timezone.now() + timedelta(seconds=backoff(attempts)),
+        }
+    OutboxEmail.objects.filter(pk=email.pk).update(
+        attempts=F("attempts") + 1, claimed_at=None, last_error=str(error)[:1000], **update
+    )
+
+
+def send_batch(emails, connection=None):
+    """
+    Send claimed ``emails`` over one connection. Returns ``(sent, failed)``.
+    """
+    if not emails:
+        return 0, 0
+    connection = connection or get_connection(fail_silently=False)
+    sent_ids, failed = [], 0
+    try:
+        connection.open()
+    except Exception as exc:
+        # Nothing can go out this round; every row waits for its next attempt.
+        logger.warning("Could not open mail connection: %s", exc)
+        for email in emails:
+            _failed(email, exc)
+        return 0, len(emails)
+
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email or None, email.to)
+            try:
+                connection.send_messages([message])
+            except Exception as exc:
+                _failed(email, exc)
+                failed += 1
+            else:
+                sent_ids.append(email.pk)
+    finally:
+        connection.close()
+        if sent_ids:
+            OutboxEmail.objects.filter(id__in=sent_ids).update(
+                status=OutboxStatus.SENT, sent_at=timezone.now(), claimed_at=None,
+                attempts=F("attempts") + 1, last_error="",
+            )
+    return len(sent_ids), failed
+
+
+def drain(batch_size=100, connection=None):
+    """Claim and send one batch. Returns ``(sent, failed)`` counts."""
+    return send_batch(claim_batch(batch_size), connection=connection)
+
+
+def requeue_dead(ids=None):
+    """Give DEAD e-mails (all, or ``ids``) a fresh set of attempts."""
+    dead = OutboxEmail.objects.filter(status=OutboxStatus.DEAD)
+    if ids is not None:
+        dead = dead.filter(id__in=ids)
+    return dead.update(status=OutboxStatus.PENDING, attempts=0, next_attempt_at=timezone.now(), claimed_at=None)
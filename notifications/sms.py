@@ -0,0 +1,394 @@
+# notifications/sms.py
+"""
+SMS channel.
+
+``enqueue()`` and ``enqueue_many()`` only insert ``SmsMessage`` rows, inside
+the caller's transaction, exactly like the e-mail outbox: a web request never
+waits on the gateway. ``drain()`` (run by ``manage.py drain_sms``) claims due
+messages, most urgent first, and hands each batch to the gateway in one
+provider call, pacing calls to ``SMS_RATE_LIMIT`` messages per second.
+Rejected messages are retried with backoff and end up DEAD after
+``SMS_MAX_ATTEMPTS``; a permanent rejection (a bad number) is DEAD at once.
+``record_receipts()`` applies the delivery receipts the gateway POSTs back to
+``notifications:sms_receipts``.
+
+The gateway is the class named by ``SMS_BACKEND``, like ``EMAIL_BACKEND``:
+``ConsoleGateway`` logs messages (the DEBUG default) and ``HttpGateway``
+posts JSON batches to ``SMS_GATEWAY_URL``. ``manage.py fake_sms_gateway``
+serves that API locally, receipts included, for offline testing.
+"""
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+
+import requests
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.module_loading import import_string
+
+from .models import SmsMessage, SmsPriority, SmsStatus
+from .outbox import backoff
+
+logger = logging.getLogger(__name__)
+
+SMS_BACKEND = getattr(settings, "SMS_BACKEND", "notifications.sms.ConsoleGateway")
+SMS_GATEWAY_URL = getattr(settings, "SMS_GATEWAY_URL", "http://127.0.0.1:8025/messages" if settings.DEBUG else "")
+SMS_GATEWAY_API_KEY = getattr(settings, "SMS_GATEWAY_API_KEY", "")
+SMS_SENDER_ID = getattr(settings, "SMS_SENDER_ID", "")
+SMS_GATEWAY_BATCH = getattr(settings, "SMS_GATEWAY_BATCH", 100)
+SMS_RATE_LIMIT = getattr(settings, "SMS_RATE_LIMIT", 10)  # messages per second
+SMS_MAX_ATTEMPTS = getattr(settings, "SMS_MAX_ATTEMPTS", 6)
+SMS_WEBHOOK_TOKEN = getattr(settings, "SMS_WEBHOOK_TOKEN", "")
+SMS_DEFAULT_COUNTRY_CODE = getattr(settings, "SMS_DEFAULT_COUNTRY_CODE", "254")
+
+# A SENDING claim older than this belongs to a dead drainer and is re-claimed.
+STALE_CLAIM_AFTER = timedelta(minutes=10)
+
+
+# -------------------------
+# Queueing
+# -------------------------
+def normalize_phone(number):
+    """``0712 345 678`` -> ``+254712345678``; None if it cannot be a phone number."""
+    digits = re.sub(r"[\s\-()]", "", number or "")
+    if digits.startswith("+"):
+        digits = digits[1:]
+    elif digits.startswith("0"):
+        digits = SMS_DEFAULT_COUNTRY_CODE + digits[1:]
+    if not digits.isdigit() or not 9 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+
+def enqueue(to, body, priority=SmsPriority.NORMAL, dedupe_key=None):
+    """Queue one SMS. With ``dedupe_key``, a second enqueue is ignored."""
+    return enqueue_many([(to, body)], priority=priority, dedupe_keys=[dedupe_key])
+
+
+def enqueue_many(messages, priority=SmsPriority.NORMAL, dedupe_keys=None, batch_size=500):
+    """
+    Queue many ``(to, body)`` messages with one INSERT per batch. Numbers that
+    do not normalize are skipped. Returns the number of rows handed to the
+    database (duplicates included).
+    """
+    dedupe_keys = dedupe_keys or [None] * len(messages)
+    rows = []
+    for (to, body), key in zip(messages, dedupe_keys):
+        to = normalize_phone(to)
+        if to:
+            rows.append(SmsMessage(to=to, body=body, priority=priority, dedupe_key=key))
+    SmsMessage.objects.bulk_create(rows, batch_size=batch_size, ignore_conflicts=True)
+    return len(rows)
+
+
+def phone_numbers(user_ids):
+    """``{user_id: phone}`` for users with a phone on their agent profile."""
+    from users.models import AgentProfile
+
+    return dict(
+        AgentProfile.objects.filter(user_id__in=list(user_ids)).exclude(phone__isnull=True)
+        .exclude(phone="").values_list("user_id", "phone")
+    )
+
+
+# -------------------------
+# Gateways
+# -------------------------
+class GatewayError(Exception):
+    """The whole call failed (network, 5xx, rate limited); every message is retried."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+@dataclass
+class SendResult:
+    ok: bool
+    provider_id: str = ""
+    error: str = ""
+    permanent: bool = False  # retrying cannot help, e.g. an invalid number
+
+
+class BaseGateway:
+    """Sends one batch per call; returns a ``SendResult`` per message, in order."""
+    max_batch = SMS_GATEWAY_BATCH
+
+    def send_messages(self, messages):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ConsoleGateway(BaseGateway):
+    def send_messages(self, messages):
+        results = []
+        for message in messages:
+            logger.info("[SMS to %s] %s", message.to, message.body)
+            results.append(SendResult(ok=True, provider_id=f"console-{uuid.uuid4().hex}"))
+        return results
+
+
+class HttpGateway(BaseGateway):
+    """
+    JSON over HTTP: ``POST {"sender", "messages": [{"id", "to", "body"}]}``,
+    answered with ``{"results": [{"id", "status": "accepted" | "rejected",
+    "provider_id", "error", "permanent"}]}``. One keep-alive session per
+    process.
+    """
+
+    def __init__(self, url=None, api_key=None, sender=None, timeout=15):
+        self.url = url or SMS_GATEWAY_URL
+        if not self.url:
+            raise ImproperlyConfigured("HttpGateway needs SMS_GATEWAY_URL (or set SMS_BACKEND).")
+        self.sender = sender or SMS_SENDER_ID
+        self.timeout = timeout
+        self.session = requests.Session()
+        if api_key or SMS_GATEWAY_API_KEY:
+            self.session.headers["Authorization"] = f"Bearer {api_key or SMS_GATEWAY_API_KEY}"
+
+    def send_messages(self, messages):
+        payload = {
+            "sender": self.sender,
+            "messages": [{"id": str(message.pk), "to": message.to, "body": message.body} for message in messages],
+        }
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        except requests.RequestException as exc:
+            raise GatewayError(f"SMS gateway unreachable: {exc}") from exc
+        if response.status_code == 429:
+            raise GatewayError("SMS gateway rate limit hit", retry_after=_seconds(response.headers.get("Retry-After")))
+        if response.status_code >= 400:
+            raise GatewayError(f"SMS gateway answered {response.status_code}: {response.text[:200]}")
+        try:
+            by_id = {str(result["id"]): result for result in response.json()["results"]}
+        except (ValueError, KeyError, TypeError) as exc:
+            raise GatewayError(f"Unreadable SMS gateway response: {exc}") from exc
+
+        results = []
+        for message in messages:
+            result = by_id.get(str(message.pk))
+            if result is None:
+                results.append(SendResult(ok=False, error="Missing from gateway response"))
+            elif result.get("status") == "accepted":
+                results.append(SendResult(ok=True, provider_id=str(result.get("provider_id") or "")))
+            else:
+                results.append(SendResult(
+                    ok=False, error=result.get("error") or "Rejected", permanent=bool(result.get("permanent")),
+                ))
+        return results
+
+    def close(self):
+        self.session.close()
+
+
+def _seconds(value):
+    try:
+        return max(float(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+_gateway = None
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        _gateway = import_string(SMS_BACKEND)()
+    return _gateway
+
+
+class Throttle:
+    """
+    Token bucket: on average ``rate`` messages per second, with bursts of up
+    to ``burst``. ``wait(n)`` sleeps until ``n`` messages may go out.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def wait(self, n=1):
+        if self.rate <= 0:
+            return
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= n
+            # A batch bigger than the burst still goes out, after its share of time.
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        if delay:
+            self.sleep(delay)
+
+    def pause(self, seconds):
+        """Send nothing for ``seconds`` (the gateway asked us to back off)."""
+        with self.lock:
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+_throttle = None
+
+
+def get_throttle():
+    global _throttle
+    if _throttle is None:
+        _throttle = Throttle(SMS_RATE_LIMIT, burst=SMS_GATEWAY_BATCH)
+    return _throttle
+
+
+def _reset_after_fork():
+    global _gateway, _throttle
+    _gateway = _throttle = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# -------------------------
+# Sending
+# -------------------------
+def claim_batch(batch_size):
+    """Mark up to ``batch_size`` due messages as SENDING, urgent first, and return them."""
+    now = timezone.now()
+    claimable = Q(status=SmsStatus.PENDING, next_attempt_at__lte=now) | Q(
+        status=SmsStatus.SENDING, claimed_at__lt=now - STALE_CLAIM_AFTER,
+    )
+    candidate_ids = list(
+        SmsMessage.objects.filter(claimable).order_by("priority", "next_attempt_at", "id")
+        .values_list("id", flat=True)[:batch_size]
+    )
+    if not candidate_ids:
+        return []
+    SmsMessage.objects.filter(claimable, id__in=candidate_ids).update(status=SmsStatus.SENDING, claimed_at=now)
+    return list(
+        SmsMessage.objects.filter(id__in=candidate_ids, status=SmsStatus.SENDING, claimed_at=now)
+        .order_by("priority", "id")
+    )
+
+
+def _deferred(messages, error, delay):
+    SmsMessage.objects.filter(id__in=[message.pk for message in messages]).update(
+        status=SmsStatus.PENDING, claimed_at=None, last_error=str(error)[:1000],
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _failed(messages, error, permanent=False):
+    """Put ``messages`` back for another attempt, or mark them DEAD."""
+    error = str(error)[:1000]
+    last_try = {message.pk for message in messages if permanent or message.attempts + 1 >= SMS_MAX_ATTEMPTS}
+    if last_try:
+        logger.error("%d SMS message(s) are dead: %s", len(last_try), error)
+        SmsMessage.objects.filter(id__in=last_try).update(
+            status=SmsStatus.DEAD, attempts=F("attempts") + 1, claimed_at=None, last_error=error,
+        )
+    retry = [message.pk for message in messages if message.pk not in last_try]
+    if retry:
+        attempts = max(message.attempts for message in messages) + 1
+        SmsMessage.objects.filter(id__in=retry).update(
+            status=SmsStatus.PENDING, attempts=F("attempts") + 1, claimed_at=None, last_error=error,
+            next_attempt_at=timezone.now() + timedelta(seconds=backoff(attempts)),
+        )
+
+
+def send_batch(messages, gateway=None, throttle=None):
+    """Send claimed ``messages`` in one gateway call. Returns ``(sent, failed)``."""
+    if not messages:
+        return 0, 0
+    gateway = gateway or get_gateway()
+    throttle = throttle or get_throttle()
+    throttle.wait(len(messages))
+    try:
+        results = gateway.send_messages(messages)
+    except GatewayError as exc:
+        logger.warning("SMS batch of %d failed: %s", len(messages), exc)
+        if exc.retry_after is not None:
+            # Rate limited: nothing was wrong with the messages, so no attempt is spent.
+            throttle.pause(exc.retry_after)
+            _deferred(messages, exc, exc.retry_after)
+        else:
+            _failed(messages, exc)
+        return 0, len(messages)
+
+    now = timezone.now()
+    sent = []
+    for message, result in zip(messages, results):
+        if result.ok:
+            message.status, message.provider_id, message.sent_at = SmsStatus.SENT, result.provider_id or None, now
+            message.attempts += 1
+            message.claimed_at, message.last_error = None, ""
+            sent.append(message)
+        else:
+            _failed([message], result.error, permanent=result.permanent)
+    if sent:
+        SmsMessage.objects.bulk_update(
+            sent, ["status", "provider_id", "sent_at", "attempts", "claimed_at", "last_error"],
+        )
+    return len(sent), len(messages) - len(sent)
+
+
+def drain(batch_size=None, gateway=None, throttle=None):
+    """Claim and send one batch. Returns ``(sent, failed)`` counts."""
+    gateway = gateway or get_gateway()
+    return send_batch(claim_batch(batch_size or gateway.max_batch), gateway=gateway, throttle=throttle)
+
+
+def requeue_dead(ids=None):
+    """Give DEAD messages (all, or ``ids``) a fresh set of attempts."""
+    dead = SmsMessage.objects.filter(status=SmsStatus.DEAD)
+    if ids is not None:
+        dead = dead.filter(id__in=ids)
+    return dead.update(status=SmsStatus.PENDING, attempts=0, next_attempt_at=timezone.now(), claimed_at=None)
+
+
+# -------------------------
+# Delivery receipts
+# -------------------------
+def valid_webhook_token(token):
+    return bool(SMS_WEBHOOK_TOKEN) and constant_time_compare(token or "", SMS_WEBHOOK_TOKEN)
+
+
+def record_receipts(receipts):
+    """
+    Apply ``[{"provider_id", "status": "delivered" | "failed", "error"}]``.
+    One UPDATE per outcome; unknown ids are ignored. Returns rows updated.
+    """
+    delivered, undelivered = [], {}
+    for receipt in receipts:
+        provider_id = str(receipt.get("provider_id") or "")
+        if not provider_id:
+            continue
+        if receipt.get("status") == "delivered":
+            delivered.append(provider_id)
+        else:
+            undelivered[provider_id] = str(receipt.get("error") or receipt.get("status") or "Undelivered")[:1000]
+
+    now = timezone.now()
+    updated = 0
+    if delivered:
+        updated += SmsMessage.objects.filter(provider_id__in=delivered, status=SmsStatus.SENT).update(
+            status=SmsStatus.DELIVERED, delivered_at=now,
+        )
+    for error in set(undelivered.values()):
+        ids = [provider_id for provider_id, reason in undelivered.items() if reason == error]
+        updated += SmsMessage.objects.filter(provider_id__in=ids, status=SmsStatus.SENT).update(
+            status=SmsStatus.UNDELIVERED, last_error=error,
+        )
+    return updated
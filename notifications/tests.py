@@ -1,3 +1,281 @@
-from django.test import TestCase
+import os
+import subprocess
+import sys
+from datetime import time, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.backends.locmem import EmailBackend as LocmemBackend
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import digest, fanout, inbox, outbox, sms
+from .models import (
+    NoticeKind, Notification, NotificationPreference, OutboxEmail, OutboxStatus, SmsMessage, SmsPriority, SmsStatus,
+)
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError("SMTP is down")
+
+
+class CountingBackend(LocmemBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return super().open()
+
+
+class RecordingGateway(sms.BaseGateway):
+    """Accepts everything except numbers ending in 0; remembers each call."""
+    max_batch = 50
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def send_messages(self, messages):
+        self.calls.append([message.to for message in messages])
+        if self.error:
+            raise self.error
+        return [
+            sms.SendResult(ok=False, error="Invalid number", permanent=True) if message.to.endswith("0")
+            else sms.SendResult(ok=True, provider_id=f"p{message.pk}")
+            for message in messages
+        ]
+
+
+class NoWait:
+    def wait(self, n=1):
+        pass
+
+    def pause(self, seconds):
+        self.paused = seconds
+
+
+class OutboxTests(TestCase):
+
+    def test_rolled_back_change_queues_nothing(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                outbox.enqueue("Hello", "Body", ["a@example.com"])
+                raise RuntimeError
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_dedupe_key(self):
+        outbox.enqueue("Receipt", "Body", "a@example.com", dedupe_key="parcel-receipt:1")
+        outbox.enqueue("Receipt", "Body", "a@example.com", dedupe_key="parcel-receipt:1")
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+    @override_settings(EMAIL_BACKEND="notifications.tests.CountingBackend")
+    def test_drain_sends_batch_over_one_connection(self):
+        outbox.enqueue_many([(f"Hello {i}", "Body", [f"c{i}@example.com"]) for i in range(20)])
+        CountingBackend.opened = 0
+
+        self.assertEqual(outbox.drain(batch_size=50), (20, 0))
+        self.assertEqual(len(mail.outbox), 20)
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxStatus.SENT).count(), 20)
+
+    @override_settings(EMAIL_BACKEND="notifications.tests.FailingBackend")
+    def test_failures_back_off_then_dead_letter(self):
+        outbox.enqueue("Hello", "Body", ["a@example.com"])
+
+        self.assertEqual(outbox.drain(), (0, 1))
+        email = OutboxEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), (OutboxStatus.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, email.created_at)
+        # Not due yet, so nothing is claimed.
+        self.assertEqual(outbox.drain(), (0, 0))
+
+        OutboxEmail.objects.update(attempts=outbox.OUTBOX_MAX_ATTEMPTS - 1, next_attempt_at=email.created_at)
+        outbox.drain()
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutboxStatus.DEAD)
+        self.assertIn("SMTP is down", email.last_error)
+
+        self.assertEqual(outbox.requeue_dead(), 1)
+
+
+class DigestTests(TestCase):
+
+    def setUp(self):
+        self.agent = get_user_model().objects.create(username="agent", email="agent@example.com")
+        self.later = timezone.now() + timedelta(minutes=digest.NOTIFICATION_DIGEST_WINDOW + 1)
+
+    def queue_assignments(self, n):
+        digest.queue_many([
+            (self.agent.id, f"New parcel assigned: TRK{i}", "New Parcel Assigned", NoticeKind.PARCEL_ASSIGNED, None)
+            for i in range(n)
+        ])
+
+    def test_notices_within_window_become_one_digest(self):
+        self.queue_assignments(14)
+        self.assertEqual(digest.flush(), 0)
+
+        self.assertEqual(digest.flush(now=self.later), 1)
+        notification = Notification.objects.get(user=self.agent)
+        self.assertEqual(notification.title, "14 new parcels assigned")
+        self.assertEqual(notification.items.count(), 14)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+        self.assertEqual(digest.flush(now=self.later), 0)
+
+    def test_quiet_hours_and_email_preference(self):
+        now = timezone.localtime(self.later)
+        NotificationPreference.objects.create(
+            user=self.agent, email_enabled=False,
+            quiet_hours_start=(now - timedelta(hours=1)).time(), quiet_hours_end=(now + timedelta(hours=1)).time(),
+        )
+        self.queue_assignments(3)
+        self.assertEqual(digest.flush(now=self.later), 0)
+
+        NotificationPreference.objects.update(quiet_hours_start=time(0, 0), quiet_hours_end=time(0, 0))
+        self.assertEqual(digest.flush(now=self.later), 1)
+        self.assertFalse(OutboxEmail.objects.exists())
+
+
+class InboxCounterTests(TestCase):
+
+    def setUp(self):
+        self.user = get_user_model().objects.create(username="reader")
+        self.notes = [Notification.objects.create(user=self.user, message=f"n{i}") for i in range(4)]
+
+    def test_deleting_unread_notifications_uncounts_them(self):
+        inbox.mark_read(self.user, [self.notes[0].pk])
+        self.notes[0].refresh_from_db()
+        self.notes[0].delete()
+        self.notes[1].delete()
+        self.assertEqual(inbox.unread_count(self.user), 2)
+        Notification.objects.filter(user=self.user).delete()
+        self.assertEqual(inbox.unread_count(self.user), 0)
+
+    def test_flipping_read_on_save_moves_the_counter(self):
+        note = Notification.objects.get(pk=self.notes[0].pk)
+        note.read = True
+        note.save()
+        self.assertEqual(inbox.unread_count(self.user), 3)
+        note.save()
+        self.assertEqual(inbox.unread_count(self.user), 3)
+        note.read = False
+        note.save(update_fields=["read"])
+        self.assertEqual(inbox.unread_count(self.user), 4)
+        Notification.objects.create(user=self.user, message="seen", read=True)
+        self.assertEqual(inbox.unread_count(self.user), 4)
+
+    def test_mark_read_is_all_or_nothing(self):
+        with mock.patch.object(inbox, "subtract_unread", side_effect=RuntimeError("counter locked")):
+            with self.assertRaises(RuntimeError):
+                inbox.mark_read(self.user, [note.pk for note in self.notes])
+        self.assertEqual(Notification.objects.filter(read=False).count(), 4)
+        self.assertEqual(inbox.mark_read(self.user, [note.pk for note in self.notes]), 4)
+        self.assertEqual(inbox.unread_count(self.user), 0)
+
+
+class FanoutTests(TestCase):
+
+    def make_users(self, n):
+        User = get_user_model()
+        User.objects.bulk_create([
+            User(username=f"fan{i}", first_name=f"F{i}", email=f"fan{i}@example.com") for i in range(n)
+        ])
+        return User.objects.filter(username__startswith="fan")
+
+    def test_user_fields_win_over_context(self):
+        users = self.make_users(1)
+        fanout.fanout(users, None, "Hi {first_name}, {city} {unknown}", context={"first_name": "All", "city": "Thika"})
+        self.assertEqual(Notification.objects.get().message, "Hi F0, Thika {unknown}")
+
+    def test_bad_template_fails_before_anything_is_sent(self):
+        users = self.make_users(3)
+        for template in ("Sale {", "Sale }", "{0}", "{username.upper.x}"):
+            with self.assertRaises(fanout.InvalidTemplate):
+                fanout.fanout(users, "Notice", template, channels=["email"], dedupe="bad")
+        self.assertFalse(Notification.objects.exists())
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_broadcast_statements_grow_with_chunks_not_users(self):
+        users = self.make_users(20000)
+        with CaptureQueriesContext(connection) as queries:
+            sent = fanout.fanout(users, "Notice", "Hello {username}", channels=["email"], dedupe="scale", chunk_size=5000)
+        self.assertEqual(sent, 20000)
+        self.assertEqual(OutboxEmail.objects.count(), 20000)
+        self.assertEqual(Notification.objects.filter(message="Hello fan19999").count(), 1)
+        # SQLite caps the parameters of one INSERT, so a chunk takes many
+        # batches here (about 470 statements in all); Postgres needs a few
+        # dozen. Either way it is not one round trip per user.
+        self.assertLess(len(queries), 600)
+
+
+@mock.patch.object(sms, "SMS_WEBHOOK_TOKEN", "secret")
+class SmsTests(TestCase):
+
+    def test_only_the_drainer_needs_a_gateway_url(self):
+        env = {k: v for k, v in os.environ.items() if not k.startswith("SMS_")}
+        env["DEBUG"] = "False"
+        load = [sys.executable, "-c", "import dropagent.settings"]
+        result = subprocess.run(load, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+        with mock.patch.object(sms, "SMS_GATEWAY_URL", ""), mock.patch.object(sms, "_gateway", None), \
+                mock.patch.object(sms, "SMS_BACKEND", "notifications.sms.HttpGateway"):
+            with self.assertRaises(ImproperlyConfigured):
+                sms.HttpGateway()
+            with self.assertRaisesMessage(CommandError, "SMS_GATEWAY_URL"):
+                call_command("drain_sms", stdout=StringIO())
+
+    def test_batches_urgent_first_and_dead_letters_bad_numbers(self):
+        sms.enqueue_many([(f"0712 000 {i:03d}", "Bulk") for i in range(1, 80)], priority=SmsPriority.BULK)
+        sms.enqueue("0712000999", "Your parcel is ready", priority=SmsPriority.URGENT)
+        gateway = RecordingGateway()
+
+        with self.assertLogs("notifications.sms", "ERROR"):
+            self.assertEqual(sms.drain(gateway=gateway, throttle=NoWait()), (46, 4))
+        self.assertEqual(len(gateway.calls[0]), 50)
+        self.assertEqual(gateway.calls[0][0], "+254712000999")
+        self.assertEqual(SmsMessage.objects.filter(status=SmsStatus.DEAD).count(), 4)
+
+    def test_rate_limit_defers_without_spending_attempts(self):
+        sms.enqueue("0712000001", "Hello")
+        throttle = NoWait()
+
+        with self.assertLogs("notifications.sms", "WARNING"):
+            sms.drain(gateway=RecordingGateway(sms.GatewayError("429", retry_after=2)), throttle=throttle)
+        message = SmsMessage.objects.get()
+        self.assertEqual((message.status, message.attempts), (SmsStatus.PENDING, 0))
+        self.assertEqual(throttle.paused, 2)
+
+    def test_delivery_receipts_webhook(self):
+        sms.enqueue_many([("0712000001", "a"), ("0712000002", "b")])
+        sms.drain(gateway=RecordingGateway(), throttle=NoWait())
+        first, second = SmsMessage.objects.order_by("id")
+        receipts = {"receipts": [
+            {"provider_id": first.provider_id, "status": "delivered"},
+            {"provider_id": second.provider_id, "status": "failed", "error": "Handset off"},
+        ]}
+        url = reverse("notifications:sms_receipts")
+
+        self.assertEqual(self.client.post(url, receipts, content_type="application/json").status_code, 403)
+        response = self.client.post(url, receipts, content_type="application/json", HTTP_X_GATEWAY_TOKEN="secret")
+        self.assertEqual(response.json(), {"updated": 2})
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, SmsStatus.DELIVERED)
+        self.assertEqual((second.status, second.last_error), (SmsStatus.UNDELIVERED, "Handset off"))
+
+    def test_throttle_paces_batches(self):
+        now, slept = [0.0], []
+        throttle = sms.Throttle(10, burst=10, clock=lambda: now[0], sleep=slept.append)
+        throttle.wait(10)
+        throttle.wait(10)
+        self.assertEqual(slept, [1.0])
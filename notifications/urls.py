@@ -0,0 +1,12 @@
+from django.urls import path
+from . import views
+
+app_name = "notifications"
+
+urlpatterns = [
+    path('', views.notifications_list, name='list'),
+    path('<int:pk>/read/', views.mark_as_read, name='mark_as_read'),
+    path('read-all/', views.mark_all_read, name='mark_all_read'),
+    path('unread-count/', views.unread_badge, name='unread_badge'),
+    path('sms/receipts/', views.sms_receipts, name='sms_receipts'),
+]
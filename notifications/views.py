@@ -1,20 +1,63 @@
+import json
+
 from django.shortcuts import render
 
 # Create your views here.
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import sms
+from .inbox import mark_all_read as mark_all_notifications_read
+from .inbox import mark_read, page, unread_count
 from .models import Notification
 
 @login_required
 def notifications_list(request):
-    notifications = request.user.notifications.all()
-    return render(request, "notifications/list.html", {"notifications": notifications})
+    unread_only = request.GET.get("unread") == "1"
+    notifications, next_cursor = page(request.user, before=request.GET.get("before"), unread_only=unread_only)
+    return render(request, "notifications/list.html", {
+        "notifications": notifications,
+        "next_cursor": next_cursor,
+        "unread_only": unread_only,
+        "unread_count": unread_count(request.user),
+    })
 
 @login_required
 def mark_as_read(request, pk):
-    notif = Notification.objects.get(pk=pk, user=request.user)
-    notif.is_read = True
-    notif.save()
-    if notif.url:
-        return redirect(notif.url)
+    notif = get_object_or_404(Notification, pk=pk, user=request.user)
+    mark_read(request.user, [notif.pk])
+    if notif.link:
+        return redirect(notif.link)
+    return redirect("notifications:list")
+
+@login_required
+@require_POST
+def mark_all_read(request):
+    mark_all_notifications_read(request.user)
     return redirect("notifications:list")
+
+@login_required
+def unread_badge(request):
+    """Polled by every logged-in page; one primary-key read."""
+    response = JsonResponse({"unread": unread_count(request.user)})
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+@csrf_exempt
+@require_POST
+def sms_receipts(request):
+    """
+    Delivery receipts from the SMS gateway, authenticated by the
+    ``X-Gateway-Token`` header: ``{"receipts": [{"provider_id", "status", "error"}]}``.
+    """
+    if not sms.valid_webhook_token(request.headers.get("X-Gateway-Token")):
+        return JsonResponse({"error": "Invalid token"}, status=403)
+    try:
+        receipts = json.loads(request.body)["receipts"]
+        updated = sms.record_receipts(receipts)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({"error": "Expected {\"receipts\": [...]}"}, status=400)
+    return JsonResponse({"updated": updated})
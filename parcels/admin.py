@@ -1,11 +1,16 @@
 # parcels/admin.py
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
 from django.utils.html import format_html
-from django.http import HttpResponse
-import qrcode
-import io
-from .models import Parcel, Receipt
-from .utils import send_custom_email  # Make sure this exists
+from django.http import FileResponse
+from .models import DeliveryZone, DocumentStatus, Parcel, ParcelStatus, Receipt, Tariff, TariffPeriod, new_receipt_numbers
+from .labels import LABEL_FIELDS, render_labels
+from .search import filter_matching
+from .tracking import invalidate_parcels
+from .transitions import transition
+from .utils import send_custom_emails
 
 
 @admin.register(Parcel)
@@ -18,11 +23,12 @@ class ParcelAdmin(admin.ModelAdmin):
         "payment_status",
         "payment_method",
         "matatu_direct",
+        "documents_status",
         "created_at",
     )
-    list_filter = ("status", "payment_status", "payment_method", "matatu_direct")
+    list_filter = ("status", "payment_status", "payment_method", "matatu_direct", "documents_status")
     search_fields = ("reference", "customer_name", "destination", "customer_email")
-    readonly_fields = ("created_at", "updated_at")
+    readonly_fields = ("created_at", "updated_at", "documents_status", "documents_error")
 
     fieldsets = (
         ("Parcel Info", {
@@ -30,6 +36,7 @@ class ParcelAdmin(admin.ModelAdmin):
                 "reference",
                 "customer_name",
                 "customer_email",
+                "customer_phone",
                 "destination",
                 "origin_shop",
                 "assigned_to",
@@ -54,109 +61,130 @@ class ParcelAdmin(admin.ModelAdmin):
                 "via_matatu",
             )
         }),
+        ("Documents", {
+            "fields": ("documents_status", "documents_error"),
+        }),
         ("Timestamps", {
             "fields": ("created_at", "updated_at"),
         }),
     )
 
+    def get_search_results(self, request, queryset, search_term):
+        # Served by the parcels.search index instead of icontains scans.
+        if not search_term.strip():
+            return queryset, False
+        return filter_matching(queryset, search_term), False
+
     actions = [
         "generate_receipt",
         "send_notification_email",
         "generate_delivery_note",
         "print_delivery_label",
+        "print_thermal_label",
         "mark_as_scanned",
+        "rebuild_documents",
     ]
 
     # --- 1. Generate Receipt/Invoice ---
     def generate_receipt(self, request, queryset):
-        for parcel in queryset:
-            receipt, created = Receipt.objects.get_or_create(
-                parcel=parcel,
-                defaults={
-                    "amount": parcel.full_amount,
-                    "payment_status": parcel.payment_status,
-                }
+        # A fixed number of queries whatever the selection size: one UPDATE for
+        # the existing receipts, one SELECT + one INSERT for the missing ones.
+        parcel_ids = list(queryset.values_list("id", flat=True))
+        with transaction.atomic():
+            source = Parcel.objects.filter(pk=OuterRef("parcel_id"))
+            updated = Receipt.objects.filter(parcel_id__in=parcel_ids).update(
+                amount=Subquery(source.values("full_amount")[:1]),
+                payment_status=Subquery(source.values("payment_status")[:1]),
+                updated_at=timezone.now(),
             )
-            if not created:
-                receipt.amount = parcel.full_amount
-                receipt.payment_status = parcel.payment_status
-                receipt.save()
-        self.message_user(request, "Receipt(s) generated/updated successfully.")
+            missing = list(
+                Parcel.objects.filter(id__in=parcel_ids, receipts__isnull=True)
+                .values_list("id", "full_amount", "payment_status")
+            )
+            Receipt.objects.bulk_create([
+                Receipt(parcel_id=parcel_id, amount=amount, payment_status=payment_status, receipt_number=number)
+                for (parcel_id, amount, payment_status), number in zip(missing, new_receipt_numbers(len(missing)))
+            ])
+        self.message_user(
+            request,
+            f"{len(parcel_ids)} parcel(s): {len(missing)} receipt(s) generated, {updated} updated.",
+            messages.SUCCESS,
+        )
     generate_receipt.short_description = "Generate or Update Receipt for selected Parcels"
 
     # --- 2. Send Notification Email ---
     def send_notification_email(self, request, queryset):
-        for parcel in queryset:
-            subject = f"Parcel Update - {parcel.reference}"
+        parcels = list(
+            queryset.exclude(customer_email__isnull=True).exclude(customer_email="")
+            .values("reference", "customer_name", "customer_email", "status", "payment_status")
+        )
+        batch = []
+        for parcel in parcels:
+            subject = f"Parcel Update - {parcel['reference']}"
             message = f"""
-            Dear {parcel.customer_name},
+            Dear {parcel['customer_name']},
 
-            Your parcel with reference {parcel.reference} is currently marked as:
-            Status: {parcel.status}
-            Payment: {parcel.payment_status}
+            Your parcel with reference {parcel['reference']} is currently marked as:
+            Status: {parcel['status']}
+            Payment: {parcel['payment_status']}
 
             Thank you for choosing DropAgent.
             """
-            if parcel.customer_email:
-                send_custom_email(subject, message, [parcel.customer_email])
-        self.message_user(request, "Notification emails sent successfully.")
+            batch.append((subject, message, [parcel["customer_email"]]))
+        queued = send_custom_emails(batch)
+        skipped = queryset.count() - len(parcels)
+        self.message_user(
+            request,
+            f"{queued} notification email(s) queued; {skipped} parcel(s) skipped without a customer email.",
+            messages.SUCCESS if not skipped else messages.WARNING,
+        )
     send_notification_email.short_description = "Send Email Notification to Customers"
 
     # --- 3. Generate Delivery Note with QR Code ---
-    def generate_delivery_note(self, request, queryset):
-        parcel = queryset.first()
-        if not parcel:
-            self.message_user(request, "No parcel selected.")
+    def _labels_response(self, request, queryset, layout, filename):
+        parcels = queryset.order_by("reference").values(*LABEL_FIELDS)
+        if not parcels:
+            self.message_user(request, "No parcel selected.", messages.WARNING)
             return
+        return FileResponse(
+            render_labels(parcels, layout), as_attachment=True,
+            filename=filename, content_type="application/pdf",
+        )
 
-        qr_content = f"REF:{parcel.reference}|STATUS:{parcel.status}"
-        qr = qrcode.make(qr_content)
-        buffer = io.BytesIO()
-        qr.save(buffer, "PNG")
-        buffer.seek(0)
-
-        response = HttpResponse(buffer, content_type="image/png")
-        response["Content-Disposition"] = f'attachment; filename="delivery_note_{parcel.reference}.png"'
-        return response
-    generate_delivery_note.short_description = "Generate Delivery Note with QR Code"
+    def generate_delivery_note(self, request, queryset):
+        return self._labels_response(request, queryset, "a4-note", "delivery_notes.pdf")
+    generate_delivery_note.short_description = "Generate Delivery Notes with QR Code (PDF, one per page)"
 
     # --- 4. Print Delivery Label (QR + Customer Info) ---
     def print_delivery_label(self, request, queryset):
-        parcel = queryset.first()
-        if not parcel:
-            self.message_user(request, "No parcel selected.")
-            return
+        return self._labels_response(request, queryset, "a4", "delivery_labels.pdf")
+    print_delivery_label.short_description = "Print Delivery Labels (A4 sheets)"
 
-        # QR Code
-        qr_content = f"REF:{parcel.reference}|STATUS:{parcel.status}"
-        qr = qrcode.make(qr_content)
-        qr_buffer = io.BytesIO()
-        qr.save(qr_buffer, "PNG")
-        qr_buffer.seek(0)
-
-        # Build label HTML (can print directly from browser)
-        html_content = f"""
-        <html>
-            <body>
-                <h2>Parcel Delivery Label</h2>
-                <p><b>Reference:</b> {parcel.reference}</p>
-                <p><b>Customer:</b> {parcel.customer_name}</p>
-                <p><b>Destination:</b> {parcel.destination}</p>
-                <img src="data:image/png;base64,{qr_buffer.getvalue().hex()}">
-            </body>
-        </html>
-        """
-        return HttpResponse(html_content)
-    print_delivery_label.short_description = "Print Delivery Label (QR + Info)"
+    def print_thermal_label(self, request, queryset):
+        return self._labels_response(request, queryset, "thermal-100x150", "thermal_labels.pdf")
+    print_thermal_label.short_description = "Print Delivery Labels (100x150mm thermal)"
 
     def mark_as_scanned(self, request, queryset):
-        for parcel in queryset:
-            parcel.status = "IN_TRANSIT"
-            parcel.save()
-        self.message_user(request, "Selected parcel(s) marked as scanned and updated.")
+        selected = queryset.count()
+        result = transition(queryset, ParcelStatus.IN_TRANSIT, actor=request.user)
+        self.message_user(
+            request,
+            f"{result.count} parcel(s) marked as scanned (In Transit); "
+            f"{selected - result.count} skipped because their status does not allow it."
+        )
 
     mark_as_scanned.short_description = "Mark selected parcels as Scanned"
 
+    def rebuild_documents(self, request, queryset):
+        parcel_ids = list(queryset.values_list("id", flat=True))
+        count = Parcel.objects.filter(id__in=parcel_ids).update(
+            documents_status=DocumentStatus.PENDING, documents_claimed_at=None
+        )
+        invalidate_parcels(parcel_ids)
+        self.message_user(request, f"{count} parcel(s) queued for document generation.")
+
+    rebuild_documents.short_description = "Queue invoice/receipt/delivery note generation"
+
 
 # --- Receipt Admin ---
 @admin.register(Receipt)
@@ -165,3 +193,24 @@ class ReceiptAdmin(admin.ModelAdmin):
     list_filter = ("payment_status",)
     search_fields = ("parcel__reference", "parcel__customer_name")
     readonly_fields = ("issued_at", "updated_at")  # Make sure `updated_at` exists in Receipt model
+
+
+# --- Delivery tariffs (parcels.tariffs; saving any of these reprices quotes) ---
+@admin.register(DeliveryZone)
+class DeliveryZoneAdmin(admin.ModelAdmin):
+    list_display = ("name", "aliases", "latitude", "longitude")
+    search_fields = ("name", "aliases")
+
+
+@admin.register(Tariff)
+class TariffAdmin(admin.ModelAdmin):
+    list_display = ("zone", "origin_zone", "base_fee", "per_km_fee", "rider_base", "rider_per_km")
+    list_editable = ("base_fee", "per_km_fee", "rider_base", "rider_per_km")
+    list_filter = ("zone",)
+    autocomplete_fields = ("zone", "origin_zone")
+
+
+@admin.register(TariffPeriod)
+class TariffPeriodAdmin(admin.ModelAdmin):
+    list_display = ("name", "starts_at", "ends_at", "weekdays", "multiplier")
+    list_editable = ("multiplier",)
@@ -1,5 +1,6 @@
 # parcels/apps.py
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class ParcelsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
@@ -7,3 +8,6 @@ class ParcelsConfig(AppConfig):
 
     def ready(self):
         import parcels.signals
+        from parcels.search import ensure_triggers
+
+        post_migrate.connect(ensure_triggers, sender=self)
@@ -0,0 +1,186 @@
+# parcels/documents.py
+"""
+Deferred document stage for parcels.
+
+Creating a parcel only inserts the parcel row (``documents_status`` starts as
+PENDING). This module builds the invoice/receipt, the delivery note and its QR
+code later, in batches, from a worker running
+``manage.py process_parcel_documents``.
+
+Every step is idempotent: documents that already exist are left alone, so a
+batch that dies halfway (or is picked up twice) is simply run again.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    DeliveryNote,
+    DocumentStatus,
+    Invoice,
+    Parcel,
+    PaymentStatus,
+    Receipt,
+    new_invoice_numbers,
+    new_receipt_numbers,
+)
+from notifications.outbox import enqueue_many
+
+from .tracking import invalidate_parcels
+from .utils import generate_qr_code
+
+logger = logging.getLogger(__name__)
+
+# A PROCESSING claim older than this belongs to a dead worker and is re-claimed.
+STALE_CLAIM_AFTER = timedelta(minutes=10)
+
+
+def claim_batch(batch_size=100):
+    """
+    Mark up to ``batch_size`` parcels as PROCESSING and return their ids.
+
+    The claim timestamp doubles as the claim token, so two workers racing for
+    the same rows each only get back the ones their own UPDATE won.
+    """
+    now = timezone.now()
+    claimable = Q(documents_status=DocumentStatus.PENDING) | Q(
+        documents_status=DocumentStatus.PROCESSING,
+        documents_claimed_at__lt=now - STALE_CLAIM_AFTER,
+    )
+
+    candidate_ids = list(
+        Parcel.objects.filter(claimable).order_by("id").values_list("id", flat=True)[:batch_size]
+    )
+    if not candidate_ids:
+        return []
+
+    Parcel.objects.filter(claimable, id__in=candidate_ids).update(
+        documents_status=DocumentStatus.PROCESSING,
+        documents_claimed_at=now,
+    )
+    return list(
+        Parcel.objects.filter(
+            id__in=candidate_ids,
+            documents_status=DocumentStatus.PROCESSING,
+            documents_claimed_at=now,
+        ).values_list("id", flat=True)
+    )
+
+
+def recipient_email(parcel):
+    if parcel.customer and parcel.customer.email:
+        return parcel.customer.email
+    return parcel.customer_email
+
+
+def build_documents(parcel_ids):
+    """
+    Build missing invoice/receipt/delivery-note/QR artifacts for ``parcel_ids``.
+
+    E-mails for documents created in this run are queued in the outbox in the
+    caller's transaction. Returns how many were queued.
+    """
+    parcels = list(Parcel.objects.filter(id__in=parcel_ids).select_related("customer"))
+    if not parcels:
+        return 0
+
+    have_invoice = set(Invoice.objects.filter(parcel_id__in=parcel_ids).values_list("parcel_id", flat=True))
+    have_receipt = set(Receipt.objects.filter(parcel_id__in=parcel_ids).values_list("parcel_id", flat=True))
+    have_note = set(DeliveryNote.objects.filter(parcel_id__in=parcel_ids).values_list("parcel_id", flat=True))
+
+    invoices, receipts, notes, emails, email_keys = [], [], [], [], []
+    for parcel in parcels:
+        email = recipient_email(parcel)
+        # Unpaid parcels get an invoice, anything paid (fully or partly) a receipt.
+        if parcel.payment_status == PaymentStatus.PENDING:
+            if parcel.id not in have_invoice and parcel.id not in have_receipt:
+                invoices.append(Invoice(parcel=parcel))
+                if email:
+                    emails.append(("Invoice Created", f"Invoice for parcel {parcel.reference}", email))
+                    email_keys.append(f"parcel-invoice:{parcel.id}")
+        elif parcel.id not in have_receipt:
+            receipts.append(Receipt(
+                parcel=parcel,
+                amount=parcel.amount,
+                payment_status=parcel.payment_status,
+            ))
+            if email:
+                emails.append(("Payment Receipt", f"Receipt for parcel {parcel.reference}", email))
+                email_keys.append(f"parcel-receipt:{parcel.id}")
+
+        if parcel.id not in have_note:
+            notes.append(DeliveryNote(parcel=parcel))
+
+    for invoice, number in zip(invoices, new_invoice_numbers(len(invoices))):
+        invoice.invoice_number = number
+    for receipt, number in zip(receipts, new_receipt_numbers(len(receipts))):
+        receipt.receipt_number = number
+
+    Invoice.objects.bulk_create(invoices, ignore_conflicts=True)
+    Receipt.objects.bulk_create(receipts, ignore_conflicts=True)
+    DeliveryNote.objects.bulk_create(notes, ignore_conflicts=True)
+
+    missing_qr = DeliveryNote.objects.filter(parcel_id__in=parcel_ids).filter(
+        Q(qr_code="") | Q(qr_code__isnull=True)
+    ).select_related("parcel")
+    for note in missing_qr:
+        generate_qr_code(note)
+
+    return enqueue_many(emails, dedupe_keys=email_keys)
+
+
+def process_batch(parcel_ids):
+    """
+    Build documents for claimed parcels and record the outcome on each row.
+
+    The whole batch is tried in one transaction first; if that fails each
+    parcel is retried on its own so one bad row cannot block the rest.
+    """
+    try:
+        with transaction.atomic():
+            build_documents(parcel_ids)
+            Parcel.objects.filter(id__in=parcel_ids).update(
+                documents_status=DocumentStatus.READY, documents_error=""
+            )
+    except Exception:
+        logger.exception("Document batch of %d parcels failed; retrying one by one", len(parcel_ids))
+    else:
+        invalidate_parcels(parcel_ids)
+        return len(parcel_ids), 0
+
+    ready = failed = 0
+    for parcel_id in parcel_ids:
+        try:
+            with transaction.atomic():
+                build_documents([parcel_id])
+                Parcel.objects.filter(id=parcel_id).update(
+                    documents_status=DocumentStatus.READY, documents_error=""
+                )
+        except Exception as exc:
+            logger.exception("Building documents for parcel %s failed", parcel_id)
+            Parcel.objects.filter(id=parcel_id).update(
+                documents_status=DocumentStatus.FAILED, documents_error=str(exc)[:1000]
+            )
+            failed += 1
+        else:
+            ready += 1
+    invalidate_parcels(parcel_ids)
+    return ready, failed
+
+
+def requeue_failed():
+    """Put FAILED parcels back in the queue. Returns how many were requeued."""
+    return Parcel.objects.filter(documents_status=DocumentStatus.FAILED).update(
+        documents_status=DocumentStatus.PENDING, documents_claimed_at=None
+    )
+
+
+def process_pending(batch_size=100):
+    """Claim and process one batch. Returns ``(ready, failed)`` counts."""
+    parcel_ids = claim_batch(batch_size=batch_size)
+    if not parcel_ids:
+        return 0, 0
+    return process_batch(parcel_ids)
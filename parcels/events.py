@@ -0,0 +1,68 @@
+# parcels/events.py
+"""
+Parcel event log: where a parcel has been and who moved it.
+
+Events are only ever appended, in batches (one INSERT per scan set), and read
+through the two composite indexes on ``ParcelEvent``: the timeline of one
+parcel, and everything that happened at one shop in a time window.
+"""
+from django.utils import timezone
+
+from .models import ParcelEvent, ParcelEventKind
+
+TIMELINE_LIMIT = 50
+
+
+def _shop_id(shop):
+    return getattr(shop, "pk", shop)
+
+
+def record_transition(moved, to_status, actor=None, shop=None, location="", at=None):
+    """Append one STATUS event per ``(id, reference, previous_status)`` in ``moved``."""
+    at = at or timezone.now()
+    ParcelEvent.objects.bulk_create([
+        ParcelEvent(
+            parcel_id=parcel_id,
+            kind=ParcelEventKind.STATUS,
+            from_status=from_status,
+            to_status=to_status,
+            actor=actor,
+            shop_id=_shop_id(shop),
+            location=location or "",
+            created_at=at,
+        )
+        for parcel_id, _, from_status in moved
+    ], batch_size=500)
+
+
+def record_scans(parcel_ids, actor=None, shop=None, location="", at=None):
+    """Append SCAN events for parcels seen without a status change."""
+    at = at or timezone.now()
+    ParcelEvent.objects.bulk_create([
+        ParcelEvent(
+            parcel_id=parcel_id,
+            kind=ParcelEventKind.SCAN,
+            actor=actor,
+            shop_id=_shop_id(shop),
+            location=location or "",
+            created_at=at,
+        )
+        for parcel_id in parcel_ids
+    ], batch_size=500)
+
+
+def timeline(parcel_id, limit=TIMELINE_LIMIT):
+    """Most recent events of a parcel, newest first."""
+    return list(
+        ParcelEvent.objects.filter(parcel_id=parcel_id)
+        .select_related("shop")
+        .order_by("-created_at")[:limit]
+    )
+
+
+def events_at_shop(shop, start, end):
+    """Events recorded at ``shop`` with ``start <= created_at < end``."""
+    return (
+        ParcelEvent.objects.filter(shop_id=_shop_id(shop), created_at__gte=start, created_at__lt=end)
+        .order_by("created_at")
+    )
@@ -6,5 +6,38 @@ from .models import Parcel
 class ParcelForm(forms.ModelForm):
   class Meta:
    model = Parcel
-   fields = ( "tracking_number", "banner_image_url", "customer_name", "customer_email",
-            "destination", "value_kes", "category", "origin_shop", "assigned_to", "status" )
\ No newline at end of file
+   fields = ( "tracking_number", "customer_name", "customer_email", "customer_phone",
+            "destination", "value_kes", "category", "origin_shop", "assigned_to", "status" )
+
+class ParcelImportForm(forms.ModelForm):
+  """
+  Validates one row of a bulk import (see parcels.importer).
+
+  Foreign keys are resolved per chunk by the importer and uniqueness is
+  checked in bulk there too, so validating a row never touches the database.
+  """
+  class Meta:
+   model = Parcel
+   fields = ( "reference", "customer_name", "customer_email", "customer_phone", "destination",
+            "value_kes", "full_amount", "delivery_cost", "amount",
+            "payment_status", "payment_method", "payment_type",
+            "dispatch_from", "dispatch_to", "matatu_direct", "via_matatu" )
+
+  def __init__(self, *args, **kwargs):
+   super().__init__(*args, **kwargs)
+   self.fields["reference"].required = True
+   for name in ("value_kes", "full_amount", "delivery_cost", "amount",
+                "payment_status", "payment_method", "payment_type"):
+    self.fields[name].required = False
+
+  def clean(self):
+   cleaned = super().clean()
+   # Blank optional columns fall back to the model defaults.
+   for name in ("value_kes", "full_amount", "delivery_cost", "amount",
+                "payment_status", "payment_method", "payment_type"):
+    if cleaned.get(name) in (None, ""):
+     cleaned[name] = Parcel._meta.get_field(name).get_default()
+   return cleaned
+
+  def validate_unique(self):
+   pass
@@ -0,0 +1,164 @@
+# parcels/importer.py
+"""
+Bulk parcel ingestion shared by ``manage.py import_parcels`` and the
+streaming ``parcels/import/`` endpoints: ``import/`` for staff in the
+browser, ``import/api/`` for scripts holding ``PARCEL_IMPORT_TOKEN``.
+
+Rows are validated and inserted a chunk at a time: one query each to resolve
+categories, shops and already-used references, then a single ``bulk_create``.
+``bulk_create`` does not fire ``post_save``; new parcels are picked up by the
+deferred document stage (they start as PENDING) and the whole chunk is
+announced once through the ``parcels_bulk_created`` signal. Rows without a
+delivery cost are priced from parcels.tariffs.
+"""
+import csv
+import hashlib
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.crypto import constant_time_compare
+
+from shops.models import Shop
+
+from .forms import ParcelImportForm
+from .models import Category, Parcel, new_tracking_numbers
+from .signals import parcels_bulk_created
+from .tariffs import fill_delivery_costs
+
+DEFAULT_CHUNK_SIZE = 500
+PARCEL_IMPORT_TOKEN = getattr(settings, "PARCEL_IMPORT_TOKEN", "")  # empty: no scripted imports
+
+
+def valid_import_token(token):
+    return bool(PARCEL_IMPORT_TOKEN) and constant_time_compare(token or "", PARCEL_IMPORT_TOKEN)
+
+
+def reference_digest(reference):
+    """Compact 8-byte fingerprint used to spot duplicate references in a stream."""
+    return hashlib.blake2b(reference.strip().encode("utf-8"), digest_size=8).digest()
+
+
+def _decoded(lines):
+    for line in lines:
+        yield line.decode("utf-8") if isinstance(line, bytes) else line
+
+
+def read_rows(lines, fmt):
+    """Yield ``(line_number, row)`` from CSV or JSON-lines input (str or bytes lines)."""
+    if fmt == "csv":
+        reader = csv.DictReader(_decoded(lines))
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(_decoded(lines), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            row = exc
+        yield line_number, row
+
+
+def _result(line, status, reference=None, **extra):
+    result = {"line": line, "status": status, "reference": reference}
+    result.update(extra)
+    return result
+
+
+def _import_chunk(chunk, seen, created_by):
+    results = {}
+    valid = []
+
+    for line, row in chunk:
+        if not isinstance(row, dict):
+            results[line] = _result(line, "invalid", errors={"__all__": ["Line is not a JSON object."]})
+            continue
+        form = ParcelImportForm(data=row)
+        if not form.is_valid():
+            results[line] = _result(line, "invalid", row.get("reference"), errors=form.errors.get_json_data())
+            continue
+        reference = form.cleaned_data["reference"].strip()
+        digest = reference_digest(reference)
+        if digest in seen:
+            results[line] = _result(line, "duplicate", reference)
+            continue
+        seen.add(digest)
+        valid.append((line, reference, row, form.cleaned_data))
+
+    references = [reference for _, reference, _, _ in valid]
+    existing = set(Parcel.objects.filter(reference__in=references).values_list("reference", flat=True))
+
+    category_names = {str(row["category"]).strip() for _, _, row, _ in valid if row.get("category")}
+    categories = {c.name: c for c in Category.objects.filter(name__in=category_names)}
+    shop_ids = {str(row["origin_shop"]).strip() for _, _, row, _ in valid if row.get("origin_shop")}
+    shops = {str(s.pk): s for s in Shop.objects.filter(pk__in=[i for i in shop_ids if i.isdigit()])}
+
+    pending = []
+    for line, reference, row, data in valid:
+        if reference in existing:
+            results[line] = _result(line, "duplicate", reference)
+            continue
+        category = row.get("category") and categories.get(str(row["category"]).strip())
+        if row.get("category") and not category:
+            results[line] = _result(line, "invalid", reference, errors={"category": ["Unknown category."]})
+            continue
+        shop = row.get("origin_shop") and shops.get(str(row["origin_shop"]).strip())
+        if row.get("origin_shop") and not shop:
+            results[line] = _result(line, "invalid", reference, errors={"origin_shop": ["Unknown shop."]})
+            continue
+        data = dict(data, reference=reference)
+        pending.append((line, Parcel(category=category or None, origin_shop=shop or None, created_by=created_by, **data)))
+
+    for (_, parcel), number in zip(pending, new_tracking_numbers(len(pending))):
+        parcel.tracking_number = number
+    fill_delivery_costs(parcel for _, parcel in pending)
+
+    created = []
+    if pending:
+        try:
+            with transaction.atomic():
+                created = Parcel.objects.bulk_create([parcel for _, parcel in pending])
+        except IntegrityError:
+            # A concurrent import took some of these references; insert the rest.
+            taken = set(Parcel.objects.filter(
+                reference__in=[p.reference for _, p in pending]
+            ).values_list("reference", flat=True))
+            for line, parcel in pending:
+                if parcel.reference in taken:
+                    results[line] = _result(line, "duplicate", parcel.reference)
+            pending = [(line, p) for line, p in pending if p.reference not in taken]
+            with transaction.atomic():
+                created = Parcel.objects.bulk_create([parcel for _, parcel in pending])
+
+    for line, parcel in pending:
+        results[line] = _result(line, "created", parcel.reference, tracking_number=parcel.tracking_number)
+    if created:
+        transaction.on_commit(lambda: parcels_bulk_created.send(sender=Parcel, parcels=created))
+
+    return [results[line] for line, _ in chunk]
+
+
+def import_parcels(rows, created_by=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Import ``(line_number, row)`` pairs and yield one result dict per line.
+
+    Results come back chunk by chunk in input order, with ``status`` one of
+    ``created``, ``duplicate`` or ``invalid``.
+    """
+    rows = iter(rows)
+    seen = set()
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield from _import_chunk(chunk, seen, created_by)
+
+
+def import_lines(lines, fmt="jsonl", created_by=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Parse and import an iterable of CSV or JSON lines (a file or a request)."""
+    return import_parcels(read_rows(lines, fmt), created_by=created_by, chunk_size=chunk_size)
@@ -0,0 +1,207 @@
+# parcels/labels.py
+"""
+Batch label engine.
+
+``render_labels(parcels, layout)`` draws one label per parcel with ReportLab,
+either as a grid on A4 sheets or one label per page for thermal printers, and
+returns the PDF in a temporary file ready for ``FileResponse``. QR codes for
+the whole batch are encoded up front as 1-bit bitmaps with one pixel per
+module: they embed in a few hundred bytes each, so a morning run of 1–2k
+labels takes seconds rather than minutes. Bitmaps are cached with the QR
+PNGs, and the misses of a large batch are encoded in a process pool that is
+started once per web worker and reused.
+
+The pool uses the ``forkserver`` start method: its workers come from a clean
+server process rather than a fork of a multithreaded ASGI worker, which can
+copy a lock some other thread was holding.
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+from PIL import Image
+
+from .qr import encode_bitmap, qr_bitmaps
+from .utils import label_payload
+
+LABEL_FIELDS = ("reference", "tracking_number", "customer_name", "destination", "status")
+
+# Below this many QR codes to encode, a trip through the pool costs more than it saves.
+POOL_THRESHOLD = 64
+
+LABEL_RENDER_WORKERS = getattr(settings, "LABEL_RENDER_WORKERS", 0) or os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _reset():
+    global _pool
+    _pool = None
+
+
+if hasattr(os, "register_at_fork"):
+    # A forked web worker must start its own pool, not share its parent's.
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=LABEL_RENDER_WORKERS, mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return _pool
+
+
+def _discard_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _encode_in_pool(payloads):
+    chunksize = max(1, len(payloads) // (LABEL_RENDER_WORKERS * 4))
+    try:
+        return list(_get_pool().map(encode_bitmap, payloads, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A worker died (OOM kill); start a fresh pool next time and finish this batch here.
+        _discard_pool()
+        return [encode_bitmap(payload) for payload in payloads]
+
+
+@dataclass(frozen=True)
+class Layout:
+    name: str
+    page_size: tuple
+    columns: int = 1
+    rows: int = 1
+    margin: float = 0
+    gap: float = 0
+
+    @property
+    def per_page(self):
+        return self.columns * self.rows
+
+    @property
+    def label_size(self):
+        page_width, page_height = self.page_size
+        width = (page_width - 2 * self.margin - (self.columns - 1) * self.gap) / self.columns
+        height = (page_height - 2 * self.margin - (self.rows - 1) * self.gap) / self.rows
+        return width, height
+
+    def origin(self, slot):
+        """Bottom-left corner of label ``slot`` on its page (filled row by row from the top)."""
+        width, height = self.label_size
+        column, row = slot % self.columns, slot // self.columns
+        x = self.margin + column * (width + self.gap)
+        y = self.page_size[1] - self.margin - (row + 1) * height - row * self.gap
+        return x, y
+
+
+LAYOUTS = {
+    "a4": Layout("a4", A4, columns=3, rows=7, margin=8 * mm, gap=3 * mm),
+    "a4-note": Layout("a4-note", A4, margin=15 * mm),
+    "thermal-100x150": Layout("thermal-100x150", (100 * mm, 150 * mm), margin=4 * mm),
+    "thermal-62x100": Layout("thermal-62x100", (62 * mm, 100 * mm), margin=3 * mm),
+}
+
+
+class _Label:
+    """Attribute access over a ``values()`` row, for ``label_payload``."""
+
+    def __init__(self, row):
+        self.__dict__.update(row)
+
+
+def render_qr_codes(payloads, workers=None):
+    """A QR image for each payload; cache misses go to the process pool for large batches."""
+    workers = workers or LABEL_RENDER_WORKERS
+
+    def encode_many(missing):
+        if workers == 1 or len(missing) < POOL_THRESHOLD:
+            return map(encode_bitmap, missing)
+        return _encode_in_pool(missing)
+
+    return [Image.frombytes("1", (size, size), bits) for size, bits in qr_bitmaps(payloads, encode_many)]
+
+
+def _fit(pdf, text, font, size, width):
+    """Shrink ``size`` until ``text`` fits in ``width``, then truncate."""
+    text = str(text or "")
+    while size > 6 and pdf.stringWidth(text, font, size) > width:
+        size -= 0.5
+    while text and pdf.stringWidth(text, font, size) > width:
+        text = text[:-1]
+    return text, size
+
+
+def _draw_label(pdf, layout, slot, parcel, qr):
+    width, height = layout.label_size
+    x, y = layout.origin(slot)
+    pad = min(width, height) * 0.05
+
+    if layout.per_page > 1:
+        pdf.setDash(2, 2)
+        pdf.rect(x, y, width, height)
+        pdf.setDash()
+
+    # QR on the right (wide labels) or at the bottom (tall thermal labels).
+    side = min(height - 2 * pad, width * 0.45) if width > height else min(width - 2 * pad, height * 0.55)
+    if width > height:
+        qr_x, qr_y = x + width - pad - side, y + (height - side) / 2
+        text_width = width - side - 3 * pad
+    else:
+        qr_x, qr_y = x + (width - side) / 2, y + pad
+        text_width = width - 2 * pad
+    pdf.drawImage(ImageReader(qr), qr_x, qr_y, side, side)
+
+    lines = [
+        ("Helvetica-Bold", parcel["reference"] or parcel["tracking_number"]),
+        ("Helvetica", parcel["tracking_number"]),
+        ("Helvetica-Bold", parcel["customer_name"]),
+        ("Helvetica", parcel["destination"]),
+    ]
+    top = y + height - pad
+    text_bottom = y + pad if width > height else qr_y + side + pad
+    size = min(14.0, (top - text_bottom) / (len(lines) * 1.3))
+    for font, text in lines:
+        text, fitted = _fit(pdf, text, font, size, text_width)
+        top -= fitted * 1.3
+        pdf.setFont(font, fitted)
+        pdf.drawString(x + pad, top, text)
+
+
+def render_labels(parcels, layout="a4", workers=None):
+    """
+    Render a label for each parcel (dicts with ``LABEL_FIELDS``) and return
+    the PDF as an open temporary file positioned at its start.
+    """
+    layout = LAYOUTS[layout] if isinstance(layout, str) else layout
+    parcels = list(parcels)
+    qr_codes = render_qr_codes([label_payload(_Label(parcel)) for parcel in parcels], workers)
+
+    output = tempfile.TemporaryFile()
+    pdf = canvas.Canvas(output, pagesize=layout.page_size, pageCompression=1)
+    pdf.setTitle("Parcel labels")
+    for index, (parcel, qr) in enumerate(zip(parcels, qr_codes)):
+        slot = index % layout.per_page
+        if index and not slot:
+            pdf.showPage()
+        _draw_label(pdf, layout, slot, parcel, qr)
+    pdf.save()
+    output.seek(0)
+    return output
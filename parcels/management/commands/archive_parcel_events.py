@@ -0,0 +1,107 @@
+"""
+Monthly archival of the parcel event log.
+
+``ParcelEvent`` is append-only and every query against it is bounded by
+``created_at`` (timeline, shop window, SLA reports), so it is managed in whole
+calendar months: each month older than ``--keep-months`` is written to
+``archives/parcel-events-YYYY-MM.jsonl.gz`` in default storage and then deleted
+in chunks through the ``created_at`` index. Archives are never overwritten: if
+a run dies while deleting, the next run writes the rows still in the table to
+a new ``-partN`` file next to the first. On Postgres the same boundaries can
+be used to range-partition the table by month; the archive step then becomes
+detaching and dumping a partition.
+"""
+import gzip
+import json
+import tempfile
+from datetime import datetime
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from parcels.models import ParcelEvent
+
+ARCHIVE_DIR = "archives"
+FIELDS = ("id", "parcel_id", "kind", "from_status", "to_status", "actor_id", "shop_id", "location", "created_at")
+
+
+def archive_name(label):
+    """The first free archive name for month ``label``: the plain name, then ``-part2``, ``-part3``, ..."""
+    name, part = f"{ARCHIVE_DIR}/parcel-events-{label}.jsonl.gz", 1
+    while default_storage.exists(name):
+        part += 1
+        name = f"{ARCHIVE_DIR}/parcel-events-{label}-part{part}.jsonl.gz"
+    return name
+
+
+def month_start(year, month):
+    return timezone.make_aware(datetime(year, month, 1))
+
+
+def next_month(start):
+    if start.month == 12:
+        return month_start(start.year + 1, 1)
+    return month_start(start.year, start.month + 1)
+
+
+class Command(BaseCommand):
+    help = "Archive parcel events older than N months to gzipped JSON lines and delete them."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-months", type=int, default=12, help="Whole months to keep in the table.")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+        parser.add_argument("--dry-run", action="store_true", help="Only report what would be archived.")
+
+    def handle(self, *args, **options):
+        now = timezone.localtime()
+        year, month = now.year, now.month - options["keep_months"]
+        while month < 1:
+            year, month = year - 1, month + 12
+        cutoff = month_start(year, month)
+
+        oldest = ParcelEvent.objects.filter(created_at__lt=cutoff).order_by("created_at").first()
+        if oldest is None:
+            self.stdout.write("Nothing to archive.")
+            return
+
+        created = timezone.localtime(oldest.created_at)
+        start = month_start(created.year, created.month)
+        while start < cutoff:
+            end = next_month(start)
+            self.archive_month(start, end, options)
+            start = end
+
+    def archive_month(self, start, end, options):
+        events = ParcelEvent.objects.filter(created_at__gte=start, created_at__lt=end)
+        label = start.strftime("%Y-%m")
+        if options["dry_run"]:
+            self.stdout.write(f"Would archive {events.count()} event(s) from {label}")
+            return
+
+        written = 0
+        last_id = 0
+        with tempfile.TemporaryFile() as tmp:
+            with gzip.GzipFile(fileobj=tmp, mode="wb") as out:
+                for row in events.order_by("id").values(*FIELDS).iterator(chunk_size=options["chunk_size"]):
+                    row["created_at"] = row["created_at"].isoformat()
+                    out.write((json.dumps(row) + "\n").encode("utf-8"))
+                    written += 1
+                    last_id = row["id"]
+            if not written:
+                return
+            tmp.seek(0)
+            name = default_storage.save(archive_name(label), File(tmp))
+
+        # Only what was written is deleted, even if late events arrived meanwhile.
+        deleted = 0
+        while True:
+            with transaction.atomic():
+                ids = list(events.filter(id__lte=last_id).values_list("id", flat=True)[:options["chunk_size"]])
+                if not ids:
+                    break
+                deleted += ParcelEvent.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f"Archived {written} event(s) from {label} to {name}; deleted {deleted}."))
@@ -0,0 +1,72 @@
+import math
+import sqlite3
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+
+from parcels.models import NumberSequence
+from parcels.numbering import NumberAllocator
+
+
+def uuid_tracking_number():
+    return str(uuid.uuid4()).replace('-', '')[:12].upper()
+
+
+def uuid_receipt_number():
+    return f"RCT-{uuid.uuid4().hex[:8].upper()}"
+
+
+def insert_seconds(numbers, batch=1000):
+    """Time inserting ``numbers`` into a fresh unique B-tree index."""
+    db = sqlite3.connect(":memory:")
+    db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, number TEXT NOT NULL UNIQUE)")
+    started = time.perf_counter()
+    for i in range(0, len(numbers), batch):
+        db.executemany("INSERT OR IGNORE INTO t (number) VALUES (?)", [(n,) for n in numbers[i:i + batch]])
+        db.commit()
+    elapsed = time.perf_counter() - started
+    db.close()
+    return elapsed
+
+
+class Command(BaseCommand):
+    help = "Compare the UUID-slice numbering scheme with parcels.numbering."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--count", type=int, default=100_000)
+        parser.add_argument("--block-size", type=int, default=100)
+
+    def handle(self, *args, **options):
+        count = options["count"]
+        name = "bench-%s" % uuid.uuid4().hex[:8]
+        allocator = NumberAllocator(name, "BN", block_size=options["block_size"])
+
+        try:
+            rows = []
+            for label, generate in (
+                ("uuid4()[:12] tracking", uuid_tracking_number),
+                ("uuid4()[:8] receipt", uuid_receipt_number),
+                ("allocator (hi/lo)", allocator.allocate),
+            ):
+                started = time.perf_counter()
+                numbers = [generate() for _ in range(count)]
+                generate_s = time.perf_counter() - started
+                collisions = count - len(set(numbers))
+                rows.append((label, generate_s, insert_seconds(numbers), collisions))
+
+            started = time.perf_counter()
+            numbers = allocator.allocate_many(count)
+            rows.append(("allocator (bulk)", time.perf_counter() - started, insert_seconds(numbers), count - len(set(numbers))))
+        finally:
+            NumberSequence.objects.filter(name=name).delete()
+
+        self.stdout.write(f"{count} numbers per scheme")
+        self.stdout.write(f"{'scheme':<24}{'generate s':>12}{'insert s':>12}{'collisions':>12}")
+        for label, generate_s, insert_s, collisions in rows:
+            self.stdout.write(f"{label:<24}{generate_s:>12.3f}{insert_s:>12.3f}{collisions:>12}")
+
+        # Birthday bound for the 8-hex receipt/invoice slices at this volume.
+        space = 16 ** 8
+        p = 1 - math.exp(-count * (count - 1) / (2 * space))
+        self.stdout.write(f"P(any collision) for {count} 8-hex numbers: {p:.1%}")
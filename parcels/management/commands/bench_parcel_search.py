@@ -0,0 +1,96 @@
+import os
+import random
+import sqlite3
+import statistics
+import string
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from parcels.search import SQLITE_TABLE, SQLITE_TRIGGERS, sqlite_query
+
+FIRST_NAMES = ["Achieng", "Wanjiru", "Otieno", "Kamau", "Mwangi", "Njeri", "Kiptoo", "Atieno", "Mutua", "Chebet"]
+LAST_NAMES = ["Odhiambo", "Kariuki", "Wafula", "Onyango", "Muthoni", "Kibet", "Nyambura", "Ochieng", "Maina"]
+TOWNS = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Thika", "Machakos", "Nyeri", "Meru", "Kitale"]
+
+
+def synthetic_rows(count, rng):
+    for i in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        reference = "AM%07d%s" % (i, "".join(rng.choices(string.ascii_uppercase, k=3)))
+        yield (
+            i, reference, f"{first} {last}", f"{rng.choice(TOWNS)} {rng.randint(1, 999)}",
+            f"{first}.{last}{i}@example.com".lower(),
+        )
+
+
+class Command(BaseCommand):
+    help = "Benchmark the SQLite FTS5 trigram parcel index against icontains-style LIKE scans."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1_000_000)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--scan-queries", type=int, default=5, help="LIKE scans to time for comparison.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        path = os.path.join(tempfile.mkdtemp(), "search_bench.sqlite3")
+        db = sqlite3.connect(path)
+        db.execute(
+            "CREATE TABLE parcels_parcel (id INTEGER PRIMARY KEY, reference TEXT UNIQUE, "
+            "customer_name TEXT NOT NULL, destination TEXT NOT NULL, customer_email TEXT)"
+        )
+        for statement in [SQLITE_TABLE, *SQLITE_TRIGGERS]:
+            db.execute(statement)
+
+        started = time.perf_counter()
+        rows = synthetic_rows(options["rows"], rng)
+        while True:
+            batch = [row for _, row in zip(range(10_000), rows)]
+            if not batch:
+                break
+            db.executemany("INSERT INTO parcels_parcel VALUES (?, ?, ?, ?, ?)", batch)
+            db.commit()
+        self.stdout.write(f"Inserted {options['rows']} rows (index kept by triggers) in {time.perf_counter() - started:.1f}s")
+
+        queries = []
+        for _ in range(options["queries"]):
+            kind = rng.randrange(3)
+            if kind == 0:
+                queries.append(("reference", "AM%07d" % rng.randint(1, options["rows"])))
+            elif kind == 1:
+                queries.append(("surname (broad)", rng.choice(LAST_NAMES)[:5]))
+            else:
+                queries.append(("town + number", f"{rng.choice(TOWNS)} {rng.randint(1, 999)}"))
+
+        timings = {}
+        for kind, query in queries:
+            sql, params = sqlite_query(query.split(), options["limit"])
+            started = time.perf_counter()
+            db.execute(sql.replace("%s", "?"), params).fetchall()
+            timings.setdefault(kind, []).append((time.perf_counter() - started) * 1000)
+
+        for kind, kind_timings in [("all", sum(timings.values(), [])), *sorted(timings.items())]:
+            kind_timings.sort()
+            p95 = kind_timings[max(int(len(kind_timings) * 0.95) - 1, 0)]
+            self.stdout.write(
+                f"FTS5 trigram, {kind:<16} p50 {statistics.median(kind_timings):6.1f} ms, "
+                f"p95 {p95:6.1f} ms, max {kind_timings[-1]:6.1f} ms"
+            )
+
+        scan = []
+        for _, query in queries[:options["scan_queries"]]:
+            started = time.perf_counter()
+            db.execute(
+                "SELECT id FROM parcels_parcel WHERE reference LIKE ? OR customer_name LIKE ? "
+                "OR destination LIKE ? OR customer_email LIKE ? LIMIT ?",
+                ["%" + query + "%"] * 4 + [options["limit"]],
+            ).fetchall()
+            scan.append((time.perf_counter() - started) * 1000)
+        if scan:
+            self.stdout.write(f"LIKE scan:    p50 {statistics.median(scan):.1f} ms over {len(scan)} queries")
+
+        db.close()
+        os.remove(path)
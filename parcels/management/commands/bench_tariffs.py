@@ -0,0 +1,131 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import time as clock
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.geo import distance_matrix, haversine_km
+from parcels import tariffs
+from parcels.models import DeliveryZone, Tariff, TariffPeriod
+from shops.models import Shop
+
+
+def db_quote(shop_id, destination, at):
+    """The same price read straight from the tables on every call, for comparison."""
+    shop = Shop.objects.get(pk=shop_id)
+    zone = DeliveryZone.objects.filter(name__iexact=destination).first()
+    if zone is None or shop.latitude is None:
+        return None
+    home = min(
+        DeliveryZone.objects.values_list("pk", "latitude", "longitude"),
+        key=lambda row: haversine_km(shop.latitude, shop.longitude, row[1], row[2]),
+    )[0]
+    km = Decimal(f"{haversine_km(shop.latitude, shop.longitude, zone.latitude, zone.longitude):.2f}")
+    tariff = (
+        Tariff.objects.filter(zone=zone, origin_zone_id=home).first()
+        or Tariff.objects.filter(zone=zone, origin_zone=None).first()
+    )
+    minute = tariffs.minute_of_week(at)
+    periods = TariffPeriod.objects.values_list("starts_at", "ends_at", "weekdays", "multiplier")
+    multiplier = tariffs.week_multipliers(periods)[minute]
+    if tariff is None:
+        return None, tariffs.money(tariffs.TARIFF_RIDER_PER_KM * km * multiplier)
+    return (
+        tariffs.money((tariff.base_fee + tariff.per_km_fee * km) * multiplier),
+        tariffs.money((tariff.rider_base + tariff.rider_per_km * km) * multiplier),
+    )
+
+
+def timed_us(calls, run):
+    timings = []
+    for args in calls:
+        started = time.perf_counter()
+        run(*args)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    timings.sort()
+    return statistics.mean(timings), timings[int(len(timings) * 0.95)]
+
+
+class Command(BaseCommand):
+    help = "Time tariff compilation and quotes from the compiled tables against pricing from the database per quote."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shops", type=int, default=1000)
+        parser.add_argument("--zones", type=int, default=200)
+        parser.add_argument("--quotes", type=int, default=100_000)
+        parser.add_argument("--db-quotes", type=int, default=500)
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        rng = random.Random(1)
+        try:
+            Shop.objects.bulk_create([
+                Shop(name=f"bench-{tag}-{i}", latitude=rng.uniform(-4.5, 4.5), longitude=rng.uniform(34.0, 41.5))
+                for i in range(options["shops"])
+            ])
+            zones = DeliveryZone.objects.bulk_create([
+                DeliveryZone(name=f"bench-{tag}-zone-{i}", latitude=rng.uniform(-4.5, 4.5), longitude=rng.uniform(34.0, 41.5))
+                for i in range(options["zones"])
+            ])
+            Tariff.objects.bulk_create([
+                Tariff(zone=zone, base_fee=150, per_km_fee=Decimal("2.50"), rider_base=50, rider_per_km=1)
+                for zone in zones[::2]
+            ])
+            TariffPeriod.objects.bulk_create([
+                TariffPeriod(name=f"bench-{tag}-rush", starts_at=clock(17), ends_at=clock(20), weekdays="01234", multiplier=Decimal("1.5")),
+                TariffPeriod(name=f"bench-{tag}-night", starts_at=clock(22), ends_at=clock(5), multiplier=Decimal("1.2")),
+            ])
+            tariffs.tables.invalidate()
+            self.run(options, tag, rng)
+        finally:
+            TariffPeriod.objects.filter(name__startswith=f"bench-{tag}-").delete()
+            DeliveryZone.objects.filter(name__startswith=f"bench-{tag}-").delete()
+            Shop.objects.filter(name__startswith=f"bench-{tag}-").delete()
+            tariffs.tables.invalidate()
+
+    def run(self, options, tag, rng):
+        shops = list(Shop.objects.filter(name__startswith=f"bench-{tag}-").values_list("pk", "latitude", "longitude"))
+        zones = list(DeliveryZone.objects.filter(name__startswith=f"bench-{tag}-").values_list("name", "latitude", "longitude"))
+        self.stdout.write(f"{len(shops)} shops x {len(zones)} zones = {len(shops) * len(zones):,} routes")
+
+        started = time.perf_counter()
+        distance_matrix([(lat, lon) for _, lat, lon in shops], [(lat, lon) for _, lat, lon in zones])
+        self.stdout.write(f"{'distance matrix':<28}{(time.perf_counter() - started) * 1000:>10.0f} ms")
+        started = time.perf_counter()
+        pairs = [
+            (shops[i][1], shops[i][2], zones[j][1], zones[j][2])
+            for i in range(len(shops)) for j in range(len(zones))
+        ]
+        for pair in pairs:
+            haversine_km(*pair)
+        self.stdout.write(f"{'haversine per pair':<28}{(time.perf_counter() - started) * 1000:>10.0f} ms")
+        started = time.perf_counter()
+        tariffs.tables.get()
+        self.stdout.write(f"{'full compile (after edit)':<28}{(time.perf_counter() - started) * 1000:>10.0f} ms")
+
+        now = timezone.now()
+        calls = [
+            (rng.choice(shops)[0], rng.choice(zones)[0], now + timezone.timedelta(minutes=rng.randrange(10080)))
+            for _ in range(options["quotes"])
+        ]
+        mean, p95 = timed_us(calls, tariffs.quote)
+        self.stdout.write(f"{'quote, compiled tables':<28}{mean:>10.1f} us mean {p95:>8.1f} us p95")
+
+        with CaptureQueriesContext(connection) as queries:
+            mean, p95 = timed_us(calls[: options["db_quotes"]], db_quote)
+        self.stdout.write(
+            f"{'quote, database per call':<28}{mean:>10.1f} us mean {p95:>8.1f} us p95, "
+            f"{len(queries) / options['db_quotes']:.0f} queries"
+        )
+        for shop_id, zone, at in calls[:200]:
+            quote = tariffs.quote(shop_id, zone, at)
+            if (quote.delivery_cost, quote.rider_pay) != db_quote(shop_id, zone, at):
+                self.stdout.write(self.style.ERROR(f"Mismatch for shop {shop_id} to {zone} at {at}"))
+                return
+        self.stdout.write(self.style.SUCCESS("Compiled and database prices agree."))
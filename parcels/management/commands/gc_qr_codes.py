@@ -0,0 +1,46 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from parcels.models import DeliveryNote
+from parcels.qr import QR_DIR
+
+
+class Command(BaseCommand):
+    help = "Delete QR code images that no delivery note uses any more."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only list the files that would be removed.")
+        parser.add_argument(
+            "--grace-hours", type=float, default=24,
+            help="Leave files younger than this alone; their delivery note may not be committed yet.",
+        )
+
+    def handle(self, *args, **options):
+        referenced = set(
+            DeliveryNote.objects.exclude(qr_code="").exclude(qr_code__isnull=True)
+            .values_list("qr_code", flat=True)
+        )
+        cutoff = timezone.now() - timedelta(hours=options["grace_hours"])
+        try:
+            _, files = default_storage.listdir(QR_DIR)
+        except FileNotFoundError:
+            files = []
+
+        removed = 0
+        for filename in files:
+            name = f"{QR_DIR}/{filename}"
+            if name in referenced or default_storage.get_modified_time(name) > cutoff:
+                continue
+            if options["dry_run"]:
+                self.stdout.write(f"Would remove {name}")
+            else:
+                default_storage.delete(name)
+            removed += 1
+
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {removed} orphaned QR file(s); {len(referenced)} still referenced."
+        ))
@@ -0,0 +1,45 @@
+import json
+import sys
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from parcels.importer import DEFAULT_CHUNK_SIZE, import_lines
+
+
+class Command(BaseCommand):
+    help = "Bulk-import parcels from a CSV or JSON-lines file, printing one NDJSON result per line."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin.")
+        parser.add_argument("--format", choices=("csv", "jsonl"), help="Defaults to the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--created-by", help="Username recorded as the parcels' creator.")
+        parser.add_argument("--quiet", action="store_true", help="Only print the summary.")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path.endswith(".csv") else "jsonl")
+
+        created_by = None
+        if options["created_by"]:
+            try:
+                created_by = get_user_model().objects.get(username=options["created_by"])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No user named {options['created_by']!r}")
+
+        stream = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+        totals = Counter()
+        try:
+            for result in import_lines(stream, fmt, created_by=created_by, chunk_size=options["chunk_size"]):
+                totals[result["status"]] += 1
+                if not options["quiet"]:
+                    self.stdout.write(json.dumps(result))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        self.stderr.write(self.style.SUCCESS(
+            f"{totals['created']} created, {totals['duplicate']} duplicate, {totals['invalid']} invalid"
+        ))
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from parcels.documents import process_pending, requeue_failed
+
+
+class Command(BaseCommand):
+    help = "Build pending invoices, receipts, delivery notes and QR codes in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--retry-failed", action="store_true", help="Also pick up parcels marked FAILED.")
+        parser.add_argument("--loop", action="store_true", help="Keep polling for new parcels.")
+        parser.add_argument("--sleep", type=float, default=2.0, help="Seconds to wait when the queue is empty.")
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            self.stdout.write(f"Requeued {requeue_failed()} failed parcel(s)")
+
+        total_ready = total_failed = 0
+        while True:
+            ready, failed = process_pending(batch_size=options["batch_size"])
+            total_ready += ready
+            total_failed += failed
+            if ready or failed:
+                self.stdout.write(f"Batch done: {ready} ready, {failed} failed")
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Documents built for {total_ready} parcel(s), {total_failed} failed."
+        ))
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0012_alter_parcel_tracking_number'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parcel',
+            name='documents_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='parcel',
+            name='documents_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='parcel',
+            name='documents_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20),
+        ),
+    ]
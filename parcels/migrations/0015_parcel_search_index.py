@@ -0,0 +1,72 @@
+from django.db import migrations
+
+SQLITE_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS parcels_parcel_search USING fts5(
+        reference, customer_name, destination, customer_email,
+        content='parcels_parcel', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS parcels_parcel_search_ai AFTER INSERT ON parcels_parcel BEGIN
+        INSERT INTO parcels_parcel_search(rowid, reference, customer_name, destination, customer_email)
+        VALUES (new.id, new.reference, new.customer_name, new.destination, new.customer_email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS parcels_parcel_search_ad AFTER DELETE ON parcels_parcel BEGIN
+        INSERT INTO parcels_parcel_search(parcels_parcel_search, rowid, reference, customer_name, destination, customer_email)
+        VALUES ('delete', old.id, old.reference, old.customer_name, old.destination, old.customer_email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS parcels_parcel_search_au AFTER UPDATE OF reference, customer_name, destination, customer_email ON parcels_parcel BEGIN
+        INSERT INTO parcels_parcel_search(parcels_parcel_search, rowid, reference, customer_name, destination, customer_email)
+        VALUES ('delete', old.id, old.reference, old.customer_name, old.destination, old.customer_email);
+        INSERT INTO parcels_parcel_search(rowid, reference, customer_name, destination, customer_email)
+        VALUES (new.id, new.reference, new.customer_name, new.destination, new.customer_email);
+    END
+    """,
+    "INSERT INTO parcels_parcel_search(parcels_parcel_search) VALUES ('rebuild')",
+]
+
+SQLITE_TEARDOWN = [
+    "DROP TRIGGER IF EXISTS parcels_parcel_search_ai",
+    "DROP TRIGGER IF EXISTS parcels_parcel_search_ad",
+    "DROP TRIGGER IF EXISTS parcels_parcel_search_au",
+    "DROP TABLE IF EXISTS parcels_parcel_search",
+]
+
+POSTGRES_SETUP = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS parcels_parcel_search_trgm ON parcels_parcel USING gin ("
+    "(coalesce(reference, '') || ' ' || customer_name || ' ' || destination || ' ' || coalesce(customer_email, ''))"
+    " gin_trgm_ops)",
+]
+
+POSTGRES_TEARDOWN = [
+    "DROP INDEX IF EXISTS parcels_parcel_search_trgm",
+]
+
+
+def install(apps, schema_editor):
+    statements = {"sqlite": SQLITE_SETUP, "postgresql": POSTGRES_SETUP}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def uninstall(apps, schema_editor):
+    statements = {"sqlite": SQLITE_TEARDOWN, "postgresql": POSTGRES_TEARDOWN}.get(schema_editor.connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0014_numbersequence'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
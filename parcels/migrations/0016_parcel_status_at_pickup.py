@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0015_parcel_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='parcel',
+            name='status',
+            field=models.CharField(choices=[('created', 'Created'), ('in_transit', 'In Transit'), ('at_pickup', 'Arrived at Pickup Agent'), ('delivered', 'Delivered'), ('returned', 'Returned'), ('cancelled', 'Cancelled')], default='created', max_length=20),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0016_parcel_status_at_pickup'),
+        ('shops', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ParcelEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('scan', 'Scan'), ('status', 'Status change')], max_length=10)),
+                ('from_status', models.CharField(blank=True, choices=[('created', 'Created'), ('in_transit', 'In Transit'), ('at_pickup', 'Arrived at Pickup Agent'), ('delivered', 'Delivered'), ('returned', 'Returned'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('to_status', models.CharField(blank=True, choices=[('created', 'Created'), ('in_transit', 'In Transit'), ('at_pickup', 'Arrived at Pickup Agent'), ('delivered', 'Delivered'), ('returned', 'Returned'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('location', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('parcel', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='parcels.parcel')),
+                ('shop', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='parcel_events', to='shops.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['parcel', 'created_at'], name='parcelevent_parcel_time'), models.Index(fields=['shop', 'created_at'], name='parcelevent_shop_time'), models.Index(fields=['created_at'], name='parcelevent_time')],
+            },
+        ),
+    ]
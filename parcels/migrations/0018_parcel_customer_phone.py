@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0017_parcelevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='parcel',
+            name='customer_phone',
+            field=models.CharField(blank=True, default='', max_length=20),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.0.6 on 2026-10-18 21:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parcels', '0018_parcel_customer_phone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=80, unique=True)),
+                ('aliases', models.CharField(blank=True, help_text='Other spellings, comma separated.', max_length=255)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TariffPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=80)),
+                ('starts_at', models.TimeField()),
+                ('ends_at', models.TimeField()),
+                ('weekdays', models.CharField(default='0123456', help_text='Days it applies, 0 = Monday.', max_length=7)),
+                ('multiplier', models.DecimalField(decimal_places=2, default=1, max_digits=4)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tariff',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_fee', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('per_km_fee', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('rider_base', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('rider_per_km', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('origin_zone', models.ForeignKey(blank=True, help_text="Leave empty for the zone's price from anywhere.", null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbound_tariffs', to='parcels.deliveryzone')),
+                ('zone', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tariffs', to='parcels.deliveryzone')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tariff',
+            constraint=models.UniqueConstraint(fields=('zone', 'origin_zone'), name='tariff_route_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='tariff',
+            constraint=models.UniqueConstraint(condition=models.Q(('origin_zone__isnull', True)), fields=('zone',), name='tariff_zone_default_unique'),
+        ),
+    ]
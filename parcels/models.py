@@ -1,14 +1,13 @@
 # parcels/models.py
 from django.dispatch import receiver
 from django.utils import timezone
-import uuid
 from django.db import models
 from django.conf import settings
-from parcels.utils import generate_qr_code, send_custom_email
+from django.core.exceptions import ValidationError
+from parcels.numbering import invoice_numbers, receipt_numbers, tracking_numbers
+from parcels.qr import qr_path
+from parcels.utils import scan_url
 from shops.models import Shop
-import qrcode
-from io import BytesIO
-from django.core.files import File
 from django.db import models
 from django.db.models.signals import post_save
 from django.dispatch import receiver
@@ -60,10 +59,19 @@ class Category(models.Model):
 class ParcelStatus(models.TextChoices):
     CREATED = "created", "Created"
     IN_TRANSIT = "in_transit", "In Transit"
+    AT_PICKUP = "at_pickup", "Arrived at Pickup Agent"
     DELIVERED = "delivered", "Delivered"
     RETURNED = "returned", "Returned"
     CANCELLED = "cancelled", "Cancelled"
 
+
+class DocumentStatus(models.TextChoices):
+    """Progress of the deferred invoice/receipt/delivery-note stage."""
+    PENDING = "pending", "Pending"
+    PROCESSING = "processing", "Processing"
+    READY = "ready", "Ready"
+    FAILED = "failed", "Failed"
+
 class Parcel(models.Model):
     STATUS_CHOICES = [
         ('PENDING', 'Pending Pickup'),
@@ -81,6 +89,7 @@ class Parcel(models.Model):
     # Customer details
     customer_name = models.CharField(max_length=255)
     customer_email = models.EmailField(blank=True, null=True)
+    customer_phone = models.CharField(max_length=20, blank=True, default="")  # pickup-ready SMS
     destination = models.CharField(max_length=255)
 
     # Costs & Payments
@@ -129,6 +138,13 @@ class Parcel(models.Model):
         max_length=20, choices=ParcelStatus.choices, default=ParcelStatus.CREATED
     )
 
+    # Documents (built later by parcels.documents, never inside the request)
+    documents_status = models.CharField(
+        max_length=20, choices=DocumentStatus.choices, default=DocumentStatus.PENDING, db_index=True
+    )
+    documents_claimed_at = models.DateTimeField(null=True, blank=True)
+    documents_error = models.TextField(blank=True, default="")
+
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -143,9 +159,42 @@ class Parcel(models.Model):
     def save(self, *args, **kwargs):
         if not self.tracking_number:
             # Generate a unique tracking number
-            self.tracking_number = str(uuid.uuid4()).replace('-', '')[:12].upper()
+            self.tracking_number = new_tracking_number()
         super().save(*args, **kwargs)
     
+def new_tracking_number():
+    return tracking_numbers.allocate()
+
+
+def new_tracking_numbers(count):
+    return tracking_numbers.allocate_many(count)
+
+
+def new_receipt_number():
+    return receipt_numbers.allocate()
+
+
+def new_receipt_numbers(count):
+    return receipt_numbers.allocate_many(count)
+
+
+def new_invoice_number():
+    return invoice_numbers.allocate()
+
+
+def new_invoice_numbers(count):
+    return invoice_numbers.allocate_many(count)
+
+
+class NumberSequence(models.Model):
+    """High-water mark of a parcels.numbering allocator; only ever grows."""
+    name = models.CharField(max_length=30, unique=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
 class Receipt(models.Model):
     parcel = models.ForeignKey(Parcel, on_delete=models.CASCADE, related_name="receipts")
     issued_at = models.DateTimeField(default=timezone.now)
@@ -157,7 +206,7 @@ class Receipt(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.receipt_number:
-            self.receipt_number = f"RCT-{uuid.uuid4().hex[:8].upper()}"
+            self.receipt_number = new_receipt_number()
         super().save(*args, **kwargs)
 
 
@@ -168,15 +217,8 @@ class DeliveryNote(models.Model):
     qr_code = models.ImageField(upload_to="qr_codes/", blank=True, null=True)
 
     def save(self, *args, **kwargs):
-        # Generate QR content (could be tracking URL or parcel ID)
-        qr_data = f"Parcel ID: {self.parcel.id}, Status: {self.parcel.status}"
-        
-        qr_img = qrcode.make(qr_data)
-        buffer = BytesIO()
-        qr_img.save(buffer, format="PNG")
-        file_name = f"parcel-{self.parcel.id}-qr.png"
-        
-        self.qr_code.save(file_name, File(buffer), save=False)
+        if not self.qr_code:
+            self.qr_code.name = qr_path(scan_url(self.parcel))
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -189,39 +231,107 @@ class Invoice(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.invoice_number:
-            self.invoice_number = f"INV-{uuid.uuid4().hex[:8].upper()}"
+            self.invoice_number = new_invoice_number()
         super().save(*args, **kwargs)
 
-@receiver(post_save, sender=Parcel)
-def handle_parcel_creation(sender, instance, created, **kwargs):
-    if created:
-        # Determine recipient email safely
-        recipient_email = None
-        if hasattr(instance, 'user') and instance.user:
-            recipient_email = getattr(instance.user, 'email', None)
-        # Optional: if you ever add a 'customer' field
-        elif hasattr(instance, 'customer') and instance.customer:
-            recipient_email = getattr(instance.customer, 'email', None)
-
-        # Generate invoice if unpaid
-        if instance.payment_status == "UNPAID":
-            Invoice.objects.get_or_create(parcel=instance)
-            if recipient_email:
-                send_custom_email(
-                    recipient_email,
-                    "Invoice Created",
-                    f"Invoice for parcel {instance.reference}"
-                )
-        else:
-            # Generate receipt if paid
-            Receipt.objects.get_or_create(parcel=instance, defaults={"amount": getattr(instance, 'amount', 0)})
-            if recipient_email:
-                send_custom_email(
-                    recipient_email,
-                    "Payment Receipt",
-                    f"Receipt for parcel {instance.reference}"
-                )
-
-        # Always create delivery note with QR
-        note, _ = DeliveryNote.objects.get_or_create(parcel=instance)
-        generate_qr_code(note)
+
+class ParcelEventKind(models.TextChoices):
+    SCAN = "scan", "Scan"
+    STATUS = "status", "Status change"
+
+
+class ParcelEvent(models.Model):
+    """
+    Append-only history of a parcel: rows are inserted in batches by
+    parcels.events and never updated. Old months are moved out by
+    ``manage.py archive_parcel_events``.
+    """
+    parcel = models.ForeignKey(Parcel, on_delete=models.CASCADE, related_name="events", db_index=False)
+    kind = models.CharField(max_length=10, choices=ParcelEventKind.choices)
+    from_status = models.CharField(max_length=20, choices=ParcelStatus.choices, blank=True)
+    to_status = models.CharField(max_length=20, choices=ParcelStatus.choices, blank=True)
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="+"
+    )
+    shop = models.ForeignKey(
+        Shop, on_delete=models.SET_NULL, null=True, blank=True, related_name="parcel_events", db_index=False
+    )
+    location = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # "timeline of parcel X"
+            models.Index(fields=["parcel", "created_at"], name="parcelevent_parcel_time"),
+            # "all events at shop Y in window Z"
+            models.Index(fields=["shop", "created_at"], name="parcelevent_shop_time"),
+            # monthly archival range scans
+            models.Index(fields=["created_at"], name="parcelevent_time"),
+        ]
+
+    def __str__(self):
+        return f"{self.parcel_id} {self.kind} {self.to_status} @ {self.created_at:%Y-%m-%d %H:%M}"
+
+
+# -------------------------
+# Delivery tariffs (parcels.tariffs)
+# -------------------------
+class DeliveryZone(models.Model):
+    """An area parcels are delivered to. ``Parcel.destination`` matches ``name`` or one of ``aliases``."""
+    name = models.CharField(max_length=80, unique=True)
+    aliases = models.CharField(max_length=255, blank=True, help_text="Other spellings, comma separated.")
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+
+    def __str__(self):
+        return self.name
+
+
+class Tariff(models.Model):
+    """
+    Prices for deliveries into ``zone``: from shops in ``origin_zone`` (a
+    route), or from any shop when it is empty. Costs grow by the km from the
+    shop to the zone.
+    """
+    zone = models.ForeignKey(DeliveryZone, on_delete=models.CASCADE, related_name="tariffs")
+    origin_zone = models.ForeignKey(
+        DeliveryZone, on_delete=models.CASCADE, null=True, blank=True, related_name="outbound_tariffs",
+        help_text="Leave empty for the zone's price from anywhere.",
+    )
+    base_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    per_km_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    rider_base = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    rider_per_km = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["zone", "origin_zone"], name="tariff_route_unique"),
+            models.UniqueConstraint(
+                fields=["zone"], condition=models.Q(origin_zone__isnull=True), name="tariff_zone_default_unique",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.origin_zone or 'Anywhere'} → {self.zone}"
+
+    def clean(self):
+        fees = {"base_fee": self.base_fee, "per_km_fee": self.per_km_fee,
+                "rider_base": self.rider_base, "rider_per_km": self.rider_per_km}
+        errors = {name: "Cannot be negative." for name, fee in fees.items() if fee is not None and fee < 0}
+        if not errors and not (self.rider_base or 0) + (self.rider_per_km or 0):
+            # Riders are paid from this; a delivery on the route must earn something.
+            errors["rider_base"] = "Set a rider base or a rider per-km rate."
+        if errors:
+            raise ValidationError(errors)
+
+
+class TariffPeriod(models.Model):
+    """A time-of-day multiplier on every tariff, e.g. 1.25 for the evening rush. May run past midnight."""
+    name = models.CharField(max_length=80)
+    starts_at = models.TimeField()
+    ends_at = models.TimeField()
+    weekdays = models.CharField(max_length=7, default="0123456", help_text="Days it applies, 0 = Monday.")
+    multiplier = models.DecimalField(max_digits=4, decimal_places=2, default=1)
+
+    def __str__(self):
+        return f"{self.name} ×{self.multiplier}"
@@ -0,0 +1,165 @@
+# parcels/numbering.py
+"""
+Time-ordered, collision-free document numbers.
+
+Numbers look like ``<prefix><yymmdd><sequence><check>``: tracking number
+``DA25101800001234`` plus a Luhn check digit, for example. The sequence comes from a
+``NumberSequence`` row, reserved a block at a time (hi/lo): one UPDATE hands a
+worker ``block_size`` numbers which it then issues from memory. Numbers only
+grow, so inserts land at the right edge of the unique index, and two workers
+can never hold the same block.
+
+A reservation always commits on its own. Called inside a transaction (an
+admin save, a document batch), it runs on a second connection private to
+the thread, so the ``NumberSequence`` row is locked for one UPDATE rather
+than until the caller commits. A number from a rolled-back transaction is
+simply never used. SQLite has one writer at a time anyway and a second
+connection would wait on the caller's own lock, so there the reservation
+joins the caller's transaction and takes one number at a time.
+"""
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+DEFAULT_BLOCK_SIZE = getattr(settings, "NUMBER_BLOCK_SIZE", 100)
+
+
+def luhn_check_digit(digits):
+    total = 0
+    for index, char in enumerate(reversed(digits)):
+        value = int(char)
+        if index % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+_stamp_cache = (0, "")
+_side = threading.local()
+
+
+def date_stamp():
+    """Local ``yymmdd``, recomputed at most once a second."""
+    global _stamp_cache
+    second = int(time.time())
+    if _stamp_cache[0] != second:
+        _stamp_cache = (second, timezone.localtime().strftime("%y%m%d"))
+    return _stamp_cache[1]
+
+
+class NumberAllocator:
+    def __init__(self, name, prefix, width=8, block_size=DEFAULT_BLOCK_SIZE):
+        self.name = name
+        self.prefix = prefix
+        self.width = width
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def reset(self):
+        """Forget the in-memory block (used after fork and in tests)."""
+        with self._lock:
+            self._next = self._end = 0
+
+    def _reserve(self, count):
+        """Reserve ``count`` sequence values in one round trip; returns the first."""
+        from .models import NumberSequence
+
+        if connection.in_atomic_block and connection.vendor != "sqlite":
+            return self._reserve_on_side(count)
+        sequence = NumberSequence.objects.filter(name=self.name)
+        with transaction.atomic():
+            if not sequence.update(next_value=F("next_value") + count):
+                NumberSequence.objects.get_or_create(name=self.name)
+                sequence.update(next_value=F("next_value") + count)
+            end = sequence.values_list("next_value", flat=True).get()
+        return end - count
+
+    def _reserve_on_side(self, count):
+        """``_reserve`` in a transaction of its own on this thread's side connection."""
+        from .models import NumberSequence
+
+        side = getattr(_side, "connection", None)
+        if side is None:
+            side = _side.connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        table = side.ops.quote_name(NumberSequence._meta.db_table)
+        try:
+            side.ensure_connection()
+            side.set_autocommit(False)
+            with side.cursor() as cursor:
+                cursor.execute(f"UPDATE {table} SET next_value = next_value + %s WHERE name = %s", [count, self.name])
+                if not cursor.rowcount:
+                    cursor.execute(f"INSERT INTO {table} (name, next_value) VALUES (%s, %s)", [self.name, 1 + count])
+                cursor.execute(f"SELECT next_value FROM {table} WHERE name = %s", [self.name])
+                end = cursor.fetchone()[0]
+            side.commit()
+            side.set_autocommit(True)
+        except Exception:
+            # Start again on a fresh connection next time (this also undoes a half-done reservation).
+            _side.connection = None
+            side.close()
+            raise
+        return end - count
+
+    def _take_block(self):
+        if connection.in_atomic_block and connection.vendor == "sqlite":
+            # This reservation is undone if the caller rolls back, so never
+            # keep the rest of a block we might lose.
+            return self._reserve(1)
+        start = self._reserve(self.block_size)
+        self._next, self._end = start + 1, start + self.block_size
+        return start
+
+    def format(self, value, stamp=None):
+        body = f"{stamp or date_stamp()}{value:0{self.width}d}"
+        return f"{self.prefix}{body}{luhn_check_digit(body)}"
+
+    def allocate(self):
+        with self._lock:
+            if self._next < self._end:
+                value = self._next
+                self._next += 1
+            else:
+                value = self._take_block()
+        return self.format(value)
+
+    def allocate_many(self, count):
+        """Issue ``count`` numbers with a single reservation (bulk imports)."""
+        if count <= 0:
+            return []
+        start = self._reserve(count)
+        stamp = date_stamp()
+        return [self.format(value, stamp) for value in range(start, start + count)]
+
+    def is_valid(self, number):
+        if not number.startswith(self.prefix):
+            return False
+        body, check = number[len(self.prefix):-1], number[-1:]
+        return body.isdigit() and check == luhn_check_digit(body)
+
+
+tracking_numbers = NumberAllocator("tracking", "DA")
+receipt_numbers = NumberAllocator("receipt", "RCT-")
+invoice_numbers = NumberAllocator("invoice", "INV-")
+
+ALLOCATORS = (tracking_numbers, receipt_numbers, invoice_numbers)
+
+
+
+def _reset_after_fork():
+    # A forked worker must not keep issuing from its parent's block, nor share its side connection.
+    global _side
+    _side = threading.local()
+    for allocator in ALLOCATORS:
+        allocator.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
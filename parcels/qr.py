@@ -0,0 +1,124 @@
+# parcels/qr.py
+"""
+Content-addressed QR code service.
+
+Every QR producer goes through here. Delivery notes store a PNG keyed by the
+SHA-256 of its payload under ``MEDIA_ROOT/qr_codes/<hash>.png``, so the same
+payload is encoded and stored once. Label sheets never store anything: they
+take 1-bit bitmaps (``qr_bitmaps``), kept in an in-process LRU alongside the
+PNGs.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import qrcode
+from PIL import Image
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+QR_DIR = "qr_codes"
+
+
+class _LRU:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_cache = _LRU(getattr(settings, "QR_CACHE_SIZE", 1024))
+
+
+def payload_key(payload):
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def storage_name(payload):
+    return f"{QR_DIR}/{payload_key(payload)}.png"
+
+
+def render_png(payload):
+    """Encode ``payload`` as a PNG. Uncached; use :func:`qr_path` instead."""
+    buffer = BytesIO()
+    qrcode.make(payload).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _store(name, png):
+    if default_storage.exists(name):
+        return
+    saved = default_storage.save(name, ContentFile(png))
+    if saved != name:
+        # Another worker stored the same payload first; drop our copy.
+        default_storage.delete(saved)
+
+
+def qr_path(payload):
+    """Return the storage name of the PNG for ``payload``, storing it if needed."""
+    name = storage_name(payload)
+    if not default_storage.exists(name):
+        png = _cache.get(payload_key(payload)) or render_png(payload)
+        _store(name, png)
+        _cache.set(payload_key(payload), png)
+    return name
+
+
+def encode_bitmap(payload, border=4):
+    """
+    Encode ``payload`` for print as ``(size, bits)``: a 1-bit image with one
+    pixel per module, for ``PIL.Image.frombytes("1", (size, size), bits)``.
+    The mask pattern is fixed; every mask scans, and searching all eight for
+    the "best" one is most of qrcode's encoding time. Uncached, so it is safe
+    to run in a pool worker; use :func:`qr_bitmaps` instead.
+    """
+    code = qrcode.QRCode(border=border, mask_pattern=0, error_correction=qrcode.constants.ERROR_CORRECT_M)
+    code.add_data(payload)
+    code.make(fit=True)
+    matrix = code.get_matrix()
+    image = Image.new("1", (len(matrix), len(matrix)), 1)
+    image.putdata([0 if dark else 1 for row in matrix for dark in row])
+    return len(matrix), image.tobytes()
+
+
+def _bitmap_key(payload):
+    return f"bitmap:{payload_key(payload)}"
+
+
+def qr_bitmaps(payloads, encode_many=None):
+    """
+    Return ``encode_bitmap(payload)`` for each payload, from the same LRU as
+    the PNGs. Each missing payload is encoded once, by ``encode_many(list)``
+    (in this process by default), and cached.
+    """
+    found = {}
+    for payload in payloads:
+        if payload not in found:
+            found[payload] = _cache.get(_bitmap_key(payload))
+    missing = [payload for payload, bitmap in found.items() if bitmap is None]
+    if missing:
+        encoded = (encode_many or (lambda batch: map(encode_bitmap, batch)))(missing)
+        for payload, bitmap in zip(missing, encoded):
+            found[payload] = bitmap
+            _cache.set(_bitmap_key(payload), bitmap)
+    return [found[payload] for payload in payloads]
@@ -0,0 +1,187 @@
+# parcels/search.py
+"""
+Indexed parcel search (reference, customer name, destination, e-mail).
+
+A parcel matches when every whitespace-separated term of the query occurs,
+ignoring case, in one of ``SEARCH_COLUMNS``, as with the old ``icontains``
+scans. All backends return the same parcels; only the ranking differs.
+
+- SQLite keeps an FTS5 trigram index (``parcels_parcel_search``) in sync
+  with ``parcels_parcel`` through triggers. Terms of three characters or
+  more are matched by the index and ranked by weighted bm25 inside the FTS
+  query. Shorter terms, which no trigram can match, are LIKE filters on the
+  same rows.
+- Postgres gets a pg_trgm GIN index over the columns; each term is an
+  ILIKE on it, ranked with reference hits first, then by similarity.
+- Other backends run the equivalent ``icontains`` filters.
+
+The index is created by migration 0015. SQLite drops a table's triggers
+when a migration rebuilds the table, so ``ensure_triggers`` puts them back
+(and rebuilds the index) after every ``migrate``.
+"""
+from functools import reduce
+from operator import and_, or_
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# Trigram indexes cannot match anything shorter than this.
+MIN_TRIGRAM_LENGTH = 3
+
+SEARCH_COLUMNS = ("reference", "customer_name", "destination", "customer_email")
+
+# bm25 weights follow SEARCH_COLUMNS: reference matters most.
+SQLITE_RANK = "bm25(10.0, 3.0, 1.0, 2.0)"
+
+SQLITE_TABLE = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS parcels_parcel_search USING fts5(
+        reference, customer_name, destination, customer_email,
+        content='parcels_parcel', content_rowid='id', tokenize='trigram'
+    )
+"""
+
+SQLITE_TRIGGERS = [
+    """
+    CREATE TRIGGER IF NOT EXISTS parcels_parcel_search_ai AFTER INSERT ON parcels_parcel BEGIN
+        INSERT INTO parcels_parcel_search(rowid, reference, customer_name, destination, customer_email)
+        VALUES (new.id, new.reference, new.customer_name, new.destination, new.customer_email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS parcels_parcel_search_ad AFTER DELETE ON parcels_parcel BEGIN
+        INSERT INTO parcels_parcel_search(parcels_parcel_search, rowid, reference, customer_name, destination, customer_email)
+        VALUES ('delete', old.id, old.reference, old.customer_name, old.destination, old.customer_email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS parcels_parcel_search_au AFTER UPDATE OF reference, customer_name, destination, customer_email ON parcels_parcel BEGIN
+        INSERT INTO parcels_parcel_search(parcels_parcel_search, rowid, reference, customer_name, destination, customer_email)
+        VALUES ('delete', old.id, old.reference, old.customer_name, old.destination, old.customer_email);
+        INSERT INTO parcels_parcel_search(rowid, reference, customer_name, destination, customer_email)
+        VALUES (new.id, new.reference, new.customer_name, new.destination, new.customer_email);
+    END
+    """,
+]
+SQLITE_TRIGGER_NAMES = ("parcels_parcel_search_ai", "parcels_parcel_search_ad", "parcels_parcel_search_au")
+
+POSTGRES_DOCUMENT = (
+    "(coalesce(reference, '') || ' ' || customer_name || ' ' || destination"
+    " || ' ' || coalesce(customer_email, ''))"
+)
+
+
+def ensure_triggers(using="default", **kwargs):
+    """``post_migrate`` receiver: restore the SQLite index triggers if a table rebuild dropped them."""
+    from django.db import connections
+
+    db = connections[using]
+    if db.vendor != "sqlite" or "parcels_parcel_search" not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s, %s, %s)",
+            SQLITE_TRIGGER_NAMES,
+        )
+        if cursor.fetchone()[0] == len(SQLITE_TRIGGER_NAMES):
+            return
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+        # Rows written while a trigger was missing are not in the index.
+        cursor.execute("INSERT INTO parcels_parcel_search(parcels_parcel_search) VALUES ('rebuild')")
+
+
+def like_pattern(term):
+    return "%%%s%%" % term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def fts_query(terms):
+    """Quote each term so user input is matched literally; terms are ANDed."""
+    return " ".join('"%s"' % term.replace('"', '""') for term in terms)
+
+
+def sqlite_query(terms, limit=None):
+    """``(sql, params)`` selecting the ids of parcels matching every term, best first when ``limit`` is set."""
+    indexed = [term for term in terms if len(term) >= MIN_TRIGRAM_LENGTH]
+    conditions, params = [], []
+    if indexed:
+        conditions.append("parcels_parcel_search MATCH %s")
+        params.append(fts_query(indexed))
+    for term in terms:
+        if len(term) < MIN_TRIGRAM_LENGTH:
+            conditions.append("(%s)" % " OR ".join(f"{column} LIKE %s ESCAPE '\\'" for column in SEARCH_COLUMNS))
+            params += [like_pattern(term)] * len(SEARCH_COLUMNS)
+    sql = "SELECT rowid FROM parcels_parcel_search WHERE " + " AND ".join(conditions)
+    if limit is None:
+        return sql, params
+    if indexed:
+        return sql + " AND rank MATCH %s ORDER BY rank LIMIT %s", params + [SQLITE_RANK, limit]
+    return sql + " ORDER BY rowid DESC LIMIT %s", params + [limit]
+
+
+def postgres_query(terms, limit=None):
+    """``sqlite_query`` for Postgres."""
+    sql = "SELECT id FROM parcels_parcel WHERE " + " AND ".join(f"{POSTGRES_DOCUMENT} ILIKE %s" for _ in terms)
+    params = [like_pattern(term) for term in terms]
+    if limit is None:
+        return sql, params
+    query = " ".join(terms)
+    return (
+        sql + " ORDER BY (coalesce(reference, '') ILIKE %s) DESC, "
+        f"similarity({POSTGRES_DOCUMENT}, %s) DESC, id DESC LIMIT %s",
+        params + [like_pattern(query), query, limit],
+    )
+
+
+def terms_filter(terms):
+    """The same match as a ``Q`` for backends without an index."""
+    return reduce(and_, (
+        reduce(or_, (Q(**{f"{column}__icontains": term}) for column in SEARCH_COLUMNS)) for term in terms
+    ))
+
+
+def _raw_query(terms, limit=None):
+    if connection.vendor == "sqlite":
+        return sqlite_query(terms, limit)
+    if connection.vendor == "postgresql":
+        return postgres_query(terms, limit)
+    return None
+
+
+def search_ids(query, limit=50):
+    """Return up to ``limit`` parcel ids matching ``query``, best match first."""
+    terms = (query or "").split()
+    if not terms:
+        return []
+
+    from .models import Parcel
+
+    raw = _raw_query(terms, limit)
+    if raw is None:
+        return list(Parcel.objects.filter(terms_filter(terms)).order_by("-id").values_list("id", flat=True)[:limit])
+    with connection.cursor() as cursor:
+        cursor.execute(*raw)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def filter_matching(queryset, query):
+    """``queryset`` narrowed to every parcel matching ``query``, unranked and uncapped (admin changelist)."""
+    terms = (query or "").split()
+    if not terms:
+        return queryset
+    raw = _raw_query(terms)
+    if raw is None:
+        return queryset.filter(terms_filter(terms))
+    return queryset.filter(id__in=RawSQL(*raw))
+
+
+def search(query, limit=50, queryset=None):
+    """Return matching parcels as a list, in rank order."""
+    from .models import Parcel
+
+    ids = search_ids(query, limit)
+    if not ids:
+        return []
+    queryset = Parcel.objects.all() if queryset is None else queryset
+    by_id = queryset.in_bulk(ids)
+    return [by_id[pk] for pk in ids if pk in by_id]
@@ -1,33 +1,139 @@
 # parcels/signals.py
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from .models import Parcel, Invoice, Receipt, DeliveryNote
-from .utils import generate_qr_code, send_custom_email
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+# Invoice/receipt/delivery-note generation used to run here on post_save.
+# It now lives in parcels.documents and runs outside the request
+# (manage.py process_parcel_documents); new parcels start as PENDING.
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
 
+from core.pubsub import publish_many
 
+from notifications.digest import queue_many as queue_notices
+from notifications.models import NoticeKind, SmsPriority
+from notifications.sms import enqueue_many as enqueue_sms
+from shops.models import Shop
+
+from .models import DeliveryZone, Parcel, ParcelStatus, Tariff, TariffPeriod
+from .tariffs import fill_delivery_costs, tables as tariff_tables
+from .tracking import invalidate
+
+# Sent once per bulk insert (parcels.importer) with ``parcels=[Parcel, ...]``,
+# since bulk_create skips post_save.
+parcels_bulk_created = Signal()
+
+# Sent once per parcels.transitions.transition() call, after commit, with
+# ``moved=[(id, reference, previous_status), ...]``, ``to_status``, ``actor``
+# and ``context``.
+parcels_transitioned = Signal()
+
+
+@receiver(post_save, sender=Parcel)
+@receiver(post_delete, sender=Parcel)
+def invalidate_tracking_snapshot(sender, instance, **kwargs):
+    invalidate(instance.reference)
+
+
+# New parcels are priced from parcels.tariffs unless staff typed a delivery
+# cost in; parcels.importer does the same for bulk imports.
+@receiver(pre_save, sender=Parcel)
+def price_new_parcel(sender, instance, **kwargs):
+    if instance._state.adding:
+        fill_delivery_costs([instance])
+
+
+@receiver(post_save, sender=DeliveryZone)
+@receiver(post_delete, sender=DeliveryZone)
+@receiver(post_save, sender=Tariff)
+@receiver(post_delete, sender=Tariff)
+@receiver(post_save, sender=TariffPeriod)
+@receiver(post_delete, sender=TariffPeriod)
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def invalidate_tariffs(sender, **kwargs):
+    transaction.on_commit(tariff_tables.invalidate)
+
+
+@receiver(parcels_bulk_created)
+def invalidate_bulk_tracking_snapshots(sender, parcels, **kwargs):
+    # New references may still be cached as "not found".
+    invalidate(*(parcel.reference for parcel in parcels))
+
+
+@receiver(parcels_transitioned)
+def invalidate_transitioned_tracking_snapshots(sender, moved, **kwargs):
+    invalidate(*(reference for _, reference, _ in moved))
+
+
+# Tracking pages listen on "parcel:<reference>" (parcels.views.track_parcel_stream).
+@receiver(parcels_transitioned)
+def publish_status_changes(sender, moved, to_status, context, **kwargs):
+    now = timezone.now()
+    event = {
+        "status": to_status,
+        "status_display": ParcelStatus(to_status).label,
+        "at": now.isoformat(),
+        "when": timezone.localtime(now).strftime("%d %b %Y %H:%M"),
+        "location": context.get("location", ""),
+    }
+    publish_many(
+        (f"parcel:{reference}", "status", dict(event, reference=reference))
+        for _, reference, _ in moved if reference
+    )
+
+
+def _creation_notices(parcel):
+    if parcel.assigned_to_id:
+        yield (
+            parcel.assigned_to_id,
+            f"📦 New parcel assigned: {parcel.tracking_number} → {parcel.destination}",
+            "New Parcel Assigned",
+            NoticeKind.PARCEL_ASSIGNED,
+            None,
+        )
+    if parcel.customer_id:
+        yield (
+            parcel.customer_id,
+            f"📦 Your parcel {parcel.tracking_number} has been created. Destination: {parcel.destination}",
+            "Your Parcel is Registered",
+            NoticeKind.PARCEL_REGISTERED,
+            None,
+        )
+
+
+# Creation notices are coalesced (notifications.digest): an agent assigned
+# 14 parcels in a few minutes gets one "14 new parcels assigned".
 @receiver(post_save, sender=Parcel)
-def handle_parcel_creation(sender, instance, created, **kwargs):
+def notify_parcel_created(sender, instance, created, **kwargs):
     if created:
-        if instance.payment_status == "UNPAID":
-            Invoice.objects.get_or_create(parcel=instance)
-            if instance.customer and instance.customer.email:
-                send_custom_email(
-                    instance.customer.email,
-                    "Invoice Created",
-                    f"Invoice for parcel {instance.reference}"
-                )
-        else:
-            # Generate receipt if paid
-            Receipt.objects.get_or_create(parcel=instance, defaults={"amount": getattr(instance, 'amount', 0)})
-            if instance.customer and instance.customer.email:
-                send_custom_email(
-                    instance.customer.email,
-                    "Payment Receipt",
-                    f"Receipt for parcel {instance.reference}"
-                )
-
-        # Always create delivery note with QR
-        note, _ = DeliveryNote.objects.get_or_create(parcel=instance)
-        generate_qr_code(note)
+        queue_notices(_creation_notices(instance))
+
+
+@receiver(parcels_bulk_created)
+def notify_bulk_created(sender, parcels, **kwargs):
+    queue_notices(notice for parcel in parcels for notice in _creation_notices(parcel))
+
+
+# Pickup-ready texts are the most time-sensitive message we send. They are only
+# queued here (one INSERT per scan batch, after commit) and go out urgent-first
+# from `manage.py drain_sms`.
+@receiver(parcels_transitioned)
+def queue_pickup_ready_sms(sender, moved, to_status, context, **kwargs):
+    if to_status != ParcelStatus.AT_PICKUP:
+        return
+    parcels = (
+        Parcel.objects.filter(id__in=[parcel_id for parcel_id, _, _ in moved]).exclude(customer_phone="")
+        .values_list("id", "customer_name", "customer_phone", "reference", "tracking_number", "dispatch_to")
+    )
+    shop = context.get("shop")
+    shop_name = Shop.objects.filter(pk=shop).values_list("name", flat=True).first() if shop else None
+    messages, keys = [], []
+    for parcel_id, name, phone, reference, tracking_number, dispatch_to in parcels:
+        place = shop_name or dispatch_to or "your pickup point"
+        messages.append((
+            phone,
+            f"Hi {name}, parcel {reference or tracking_number} is ready for pickup at {place}. "
+            f"Quote {tracking_number} at the counter.",
+        ))
+        keys.append(f"pickup-ready:{parcel_id}")
+    enqueue_sms(messages, priority=SmsPriority.URGENT, dedupe_keys=keys)
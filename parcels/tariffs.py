@@ -0,0 +1,228 @@
+# parcels/tariffs.py
+"""
+Delivery prices and rider pay, worked out on the server.
+
+``quote(shop_id, destination, at)`` prices a delivery from a shop to the
+DeliveryZone that ``destination`` names (its name or one of its aliases):
+
+    km             shop to zone centre, great-circle
+    delivery_cost  (base_fee + per_km_fee x km) x multiplier
+    rider_pay      (rider_base + rider_per_km x km) x multiplier
+
+The Tariff used is the route from the shop's own zone (the zone nearest the
+shop), else the zone's tariff from anywhere. A zone without a tariff has no
+``delivery_cost`` (staff still type one in) and pays riders
+``TARIFF_RIDER_PER_KM``. The multiplier comes from the TariffPeriod covering
+``at`` in local time; where periods overlap the highest wins.
+
+Nothing is read from the database per quote. ``tables`` compiles every
+shop x zone pair once: the distance matrix (core.geo.distance_matrix), the
+prices before the multiplier, and a multiplier for every minute of the
+week. A quote is then three lookups and the rounding, plus two
+multiplications inside a period.
+
+parcels.signals calls ``tables.invalidate()`` after any zone, tariff,
+period or shop is saved or deleted, once the transaction commits. The next
+quote in each process compiles a complete new set and swaps it in with one
+assignment, so a quote sees the old tariffs or the new ones, never a mix.
+Other processes notice within a second through a version number in the
+cache, or after ``TARIFF_MAX_AGE`` seconds when the cache is per process.
+"""
+import threading
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from core.geo import distance_matrix
+from shops.models import Shop
+
+from .models import DeliveryZone, Tariff, TariffPeriod
+
+TARIFF_RIDER_PER_KM = Decimal(str(getattr(settings, "TARIFF_RIDER_PER_KM", "60.00")))  # zones without a tariff
+TARIFF_MAX_AGE = getattr(settings, "TARIFF_MAX_AGE", 300)  # seconds
+TARIFF_CHECK_INTERVAL = 1.0  # seconds between looks at the shared version number
+
+CENTS = Decimal("0.01")
+ONE = Decimal("1")
+MINUTES_PER_DAY = 24 * 60
+MINUTES_PER_WEEK = 7 * MINUTES_PER_DAY
+
+
+class Quote(NamedTuple):
+    zone: str
+    distance_km: Decimal
+    delivery_cost: Optional[Decimal]  # None when the zone has no tariff
+    rider_pay: Decimal
+    multiplier: Decimal
+
+
+class CompiledTariffs(NamedTuple):
+    zones: dict  # zone_key(name or alias) -> (zone_id, name)
+    prices: dict  # (shop_id, zone_id) -> (km, delivery_cost or None, rider_pay), unrounded, before the multiplier
+    multipliers: list  # minute of the week (Monday 00:00 = 0) -> multiplier
+
+
+def zone_key(name):
+    return " ".join(name.casefold().split())
+
+
+def money(amount):
+    return amount.quantize(CENTS, rounding=ROUND_HALF_UP) if amount is not None else None
+
+
+def minute_of_week(at):
+    local = timezone.localtime(at)
+    return local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute
+
+
+def week_multipliers(periods):
+    """One multiplier per minute of the week from ``(starts_at, ends_at, weekdays, multiplier)`` rows."""
+    table = [None] * MINUTES_PER_WEEK
+    for starts_at, ends_at, weekdays, multiplier in periods:
+        start = starts_at.hour * 60 + starts_at.minute
+        length = (ends_at.hour * 60 + ends_at.minute - start) % MINUTES_PER_DAY or MINUTES_PER_DAY
+        for day in {int(day) for day in weekdays if day in "0123456"}:
+            first = day * MINUTES_PER_DAY + start
+            for minute in range(first, first + length):
+                minute %= MINUTES_PER_WEEK  # Sunday night runs into Monday
+                if table[minute] is None or multiplier > table[minute]:
+                    table[minute] = multiplier
+    return [ONE if multiplier is None else multiplier for multiplier in table]
+
+
+def compile_tariffs():
+    zones = list(DeliveryZone.objects.order_by("pk").values_list("pk", "name", "aliases", "latitude", "longitude"))
+    shops = list(
+        Shop.objects.exclude(latitude=None).exclude(longitude=None).values_list("pk", "latitude", "longitude")
+    )
+    tariffs = {
+        (origin_zone_id, zone_id): rates
+        for origin_zone_id, zone_id, *rates in Tariff.objects.values_list(
+            "origin_zone_id", "zone_id", "base_fee", "per_km_fee", "rider_base", "rider_per_km",
+        )
+    }
+
+    names = {}
+    for zone_id, name, aliases, _, _ in zones:
+        for alias in [name, *aliases.split(",")]:
+            if zone_key(alias):
+                names.setdefault(zone_key(alias), (zone_id, name))
+
+    matrix = distance_matrix(
+        [(lat, lon) for _, lat, lon in shops], [(lat, lon) for _, _, _, lat, lon in zones],
+    )
+    prices = {}
+    for (shop_id, _, _), row in zip(shops, matrix):
+        home_zone_id = zones[min(range(len(row)), key=row.__getitem__)][0] if row else None
+        for (zone_id, *_), km in zip(zones, row):
+            km = Decimal(f"{km:.2f}")
+            rates = tariffs.get((home_zone_id, zone_id)) or tariffs.get((None, zone_id))
+            if rates is None:
+                prices[shop_id, zone_id] = (km, None, TARIFF_RIDER_PER_KM * km)
+                continue
+            base_fee, per_km_fee, rider_base, rider_per_km = rates
+            prices[shop_id, zone_id] = (km, base_fee + per_km_fee * km, rider_base + rider_per_km * km)
+
+    multipliers = week_multipliers(
+        TariffPeriod.objects.values_list("starts_at", "ends_at", "weekdays", "multiplier")
+    )
+    return CompiledTariffs(names, prices, multipliers)
+
+
+class TariffTables:
+    """The CompiledTariffs of this process, recompiled on the first quote after ``invalidate()``."""
+    version_key = "tariffs:version"
+
+    def __init__(self, max_age=TARIFF_MAX_AGE):
+        self.max_age = max_age
+        self._compiled = None
+        self._version = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        self._stale = True
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            cache.set(self.version_key, 1, None)
+
+    def _needs_rebuild(self, now):
+        if self._compiled is None or self._stale or now - self._built_at > self.max_age:
+            return True
+        if now - self._checked_at < TARIFF_CHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        if cache.get(self.version_key) != self._version:
+            self._stale = True
+        return self._stale
+
+    def get(self):
+        now = time.monotonic()
+        if self._needs_rebuild(now):
+            with self._lock:
+                if self._needs_rebuild(now):
+                    # Read the version first: an edit during the compile is picked up next time.
+                    version = cache.get(self.version_key)
+                    self._stale = False
+                    self._compiled = compile_tariffs()
+                    self._version = version
+                    self._built_at = time.monotonic()
+        return self._compiled
+
+
+tables = TariffTables()
+
+
+# -------------------------
+# API
+# -------------------------
+def find_zone(compiled, destination):
+    """``(zone_id, name)`` for a destination such as "Nakuru" or "Nakuru, Section 58", or None."""
+    key = zone_key(destination or "")
+    zone = compiled.zones.get(key)
+    if zone is None and "," in key:
+        zone = compiled.zones.get(zone_key(key.split(",", 1)[0]))
+    return zone
+
+
+def quote(shop_id, destination, at=None):
+    """The Quote for a delivery from shop ``shop_id`` to ``destination`` at ``at`` (default now), or None."""
+    compiled = tables.get()
+    zone = find_zone(compiled, destination)
+    if zone is None:
+        return None
+    price = compiled.prices.get((shop_id, zone[0]))
+    if price is None:
+        return None  # unknown shop, or one without a position
+    km, delivery_cost, rider_pay = price
+    multiplier = compiled.multipliers[minute_of_week(at or timezone.now())]
+    if multiplier != ONE:
+        delivery_cost = delivery_cost * multiplier if delivery_cost is not None else None
+        rider_pay = rider_pay * multiplier
+    return Quote(zone[1], km, money(delivery_cost), money(rider_pay), multiplier)
+
+
+def quote_parcel(parcel, at=None):
+    if parcel.origin_shop_id is None:
+        return None
+    return quote(parcel.origin_shop_id, parcel.destination, at)
+
+
+def fill_delivery_costs(parcels, at=None):
+    """Price unsaved ``parcels`` that have no delivery cost yet. Returns how many were priced."""
+    priced = 0
+    for parcel in parcels:
+        if parcel.delivery_cost:
+            continue
+        found = quote_parcel(parcel, at)
+        if found is not None and found.delivery_cost is not None:
+            parcel.delivery_cost = found.delivery_cost
+            priced += 1
+    return priced
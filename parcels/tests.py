@@ -1,3 +1,632 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import re
+import tempfile
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models.query import QuerySet
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from notifications.models import OutboxEmail
+from shops.models import Shop
+
+from . import documents, importer, labels, qr, search, tariffs
+from .admin import ParcelAdmin
+from .numbering import NumberAllocator, luhn_check_digit
+from .transitions import InvalidTransition, advance, transition, transition_one
+from .models import (
+    Category, DeliveryNote, DeliveryZone, DocumentStatus, Invoice, NumberSequence, Parcel, ParcelEvent, ParcelStatus,
+    PaymentStatus, Receipt, Tariff, TariffPeriod,
+)
+from .signals import parcels_bulk_created, parcels_transitioned
+from .utils import scan_url
+
+MEDIA_ROOT = tempfile.mkdtemp(prefix="parcels-tests-")
+
+
+class ParcelAdminActionQueryTests(TestCase):
+    """Admin actions must cost the same number of queries for 5 or 50 parcels."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser("admin", "admin@example.com", "pass")
+
+    def setUp(self):
+        self.model_admin = ParcelAdmin(Parcel, admin.site)
+
+    def make_parcels(self, count, prefix):
+        parcels = [
+            Parcel.objects.create(
+                reference=f"{prefix}{i}",
+                customer_name=f"Customer {i}",
+                customer_email=f"c{i}@example.com",
+                destination="Nairobi",
+                full_amount=100 + i,
+            )
+            for i in range(count)
+        ]
+        # Half of them already have a receipt to update.
+        for parcel in parcels[::2]:
+            Receipt.objects.create(parcel=parcel, amount=0)
+        return Parcel.objects.filter(reference__startswith=prefix)
+
+    def request(self):
+        request = RequestFactory().post("/admin/parcels/parcel/")
+        request.user = self.user
+        request.session = {}
+        request._messages = FallbackStorage(request)
+        return request
+
+    def count_queries(self, action, queryset):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(self.model_admin, action)(self.request(), queryset)
+        return len(queries)
+
+    def assertConstantQueries(self, action):
+        small = self.count_queries(action, self.make_parcels(5, "S-"))
+        large = self.count_queries(action, self.make_parcels(50, "L-"))
+        self.assertEqual(small, large)
+
+    def test_generate_receipt(self):
+        self.assertConstantQueries("generate_receipt")
+        self.assertEqual(Receipt.objects.filter(parcel__reference__startswith="L-").count(), 50)
+        self.assertFalse(Receipt.objects.filter(amount=0).exists())
+
+    def test_send_notification_email(self):
+        self.assertConstantQueries("send_notification_email")
+        self.assertEqual(OutboxEmail.objects.count(), 55)
+
+    def test_mark_as_scanned(self):
+        self.assertConstantQueries("mark_as_scanned")
+        self.assertFalse(Parcel.objects.exclude(status=ParcelStatus.IN_TRANSIT).exists())
+
+
+class NumberingTests(TransactionTestCase):
+
+    def test_check_digit_catches_typos(self):
+        self.assertEqual(luhn_check_digit("7992739871"), "3")
+        allocator = NumberAllocator("test-luhn", "DA")
+        number = allocator.format(1234, stamp="261018")
+        self.assertEqual(number, "DA26101800001234" + luhn_check_digit("26101800001234"))
+        self.assertTrue(allocator.is_valid(number))
+        self.assertFalse(allocator.is_valid(number[:-1] + str((int(number[-1]) + 1) % 10)))
+        self.assertFalse(allocator.is_valid(number[:5] + number[6] + number[5] + number[7:]))  # swapped digits
+        self.assertFalse(allocator.is_valid("RCT-" + number[2:]))
+        self.assertFalse(allocator.is_valid("DA12AB3"))
+
+    def test_workers_never_share_a_block(self):
+        first, second = NumberAllocator("test-blocks", "T", block_size=3), NumberAllocator("test-blocks", "T", block_size=3)
+        NumberSequence.objects.create(name="test-blocks")
+        with self.assertNumQueries(4):  # BEGIN, UPDATE, SELECT, COMMIT: one reservation for the block
+            numbers = [first.allocate() for _ in range(3)]
+        numbers += [allocator.allocate() for _ in range(4) for allocator in (first, second)]
+        numbers += second.allocate_many(5) + first.allocate_many(2)
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertTrue(all(first.is_valid(number) for number in numbers))
+        self.assertEqual(NumberSequence.objects.get(name="test-blocks").next_value, 1 + 5 * 3 + 5 + 2)  # five blocks of 3
+
+    def test_rolled_back_reservations_never_lose_a_block(self):
+        allocator = NumberAllocator("test-rollback", "T", block_size=5)
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            lost = allocator.allocate()
+            1 / 0
+        numbers = [allocator.allocate() for _ in range(6)]
+        self.assertEqual(len(set(numbers)), 6)
+        if connection.vendor == "sqlite":
+            # The reservation was undone with the caller, and no block was kept from it.
+            self.assertEqual(numbers[0], lost)
+        else:
+            # The block was reserved on the side connection and survived the rollback.
+            self.assertNotIn(lost, numbers)
+
+    def test_reservation_inside_a_transaction_commits_on_its_own(self):
+        if connection.vendor == "sqlite":
+            self.skipTest("SQLite reservations join the caller's transaction")
+        allocator = NumberAllocator("test-side", "T", block_size=10)
+        with transaction.atomic():
+            allocator.allocate_many(4)
+            # Visible to everyone else before the caller commits: the row lock is already released.
+            side = connections.create_connection(DEFAULT_DB_ALIAS)
+            try:
+                with side.cursor() as cursor:
+                    cursor.execute(
+                        f"SELECT next_value FROM {NumberSequence._meta.db_table} WHERE name = %s", ["test-side"]
+                    )
+                    self.assertEqual(cursor.fetchone()[0], 5)
+            finally:
+                side.close()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QrCacheTests(TestCase):
+
+    def setUp(self):
+        qr._cache.clear()
+
+    def test_payload_is_rendered_and_stored_once(self):
+        payload = f"qr-cache-test:{self.id()}"
+        with mock.patch.object(qr, "render_png", wraps=qr.render_png) as render:
+            name = qr.qr_path(payload)
+            qr._cache.clear()
+            self.assertEqual(qr.qr_path(payload), name)
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(name, qr.storage_name(payload))
+        self.assertTrue(default_storage.exists(name))
+
+    def test_gc_keeps_referenced_and_recent_files(self):
+        parcel = Parcel.objects.create(reference="Q-1", customer_name="C", destination="Nairobi")
+        DeliveryNote.objects.create(parcel=parcel)
+        note = qr.qr_path(scan_url(parcel))
+        orphan = qr.qr_path("orphan")
+        pending = qr.qr_path("note not committed yet")
+        day_old = timezone.now().timestamp() - 25 * 60 * 60
+        for name in (note, orphan):
+            os.utime(default_storage.path(name), (day_old, day_old))
+
+        call_command("gc_qr_codes", stdout=StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        for name in (note, pending):
+            self.assertTrue(default_storage.exists(name), name)
+
+
+class LabelTests(TestCase):
+
+    def setUp(self):
+        qr._cache.clear()
+
+    def rows(self, count):
+        return [
+            {"reference": f"L-{n}", "tracking_number": f"T{n:08}", "customer_name": "Wanjiku",
+             "destination": "Nakuru", "status": ParcelStatus.IN_TRANSIT}
+            for n in range(count)
+        ]
+
+    def test_sheet_has_one_page_per_grid(self):
+        with labels.render_labels(self.rows(22), "a4") as pdf:
+            data = pdf.read()
+        self.assertTrue(data.startswith(b"%PDF"))
+        self.assertEqual(len(re.findall(rb"/Type /Page\b(?!s)", data)), 2)
+
+    def test_bitmaps_come_from_the_qr_cache(self):
+        with mock.patch.object(labels, "encode_bitmap", wraps=qr.encode_bitmap) as encode:
+            labels.render_labels(self.rows(3), "thermal-62x100").close()
+            labels.render_labels(self.rows(4), "thermal-62x100").close()
+        self.assertEqual(encode.call_count, 4)
+
+    def test_large_batches_reuse_one_pool(self):
+        self.addCleanup(labels._discard_pool)
+        payloads = [f"pool-test:{n}" for n in range(labels.POOL_THRESHOLD)]
+        with mock.patch.object(labels, "LABEL_RENDER_WORKERS", 2):
+            first = labels.render_qr_codes(payloads)
+            pool = labels._pool
+            qr._cache.clear()
+            second = labels.render_qr_codes(payloads)
+        self.assertIsNotNone(pool)
+        self.assertIs(labels._pool, pool)
+        self.assertEqual([image.tobytes() for image in first], [image.tobytes() for image in second])
+        self.assertEqual(first[0].tobytes(), bytes(qr.encode_bitmap(payloads[0])[1]))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class DocumentStageTests(TestCase):
+
+    def make_parcels(self, count, **fields):
+        return [
+            Parcel.objects.create(
+                reference=f"D-{i}", customer_name="C", customer_email=f"d{i}@example.com", destination="Nairobi",
+                **fields,
+            )
+            for i in range(count)
+        ]
+
+    def test_claims_are_exclusive_and_stale_claims_are_taken_again(self):
+        parcels = self.make_parcels(3)
+        first = documents.claim_batch(batch_size=2)
+        self.assertEqual(first, [parcels[0].pk, parcels[1].pk])
+        self.assertEqual(documents.claim_batch(batch_size=5), [parcels[2].pk])
+        self.assertEqual(documents.claim_batch(batch_size=5), [])
+
+        Parcel.objects.filter(pk=first[0]).update(
+            documents_claimed_at=timezone.now() - documents.STALE_CLAIM_AFTER - timedelta(seconds=1)
+        )
+        self.assertEqual(documents.claim_batch(batch_size=5), [first[0]])
+
+    def test_batch_builds_each_document_once(self):
+        unpaid = self.make_parcels(1)[0]
+        paid = Parcel.objects.create(
+            reference="D-paid", customer_name="C", customer_email="p@example.com", destination="Nairobi",
+            payment_status=PaymentStatus.PAID, amount=250,
+        )
+        call_command("process_parcel_documents", stdout=StringIO())
+
+        self.assertFalse(Parcel.objects.exclude(documents_status=DocumentStatus.READY).exists())
+        self.assertTrue(Invoice.objects.filter(parcel=unpaid).exists())
+        self.assertFalse(Receipt.objects.filter(parcel=unpaid).exists())
+        self.assertEqual(Receipt.objects.get(parcel=paid).amount, 250)
+        self.assertEqual(DeliveryNote.objects.exclude(qr_code="").count(), 2)
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+
+        # Running the stage again (a rebuild, or a batch picked up twice) adds nothing.
+        Parcel.objects.update(documents_status=DocumentStatus.PENDING)
+        self.assertEqual(documents.process_pending(), (2, 0))
+        self.assertEqual(Invoice.objects.count() + Receipt.objects.count(), 2)
+        self.assertEqual(OutboxEmail.objects.count(), 2)
+
+    def test_one_bad_parcel_fails_alone_and_can_be_requeued(self):
+        good, bad = self.make_parcels(2)
+
+        def generate_qr_code(note):
+            if note.parcel_id == bad.pk:
+                raise OSError("disk full")
+            original(note)
+
+        original = documents.generate_qr_code
+        with mock.patch.object(documents, "generate_qr_code", generate_qr_code), self.assertLogs(documents.logger):
+            self.assertEqual(documents.process_pending(), (1, 1))
+
+        bad.refresh_from_db()
+        self.assertEqual(bad.documents_status, DocumentStatus.FAILED)
+        self.assertEqual(bad.documents_error, "disk full")
+        self.assertFalse(Invoice.objects.filter(parcel=bad).exists())
+        self.assertTrue(Invoice.objects.filter(parcel=good).exists())
+        self.assertEqual(documents.process_pending(), (0, 0))
+
+        self.assertEqual(documents.requeue_failed(), 1)
+        self.assertEqual(documents.process_pending(), (1, 0))
+        self.assertTrue(Invoice.objects.filter(parcel=bad).exists())
+
+
+class ImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name="Phones")
+        Parcel.objects.create(reference="I-0", customer_name="C", destination="Nairobi")
+
+    def row(self, reference, **fields):
+        return json.dumps(dict(reference=reference, customer_name="C", destination="Nakuru", **fields))
+
+    def test_rows_are_deduplicated_validated_and_announced_per_chunk(self):
+        announced = []
+
+        def receiver(sender, parcels, **kwargs):
+            announced.append(sorted(parcel.reference for parcel in parcels))
+
+        parcels_bulk_created.connect(receiver)
+        self.addCleanup(parcels_bulk_created.disconnect, receiver)
+        lines = [
+            self.row("I-1"), self.row("I-2", category="Phones"), self.row("I-1"),
+            self.row("I-0"), json.dumps({"reference": "I-3"}), self.row("I-4", category="Nope"),
+            self.row("I-5"), "not json",
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            results = list(importer.import_lines(lines, chunk_size=3))
+
+        self.assertEqual([result["line"] for result in results], list(range(1, 9)))
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["created", "created", "duplicate", "duplicate", "invalid", "invalid", "created", "invalid"],
+        )
+        self.assertEqual(announced, [["I-1", "I-2"], ["I-5"]])
+        self.assertEqual(Parcel.objects.get(reference="I-2").category, self.category)
+        self.assertTrue(Parcel.objects.get(reference="I-5").tracking_number)
+
+    def test_a_chunk_costs_the_same_queries_for_any_size(self):
+        def queries(prefix, count):
+            lines = [self.row(f"{prefix}{i}", category="Phones") for i in range(count)]
+            with CaptureQueriesContext(connection) as captured:
+                list(importer.import_lines(lines, chunk_size=count))
+            return len(captured)
+
+        self.assertEqual(queries("S-", 5), queries("L-", 25))
+
+    def test_command_and_endpoints(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as csv_file:
+            csv_file.write("reference,customer_name,destination\nC-1,C,Nakuru\nC-1,C,Nakuru\n")
+        self.addCleanup(os.remove, csv_file.name)
+        stderr = StringIO()
+        call_command("import_parcels", csv_file.name, "--quiet", stdout=StringIO(), stderr=stderr)
+        self.assertIn("1 created, 1 duplicate, 0 invalid", stderr.getvalue())
+
+        staff = get_user_model().objects.create_user("staff", password="pass", is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.post(reverse("import_parcels"), self.row("W-1"), content_type="application/x-ndjson")
+        self.assertEqual(json.loads(b"".join(response.streaming_content))["status"], "created")
+        self.assertEqual(Parcel.objects.get(reference="W-1").created_by, staff)
+
+        # Scripts use the token instead of a session and CSRF token.
+        script = Client(enforce_csrf_checks=True)
+        url = reverse("import_parcels_api")
+        with mock.patch.object(importer, "PARCEL_IMPORT_TOKEN", "s3cret"):
+            self.assertEqual(script.post(url, self.row("A-1"), content_type="application/x-ndjson").status_code, 403)
+            response = script.post(
+                url, "reference,customer_name,destination\nA-1,C,Nakuru\n",
+                content_type="text/csv", headers={"X-Import-Token": "s3cret"},
+            )
+            self.assertEqual(json.loads(b"".join(response.streaming_content))["status"], "created")
+        with mock.patch.object(importer, "PARCEL_IMPORT_TOKEN", ""):
+            response = script.post(
+                url, self.row("A-2"), content_type="application/x-ndjson", headers={"X-Import-Token": ""},
+            )
+            self.assertEqual(response.status_code, 403)
+
+
+class SearchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Parcel.objects.bulk_create([
+            Parcel(
+                reference=f"FILL-{i:04d}", tracking_number=f"FILL{i}", customer_name=f"Customer {i}",
+                destination="Kamau Road", customer_email=f"fill{i}@example.com",
+            )
+            for i in range(2100)
+        ])
+        # Created last, so a scan in rowid order reaches them after every filler.
+        cls.kamau = Parcel.objects.create(
+            reference="AM0000456KE", customer_name="Kamau Njeri", destination="Nakuru", customer_email="kn@example.com",
+        )
+        cls.short = Parcel.objects.create(reference="NB-77", customer_name="Jo Am", destination="Nairobi West")
+
+    def test_every_backend_matches_like_icontains(self):
+        for query in ["kamau", "am0000456", "jo", "Jo am", "am nak", "b-7", "%", "fill_1", "no such parcel"]:
+            with self.subTest(query=query):
+                expected = set(Parcel.objects.filter(search.terms_filter(query.split())).values_list("id", flat=True))
+                self.assertEqual(set(search.search_ids(query, limit=5000)), expected)
+
+    def test_best_matches_are_ranked_before_the_limit(self):
+        self.assertEqual(search.search_ids("Kamau", limit=1), [self.kamau.pk])
+        self.assertEqual(search.search_ids("am0000456", limit=1), [self.kamau.pk])
+        self.assertEqual(search.search(" Jo  Am ")[0], self.short)
+
+    def test_admin_search_is_not_capped(self):
+        request = RequestFactory().get("/admin/parcels/parcel/", {"q": "Road"})
+        results, _ = ParcelAdmin(Parcel, admin.site).get_search_results(request, Parcel.objects.all(), "Road")
+        self.assertEqual(results.count(), 2100)
+
+    def test_sqlite_index_is_used_and_survives_table_rebuilds(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("SQLite FTS5 index")
+        sql, params = search.sqlite_query(["Kamau"], 50)
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+            plan = " ".join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn("VIRTUAL TABLE INDEX", plan)
+            # What a migration that rebuilds parcels_parcel does to the triggers.
+            cursor.execute("DROP TRIGGER parcels_parcel_search_ai")
+        missed = Parcel.objects.create(reference="LOST-1", customer_name="Wanjiru", destination="Thika")
+        search.ensure_triggers()
+        found = Parcel.objects.create(reference="NEW-1", customer_name="Wanjiru", destination="Thika")
+        self.assertEqual(set(search.search_ids("wanjiru")), {missed.pk, found.pk})
+
+
+class TransitionTests(TestCase):
+
+    def make_parcels(self, prefix, statuses):
+        return [
+            Parcel.objects.create(reference=f"{prefix}{i}", customer_name="C", destination="Nairobi", status=status)
+            for i, status in enumerate(statuses)
+        ]
+
+    def test_only_allowed_moves_happen_and_are_announced_once(self):
+        parcels = self.make_parcels("M-", [
+            ParcelStatus.CREATED, ParcelStatus.IN_TRANSIT, ParcelStatus.IN_TRANSIT, ParcelStatus.DELIVERED,
+        ])
+        announced = []
+
+        def receiver(sender, moved, to_status, **kwargs):
+            announced.append((sorted(reference for _, reference, _ in moved), to_status))
+
+        parcels_transitioned.connect(receiver)
+        self.addCleanup(parcels_transitioned.disconnect, receiver)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = transition(Parcel.objects.filter(reference__startswith="M-"), ParcelStatus.AT_PICKUP, location="Hub")
+
+        self.assertEqual(sorted(result.references), ["M-1", "M-2"])
+        self.assertEqual(announced, [(["M-1", "M-2"], ParcelStatus.AT_PICKUP)])
+        self.assertEqual(
+            dict(Parcel.objects.filter(reference__startswith="M-").values_list("reference", "status")),
+            {"M-0": ParcelStatus.CREATED, "M-1": ParcelStatus.AT_PICKUP, "M-2": ParcelStatus.AT_PICKUP,
+             "M-3": ParcelStatus.DELIVERED},
+        )
+        self.assertEqual(
+            list(ParcelEvent.objects.filter(parcel=parcels[1]).values_list("from_status", "to_status", "location")),
+            [(ParcelStatus.IN_TRANSIT, ParcelStatus.AT_PICKUP, "Hub")],
+        )
+        with self.assertRaises(InvalidTransition):
+            transition_one(parcels[0], ParcelStatus.DELIVERED)
+        with self.assertRaises(InvalidTransition):
+            transition(Parcel.objects.all(), "lost")
+
+    def test_a_sack_costs_the_same_queries_as_one_parcel(self):
+        def queries(prefix, count):
+            self.make_parcels(prefix, [ParcelStatus.CREATED] * count)
+            with CaptureQueriesContext(connection) as captured:
+                transition(Parcel.objects.filter(reference__startswith=prefix), ParcelStatus.IN_TRANSIT)
+            return len(captured)
+
+        self.assertEqual(queries("ONE-", 1), queries("SACK-", 60))
+
+    def test_scan_flow(self):
+        parcel = self.make_parcels("F-", [ParcelStatus.CREATED])[0]
+        for expected in (ParcelStatus.IN_TRANSIT, ParcelStatus.AT_PICKUP, ParcelStatus.DELIVERED):
+            advance(parcel)
+            self.assertEqual(Parcel.objects.get(pk=parcel.pk).status, expected)
+        with self.assertRaises(InvalidTransition):
+            advance(parcel)
+
+    def test_scan_link_needs_a_login_and_a_post(self):
+        parcel = self.make_parcels("Q-", [ParcelStatus.CREATED])[0]
+        url = reverse("scan_qr", args=[parcel.reference])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.assertEqual(self.client.post(url).status_code, 302)
+
+        self.client.force_login(get_user_model().objects.create_user("hub", password="pass"))
+        response = self.client.get(url)
+        self.assertContains(response, "Mark as In Transit")
+        self.assertEqual(Parcel.objects.get(pk=parcel.pk).status, ParcelStatus.CREATED)
+
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(Parcel.objects.get(pk=parcel.pk).status, ParcelStatus.IN_TRANSIT)
+        Parcel.objects.filter(pk=parcel.pk).update(status=ParcelStatus.DELIVERED)
+        self.assertEqual(self.client.post(url).status_code, 409)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class EventArchiveTests(TestCase):
+
+    def setUp(self):
+        self.parcel = Parcel.objects.create(reference="E-1", customer_name="C", destination="Nairobi")
+        old = timezone.now() - timedelta(days=800)
+        self.label = timezone.localtime(old).strftime("%Y-%m")
+        self.events = ParcelEvent.objects.bulk_create([
+            ParcelEvent(parcel=self.parcel, kind="scan", created_at=old + timedelta(seconds=i)) for i in range(5)
+        ])
+
+    def archived_ids(self):
+        ids = []
+        _, files = default_storage.listdir("archives")
+        for name in sorted(files):
+            if name.startswith(f"parcel-events-{self.label}"):
+                with default_storage.open(f"archives/{name}", "rb") as fh:
+                    ids += [json.loads(line)["id"] for line in gzip.open(fh)]
+                default_storage.delete(f"archives/{name}")
+        return ids
+
+    def test_rerun_after_a_failed_delete_keeps_every_archived_event(self):
+        real_delete, calls = QuerySet.delete, []
+
+        def delete_then_die(queryset):
+            calls.append(1)
+            if len(calls) > 1:
+                raise ConnectionError("database went away")
+            return real_delete(queryset)
+
+        with mock.patch.object(QuerySet, "delete", delete_then_die), self.assertRaises(ConnectionError):
+            call_command("archive_parcel_events", "--chunk-size", "2", stdout=StringIO())
+        self.assertEqual(ParcelEvent.objects.count(), 3)
+
+        call_command("archive_parcel_events", "--chunk-size", "2", stdout=StringIO())
+        self.assertFalse(ParcelEvent.objects.exists())
+        archived = self.archived_ids()
+        self.assertEqual(sorted(set(archived)), sorted(event.pk for event in self.events))
+        self.assertEqual(len(archived), 8)  # the second part repeats the three rows the first run left
+
+
+class BulkScanTests(TestCase):
+
+    def test_unknown_shop_is_a_bad_request(self):
+        Parcel.objects.create(reference="B-1", customer_name="C", destination="Nairobi")
+        shop = Shop.objects.create(name="Hub")
+        self.client.force_login(get_user_model().objects.create_user("hub", password="pass", is_staff=True))
+        url = reverse("bulk_scan")
+        for bad in ("999999", "hub"):
+            response = self.client.post(url, {"references": "B-1", "shop": bad})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Parcel.objects.get(reference="B-1").status, ParcelStatus.CREATED)
+
+        response = self.client.post(url, {"references": "B-1, B-404", "shop": shop.pk})
+        self.assertEqual(response.json(), {"status": ParcelStatus.IN_TRANSIT, "moved": ["B-1"], "skipped": ["B-404"]})
+        self.assertEqual(ParcelEvent.objects.get().shop, shop)
+
+
+class TariffTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.shop = Shop.objects.create(name="CBD", latitude=-1.2864, longitude=36.8172)
+        cls.nairobi = DeliveryZone.objects.create(name="Nairobi", latitude=-1.2833, longitude=36.8167)
+        cls.nakuru = DeliveryZone.objects.create(name="Nakuru", aliases="Nakuru Town, NKR", latitude=-0.3031, longitude=36.0800)
+        cls.thika = DeliveryZone.objects.create(name="Thika", latitude=-1.0333, longitude=37.0693)
+        Tariff.objects.create(zone=cls.nakuru, base_fee=200, per_km_fee=2, rider_base=50, rider_per_km=1)
+        cls.route = Tariff.objects.create(
+            zone=cls.nakuru, origin_zone=cls.nairobi, base_fee=150, per_km_fee=2, rider_base=50, rider_per_km=1,
+        )
+        TariffPeriod.objects.create(name="Evening", starts_at=time(17), ends_at=time(20), weekdays="01234", multiplier=Decimal("1.5"))
+        TariffPeriod.objects.create(name="Sunday night", starts_at=time(22), ends_at=time(2), weekdays="6", multiplier=Decimal("1.2"))
+
+    def setUp(self):
+        cache.clear()
+        tariffs.tables.invalidate()
+
+    def at(self, day, hour):
+        return timezone.make_aware(datetime(2026, 10, 19 + day, hour))  # 19 Oct 2026 is a Monday
+
+    def test_quotes_come_from_compiled_tables(self):
+        tariffs.quote(self.shop.pk, "Nakuru")  # compile
+        with self.assertNumQueries(0):
+            quote = tariffs.quote(self.shop.pk, " nakuru town, Section 58 ", self.at(0, 10))
+        self.assertEqual(quote.zone, "Nakuru")
+        self.assertGreater(quote.distance_km, 100)
+        # The shop is in Nairobi, so the Nairobi -> Nakuru route wins over the zone's tariff from anywhere.
+        self.assertEqual(quote.delivery_cost, 150 + 2 * quote.distance_km)
+        self.assertEqual(quote.rider_pay, 50 + quote.distance_km)
+
+        evening = tariffs.quote(self.shop.pk, "NKR", self.at(0, 18))
+        self.assertEqual(evening.delivery_cost, (quote.delivery_cost * Decimal("1.5")).quantize(Decimal("0.01")))
+        self.assertEqual(tariffs.quote(self.shop.pk, "Nakuru", self.at(0, 1)).multiplier, Decimal("1.2"))
+        self.assertEqual(tariffs.quote(self.shop.pk, "Nakuru", self.at(6, 21)).multiplier, 1)
+
+        thika = tariffs.quote(self.shop.pk, "Thika", self.at(0, 10))
+        self.assertIsNone(thika.delivery_cost)
+        self.assertEqual(thika.rider_pay, tariffs.money(tariffs.TARIFF_RIDER_PER_KM * thika.distance_km))
+        self.assertIsNone(tariffs.quote(self.shop.pk, "Mombasa"))
+
+    def test_edits_reprice_after_commit_and_new_parcels_are_priced(self):
+        before = tariffs.quote(self.shop.pk, "Nakuru", self.at(0, 10))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.route.base_fee = 100
+            self.route.save()
+        self.assertEqual(tariffs.quote(self.shop.pk, "Nakuru", self.at(0, 10)).delivery_cost, before.delivery_cost - 50)
+
+        # Another process's edit only moves the shared version number.
+        Tariff.objects.filter(pk=self.route.pk).update(base_fee=120)
+        cache.incr(tariffs.TariffTables.version_key)
+        with mock.patch.object(tariffs, "TARIFF_CHECK_INTERVAL", 0):
+            self.assertEqual(tariffs.quote(self.shop.pk, "Nakuru", self.at(0, 10)).delivery_cost, before.delivery_cost - 30)
+
+        priced = Parcel.objects.create(reference="T-1", customer_name="C", destination="Nakuru", origin_shop=self.shop)
+        typed = Parcel.objects.create(
+            reference="T-2", customer_name="C", destination="Nakuru", origin_shop=self.shop, delivery_cost=999,
+        )
+        self.assertGreater(priced.delivery_cost, 0)
+        self.assertEqual(typed.delivery_cost, 999)
+
+    def test_quote_endpoint(self):
+        self.client.force_login(get_user_model().objects.create_user("staff", password="pass"))
+        url = reverse("parcel_quote")
+        response = self.client.get(url, {"shop": self.shop.pk, "destination": "Nakuru", "at": "2026-10-19T18:00:00+03:00"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["multiplier"], "1.50")
+        self.assertEqual(self.client.get(url, {"shop": self.shop.pk, "destination": "Mombasa"}).status_code, 404)
+        self.assertEqual(self.client.get(url, {"shop": "x", "destination": "Nakuru"}).status_code, 400)
+
+        # Naive times are local; impossible ones are a 400, not a 500.
+        naive = self.client.get(url, {"shop": self.shop.pk, "destination": "Nakuru", "at": "2026-10-19T18:00:00"})
+        self.assertEqual(naive.json(), response.json())
+        for at in ("2026-13-01T10:00:00", "2026-10-19T25:00:00", "soon"):
+            self.assertEqual(self.client.get(url, {"shop": self.shop.pk, "destination": "Nakuru", "at": at}).status_code, 400)
+
+    def test_tariffs_must_pay_riders(self):
+        with self.assertRaises(ValidationError) as caught:
+            Tariff(zone=self.thika).full_clean()
+        self.assertIn("rider_base", caught.exception.message_dict)
+        with self.assertRaises(ValidationError) as caught:
+            Tariff(zone=self.thika, rider_base=50, per_km_fee=-1).full_clean()
+        self.assertIn("per_km_fee", caught.exception.message_dict)
+        Tariff(zone=self.thika, rider_per_km=Decimal("0.50")).full_clean()
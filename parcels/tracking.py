@@ -0,0 +1,128 @@
+# parcels/tracking.py
+"""
+Read-through cache for public parcel tracking.
+
+``get_tracking_snapshot(reference)`` returns a small dict (the fields the
+tracking pages show, plus the recent event timeline) from the cache, loading
+it from the database on a miss. Concurrent misses for the same reference in one process wait for a single
+load (single-flight), and unknown references are cached briefly too, so
+repeated lookups of bad references never reach the database.
+
+Snapshots are dropped by the Parcel signal receivers in parcels.signals and
+by the bulk paths that write with ``update()``/``bulk_create``.
+"""
+import hashlib
+import re
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .events import timeline
+from .models import Parcel
+
+TRACKING_CACHE_TTL = getattr(settings, "TRACKING_CACHE_TTL", 300)
+TRACKING_NEGATIVE_TTL = getattr(settings, "TRACKING_NEGATIVE_TTL", 30)
+
+MISSING = "__missing__"
+
+# A whole reference rather than a name or a fragment: one token of at least
+# six characters with a digit in it ("REF-2025-0012", "AM10234").
+REFERENCE_PATTERN = re.compile(r"(?=.*\d)[A-Za-z0-9][A-Za-z0-9/_.-]{5,}")
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def looks_like_reference(text):
+    return bool(REFERENCE_PATTERN.fullmatch((text or "").strip()))
+
+
+def cache_key(reference):
+    digest = hashlib.sha1(reference.encode("utf-8")).hexdigest()
+    return f"tracking:{digest}"
+
+
+def build_snapshot(parcel, events=()):
+    return {
+        "reference": parcel.reference,
+        "tracking_number": parcel.tracking_number,
+        "status": parcel.status,
+        "status_display": parcel.get_status_display(),
+        "destination": parcel.destination,
+        "documents_status": parcel.documents_status,
+        "documents_status_display": parcel.get_documents_status_display(),
+        "updated_at": parcel.updated_at.isoformat() if parcel.updated_at else None,
+        "timeline": [
+            {
+                "status": event.get_to_status_display() or event.get_kind_display(),
+                "at": event.created_at.isoformat(),
+                "when": timezone.localtime(event.created_at).strftime("%d %b %Y %H:%M"),
+                "location": event.location or (event.shop.name if event.shop else ""),
+            }
+            for event in events
+        ],
+    }
+
+
+@contextmanager
+def _single_flight(key):
+    with _flights_lock:
+        lock, waiters = _flights.get(key, (None, 0))
+        if lock is None:
+            lock = threading.Lock()
+        _flights[key] = (lock, waiters + 1)
+    try:
+        with lock:
+            yield
+    finally:
+        with _flights_lock:
+            lock, waiters = _flights[key]
+            if waiters == 1:
+                del _flights[key]
+            else:
+                _flights[key] = (lock, waiters - 1)
+
+
+def _load(reference):
+    parcel = (
+        Parcel.objects.filter(reference=reference)
+        .only("reference", "tracking_number", "status", "destination", "documents_status", "updated_at")
+        .first()
+    )
+    return build_snapshot(parcel, timeline(parcel.id)) if parcel else None
+
+
+def get_tracking_snapshot(reference):
+    """Return the tracking snapshot for ``reference``, or ``None`` if unknown."""
+    reference = (reference or "").strip()
+    if not reference:
+        return None
+
+    key = cache_key(reference)
+    cached = cache.get(key)
+    if cached is None:
+        with _single_flight(key):
+            # Someone else may have loaded it while we waited.
+            cached = cache.get(key)
+            if cached is None:
+                snapshot = _load(reference)
+                if snapshot is None:
+                    cache.set(key, MISSING, TRACKING_NEGATIVE_TTL)
+                else:
+                    cache.set(key, snapshot, TRACKING_CACHE_TTL)
+                return snapshot
+    return None if cached == MISSING else cached
+
+
+def invalidate(*references):
+    keys = [cache_key(reference.strip()) for reference in references if reference]
+    if keys:
+        cache.delete_many(keys)
+
+
+def invalidate_parcels(parcel_ids):
+    """Drop snapshots for parcels changed with ``update()`` (one query)."""
+    invalidate(*Parcel.objects.filter(id__in=parcel_ids).values_list("reference", flat=True))
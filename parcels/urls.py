@@ -3,5 +3,9 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path("scan/<int:parcel_id>/", views.scan_qr, name="scan_qr"),
+    path("scan/<str:reference>/", views.scan_qr, name="scan_qr"),
+    path("scan-bulk/", views.bulk_scan_view, name="bulk_scan"),
+    path("import/", views.import_parcels_view, name="import_parcels"),
+    path("import/api/", views.import_parcels_api, name="import_parcels_api"),
+    path("quote/", views.quote_view, name="parcel_quote"),
 ]
@@ -1,31 +1,33 @@
 # parcels/utils.py
-import qrcode
-from django.core.files.base import ContentFile
-from io import BytesIO
-from django.core.files import File
+from parcels.qr import qr_path
+
+
+def scan_url(parcel):
+    return f"https://applemall.co.ke/parcel/{parcel.reference}/scan"
+
+
+def label_payload(parcel):
+    return f"REF:{parcel.reference}|STATUS:{parcel.status}"
+
 
 def generate_qr_code(delivery_note):
-    data = f"https://applemall.co.ke/parcel/{delivery_note.parcel.reference}/scan"
-    qr = qrcode.make(data)
-    buffer = BytesIO()
-    qr.save(buffer, format="PNG")
-    file_name = f"qr_{delivery_note.parcel.reference}.png"
-    delivery_note.qr_code.save(file_name, ContentFile(buffer.getvalue()), save=True)
+    delivery_note.qr_code.name = qr_path(scan_url(delivery_note.parcel))
+    delivery_note.save(update_fields=["qr_code"])
+
+from notifications.outbox import enqueue, enqueue_many
 
-from django.core.mail import send_mail
-from django.conf import settings
 
 def send_custom_email(subject, message, recipient_list, from_email=None):
     """
-    Simple wrapper around Django's send_mail.
+    Queue an e-mail in the outbox; it goes out once the current transaction
+    commits (see notifications.outbox).
+    """
+    enqueue(subject, message, recipient_list, from_email=from_email)
+
+
+def send_custom_emails(messages, from_email=None):
+    """
+    Queue many ``(subject, message, recipient_list)`` e-mails in one INSERT.
+    Returns the number queued.
     """
-    if from_email is None:
-        from_email = settings.DEFAULT_FROM_EMAIL
-
-    send_mail(
-        subject,
-        message,
-        from_email,
-        recipient_list,
-        fail_silently=False,
-    )
+    return enqueue_many(messages, from_email=from_email)
@@ -2,36 +2,173 @@ from django.shortcuts import render
 
 # Create your views here.
 # parcels/views.py
+from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect
 from django.http import HttpResponse
-from .models import Parcel
+from django.views.decorators.http import require_http_methods
+from .models import Parcel, ParcelStatus
+from .transitions import NEXT_ON_SCAN, InvalidTransition, advance
 
+@login_required
+@require_http_methods(["GET", "POST"])
 def scan_qr(request, reference):
     parcel = get_object_or_404(Parcel, reference=reference)
 
-    # Simple rule: update next status
-    if parcel.status == "CREATED":
-        parcel.status = "SHIPPING"
-    elif parcel.status == "SHIPPING":
-        parcel.status = "ARRIVED"
-    elif parcel.status == "ARRIVED":
-        parcel.status = "DELIVERED"
+    # Opening the QR link only shows what the scan would do; the change itself is a POST.
+    if request.method == "GET":
+        next_status = NEXT_ON_SCAN.get(parcel.status)
+        return render(request, "parcels/scan_confirm.html", {
+            "parcel": parcel,
+            "next_status": ParcelStatus(next_status) if next_status else None,
+        })
 
-    parcel.save()
-    return HttpResponse(f"Parcel {parcel.reference} status updated to {parcel.status}")
+    # Simple rule: move to the next status in the scan flow
+    try:
+        advance(parcel, actor=request.user)
+    except InvalidTransition as e:
+        return HttpResponse(str(e), status=409)
+
+    return HttpResponse(f"Parcel {parcel.reference} status updated to {parcel.get_status_display()}")
 
 from django.shortcuts import render, get_object_or_404
 from parcels.models import Parcel
+from parcels.tracking import get_tracking_snapshot
 
 def track_parcel_view(request):
     reference = request.GET.get('reference', '')
-    tracked_parcel = None
-    if reference:
-        try:
-            tracked_parcel = Parcel.objects.get(reference=reference)
-        except Parcel.DoesNotExist:
-            tracked_parcel = None
+    tracked_parcel = get_tracking_snapshot(reference) if reference else None
 
     return render(request, 'dashboards/client_dashboard.html', {
         'tracked_parcel': tracked_parcel,
+        'searched': bool(reference),
+    })
+
+from asgiref.sync import sync_to_async
+from django.http import Http404
+from core.sse import event_stream
+
+async def track_parcel_stream(request):
+    """
+    Status changes of one parcel as server-sent events, for the tracking
+    page instead of reloading it. Starts with the current status.
+    """
+    reference = request.GET.get('reference', '')
+    snapshot = await sync_to_async(get_tracking_snapshot)(reference) if reference else None
+    if snapshot is None:
+        raise Http404("No parcel with that reference")
+    current = {key: snapshot[key] for key in ("reference", "status", "status_display")}
+    return event_stream([f"parcel:{reference}"], initial=[("status", current)])
+
+import json
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from .importer import import_lines, valid_import_token
+
+def _import_response(request, created_by):
+    fmt = "csv" if request.content_type == "text/csv" else "jsonl"
+    results = import_lines(request, fmt, created_by=created_by)
+    return StreamingHttpResponse(
+        (json.dumps(result) + "\n" for result in results),
+        content_type="application/x-ndjson",
+    )
+
+@staff_member_required
+@require_POST
+def import_parcels_view(request):
+    """
+    Stream-import parcels. The body is JSON lines (default) or CSV
+    (``Content-Type: text/csv``); one NDJSON result is streamed back per line.
+    """
+    return _import_response(request, request.user)
+
+@csrf_exempt
+@require_POST
+def import_parcels_api(request):
+    """
+    ``import_parcels_view`` for scripts, authenticated by the
+    ``X-Import-Token`` header instead of a staff session and CSRF token:
+
+        curl -H "X-Import-Token: $TOKEN" -H "Content-Type: text/csv" \\
+             --data-binary @parcels.csv https://.../parcels/import/api/
+    """
+    if not valid_import_token(request.headers.get("X-Import-Token")):
+        return JsonResponse({"error": "Invalid token"}, status=403)
+    return _import_response(request, None)
+
+
+from shops.models import Shop
+from .events import record_scans
+from .transitions import transition
+
+@staff_member_required
+@require_POST
+def bulk_scan_view(request):
+    """
+    Hub scan of a whole sack: ``references`` (one per line or comma separated)
+    all move to ``status`` (default In Transit) in a single UPDATE.
+    """
+    to_status = request.POST.get("status", ParcelStatus.IN_TRANSIT)
+    if to_status not in ParcelStatus.values:
+        return JsonResponse({"error": f"Unknown status {to_status!r}"}, status=400)
+    references = {ref.strip() for ref in request.POST.get("references", "").replace(",", "\n").splitlines() if ref.strip()}
+    shop_id = request.POST.get("shop") or None
+    shop = None
+    if shop_id is not None:
+        shop = Shop.objects.filter(pk=shop_id).first() if shop_id.isdigit() else None
+        if shop is None:
+            return JsonResponse({"error": f"Unknown shop {shop_id!r}"}, status=400)
+    location = request.POST.get("location", "")
+
+    result = transition(
+        Parcel.objects.filter(reference__in=references), to_status,
+        actor=request.user, shop=shop, location=location,
+    )
+    moved = set(result.references)
+    # Parcels in the sack that did not change status are still logged as seen here.
+    seen_ids = Parcel.objects.filter(reference__in=references - moved).values_list("id", flat=True)
+    record_scans(list(seen_ids), actor=request.user, shop=shop, location=location)
+    return JsonResponse({
+        "status": to_status,
+        "moved": sorted(moved),
+        "skipped": sorted(references - moved),
+    })
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_GET
+from .tariffs import quote
+
+@login_required
+@require_GET
+def quote_view(request):
+    """
+    Price a delivery: ``shop`` (id), ``destination`` and optionally ``at``
+    (ISO datetime, default now). Served from parcels.tariffs' compiled tables.
+    """
+    shop = request.GET.get("shop", "")
+    destination = request.GET.get("destination", "").strip()
+    if not shop.isdigit() or not destination:
+        return JsonResponse({"error": "shop and destination are required"}, status=400)
+    at = None
+    if request.GET.get("at"):
+        try:
+            at = parse_datetime(request.GET["at"])
+        except ValueError:  # well formed but impossible, e.g. month 13
+            pass
+        if at is None:
+            return JsonResponse({"error": f"Invalid datetime {request.GET['at']!r}"}, status=400)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+
+    found = quote(int(shop), destination, at)
+    if found is None:
+        return JsonResponse({"error": f"No priced route from shop {shop} to {destination!r}"}, status=404)
+    return JsonResponse({
+        "zone": found.zone,
+        "distance_km": found.distance_km,
+        "delivery_cost": found.delivery_cost,
+        "rider_pay": found.rider_pay,
+        "multiplier": found.multiplier,
     })
@@ -1,14 +1,16 @@
 # riders/admin.py
-from django.contrib import admin
+from django.contrib import admin, messages
+from .jobs import InvalidJobTransition, move as move_job, reassign as reassign_job
 from .models import RiderProfile, Job, RiderRating
 
 # RiderProfile admin
 @admin.register(RiderProfile)
 class RiderProfileAdmin(admin.ModelAdmin):
-    list_display = ('user', 'status', 'rating', 'total_jobs')
+    list_display = ('user', 'status', 'rating', 'rating_count', 'total_jobs', 'completed_jobs')
     list_filter = ('status',)
     search_fields = ('user__username', 'user__email')
-    readonly_fields = ('rating', 'total_jobs')  # superadmin cannot edit these manually
+    # superadmin cannot edit these manually; see riders.jobs
+    readonly_fields = ('rating', 'rating_sum', 'rating_count', 'total_jobs', 'completed_jobs')
 
 # Job admin
 @admin.register(Job)
@@ -18,6 +20,23 @@ class JobAdmin(admin.ModelAdmin):
     search_fields = ('parcel__reference', 'rider__user__username')
     readonly_fields = ('assigned_at', 'completed_at')
 
+    def save_model(self, request, obj, form, change):
+        # Rider and status changes go through riders.jobs so the rider counters follow.
+        if not change:
+            super().save_model(request, obj, form, change)
+            return
+        to_rider, to_status = obj.rider, obj.status
+        saved = Job.objects.filter(pk=obj.pk).values('rider_id', 'status').get()
+        obj.rider_id, obj.status = saved['rider_id'], saved['status']
+        super().save_model(request, obj, form, change)
+        if 'rider' in form.changed_data:
+            reassign_job(obj, to_rider)
+        if 'status' in form.changed_data:
+            try:
+                move_job(obj, to_status)
+            except InvalidJobTransition as e:
+                self.message_user(request, str(e), level=messages.ERROR)
+
 # RiderRating admin
 @admin.register(RiderRating)
 class RiderRatingAdmin(admin.ModelAdmin):
@@ -28,11 +47,13 @@ class RiderRatingAdmin(admin.ModelAdmin):
 from decimal import Decimal
 from django.contrib import admin, messages
 from decimal import Decimal, InvalidOperation
-from .models import RiderWallet, RiderNotification, RiderProfile
+from .models import RiderWallet, RiderNotification, RiderProfile, WalletTransaction, Withdrawal
 
 @admin.register(RiderWallet)
 class withdraw_requestAdmin(admin.ModelAdmin):
-    list_display = ('rider', 'balance')
+    list_display = ('rider', 'balance', 'held')
+    # Balances follow the ledger (riders.wallet); correct them with a new posting.
+    readonly_fields = ('balance', 'held')
     actions = ['admin_withdraw']
 
     @admin.action(description="Withdraw from selected rider wallets")
@@ -61,6 +82,51 @@ class withdraw_requestAdmin(admin.ModelAdmin):
             f"Successfully processed withdrawals for {success_count} wallet(s)."
         )
 
+@admin.register(Withdrawal)
+class WithdrawalAdmin(admin.ModelAdmin):
+    list_display = ('wallet', 'amount', 'status', 'requested_at', 'processed_at', 'processed_by')
+    list_filter = ('status',)
+    search_fields = ('wallet__rider__user__username',)
+    readonly_fields = ('wallet', 'amount', 'status', 'requested_at', 'processed_at', 'processed_by')
+    actions = ['approve', 'reject']
+
+    def has_add_permission(self, request):
+        return False  # riders request withdrawals; the hold is posted with them
+
+    def _settle(self, request, queryset, method):
+        done = 0
+        for withdrawal in queryset.filter(status='PENDING'):
+            try:
+                getattr(withdrawal, method)(admin_user=request.user)
+                done += 1
+            except ValueError as e:
+                self.message_user(request, f"Withdrawal {withdrawal.pk}: {e}", level=messages.ERROR)
+        self.message_user(request, f"Processed {done} withdrawal(s).")
+
+    @admin.action(description="Approve and pay out selected withdrawals")
+    def approve(self, request, queryset):
+        self._settle(request, queryset, 'approve')
+
+    @admin.action(description="Reject selected withdrawals (return the money to the wallet)")
+    def reject(self, request, queryset):
+        self._settle(request, queryset, 'reject')
+
+@admin.register(WalletTransaction)
+class WalletTransactionAdmin(admin.ModelAdmin):
+    # Append-only: postings are made by riders.wallet, never edited here.
+    list_display = ('created_at', 'wallet', 'kind', 'amount', 'credit', 'debit', 'reference')
+    list_filter = ('kind',)
+    search_fields = ('wallet__rider__user__username', 'reference')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 @admin.register(RiderNotification)
 class RiderNotificationAdmin(admin.ModelAdmin):
     list_display = ('rider', 'message', 'created_at', 'read')
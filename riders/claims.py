@@ -0,0 +1,207 @@
+# riders/claims.py
+"""
+Claiming AvailableJobs in the rider marketplace.
+
+Many riders see the same job and tap it at about the same moment. Exactly one
+of them may win; the rest are told the job is gone (a ``None`` return, not an
+exception).
+
+- ``claim(job_id, rider)`` holds a job for ``JOB_CLAIM_TTL`` seconds while the
+  rider fills in their bid. Other riders see it disappear from their feed.
+- ``take(job_id, rider, bid_amount)`` turns the listing into the rider's Job
+  (claiming it first if needed) in one transaction. A bid below the job's
+  minimum raises ``InvalidBid``, and the rider keeps any hold they had.
+- ``claim_next(rider)`` holds the oldest job nobody else holds.
+- ``take_many(pairs)`` gives many jobs to planned riders at once
+  (riders.dispatch); jobs a rider is holding or took meanwhile are skipped.
+
+A job is claimable when it is unheld, its hold has expired, or the rider
+already holds it. On backends with ``SELECT ... FOR UPDATE SKIP LOCKED``
+(Postgres) the candidate row is locked without waiting, so a loser returns
+at once instead of queueing behind the winner. Elsewhere (SQLite) the claim
+is a guarded UPDATE whose WHERE clause repeats the claimable test, so only
+one writer's UPDATE matches the row.
+
+Expired holds are claimable straight away; ``release_expired()`` (run by
+``manage.py release_job_claims``) clears them and puts the jobs back in
+every rider's feed.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.utils import timezone
+
+from core.pubsub import publish, publish_many
+
+from .jobs import assign, assign_many
+from .models import AvailableJob
+
+JOB_CLAIM_TTL = getattr(settings, "JOB_CLAIM_TTL", 90)  # seconds
+
+# Candidates tried by claim_next() where SKIP LOCKED is not available.
+CLAIM_SCAN = 20
+
+# Jobs per take_many() transaction; bounds lock time and statement size.
+TAKE_MANY_CHUNK = 500
+
+
+class InvalidBid(ValueError):
+    pass
+
+
+def listing(available_job):
+    """What riders' job feeds show for ``available_job`` (see riders.signals)."""
+    parcel = available_job.parcel
+    return {
+        "id": available_job.id,
+        "reference": parcel.reference,
+        "destination": parcel.destination,
+        "min_bid_amount": available_job.min_bid_amount,
+    }
+
+
+def unheld(now):
+    return Q(claimed_by__isnull=True) | Q(claim_expires_at__lte=now)
+
+
+def claimable(rider, now):
+    return unheld(now) | Q(claimed_by=rider)
+
+
+def _hold(queryset, rider, now, ttl):
+    """Claim the first row of ``queryset`` for ``rider``. Returns its id or None."""
+    queryset = queryset.filter(claimable(rider, now))
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job_id = queryset.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if job_id is not None:
+                AvailableJob.objects.filter(pk=job_id).update(claimed_by=rider, claim_expires_at=now + ttl)
+            return job_id
+    for job_id in queryset.values_list('pk', flat=True)[:CLAIM_SCAN]:
+        if _hold_one(job_id, rider, now, ttl):
+            return job_id
+    return None
+
+
+def _hold_one(job_id, rider, now, ttl):
+    """Claim job ``job_id`` for ``rider``. Returns whether they got it."""
+    if connection.features.has_select_for_update_skip_locked:
+        return _hold(AvailableJob.objects.filter(pk=job_id), rider, now, ttl) is not None
+    # One statement, and a write first: SQLite makes a transaction that read
+    # before writing fail on contention instead of waiting its turn.
+    return bool(AvailableJob.objects.filter(claimable(rider, now), pk=job_id).update(
+        claimed_by=rider, claim_expires_at=now + ttl,
+    ))
+
+
+def _announce(job_id, expires_at):
+    transaction.on_commit(
+        lambda: publish("jobs", "job_claimed", {"id": job_id, "expires_at": expires_at})
+    )
+
+
+def claim(job_id, rider, ttl=JOB_CLAIM_TTL):
+    """Hold job ``job_id`` for ``rider``. Returns the AvailableJob, or None if it is gone or held."""
+    now = timezone.now()
+    ttl = timedelta(seconds=ttl)
+    if not _hold_one(job_id, rider, now, ttl):
+        return None
+    _announce(job_id, now + ttl)
+    return AvailableJob.objects.select_related('parcel').get(pk=job_id)
+
+
+def claim_next(rider, queryset=None, ttl=JOB_CLAIM_TTL):
+    """Hold the oldest claimable job in ``queryset`` (default: all). Returns it or None."""
+    now = timezone.now()
+    ttl = timedelta(seconds=ttl)
+    queryset = AvailableJob.objects.all() if queryset is None else queryset
+    job_id = _hold(queryset.order_by('created_at', 'pk'), rider, now, ttl)
+    if job_id is None:
+        return None
+    _announce(job_id, now + ttl)
+    return AvailableJob.objects.select_related('parcel').get(pk=job_id)
+
+
+@transaction.atomic
+def take(job_id, rider, bid_amount=None):
+    """
+    Give job ``job_id`` to ``rider`` at ``bid_amount`` (default: its minimum
+    bid). Returns the new Job, or None if another rider has it. Raises
+    ``InvalidBid`` for a bid that is not positive or is below the minimum.
+    """
+    now = timezone.now()
+    # The claim is what decides the race; the listing is deleted right after,
+    # so the hold only has to outlive this transaction.
+    if not _hold_one(job_id, rider, now, timedelta(seconds=JOB_CLAIM_TTL)):
+        return None
+    available_job = AvailableJob.objects.select_related('parcel').get(pk=job_id)
+    if bid_amount is None:
+        bid_amount = available_job.min_bid_amount
+    if not bid_amount.is_finite() or bid_amount <= 0:
+        raise InvalidBid("A bid must be a positive amount.")
+    if bid_amount < available_job.min_bid_amount:
+        raise InvalidBid(f"The minimum bid for this job is KSh {available_job.min_bid_amount}.")
+    return assign(available_job, rider, bid_amount)
+
+
+def take_many(pairs, now=None):
+    """
+    Give each job in ``pairs`` of ``(job_id, rider_id)`` to its rider at the
+    job's minimum bid. Returns the new Jobs; jobs held or taken by someone
+    else meanwhile are left out.
+    """
+    now = now or timezone.now()
+    pairs = list(pairs)
+    jobs = []
+    for start in range(0, len(pairs), TAKE_MANY_CHUNK):
+        planned = dict(pairs[start:start + TAKE_MANY_CHUNK])
+        expires_at = now + timedelta(seconds=JOB_CLAIM_TTL)
+        with transaction.atomic():
+            # Claim the whole chunk in one guarded UPDATE, each job for its
+            # own rider; as in _hold_one(), the write comes first.
+            AvailableJob.objects.filter(unheld(now), pk__in=planned).update(
+                claimed_by=Case(
+                    *[When(pk=job_id, then=Value(rider_id)) for job_id, rider_id in planned.items()],
+                    output_field=IntegerField(),
+                ),
+                claim_expires_at=expires_at,
+            )
+            won = AvailableJob.objects.filter(pk__in=planned, claim_expires_at=expires_at).select_related('parcel')
+            jobs += assign_many(
+                (available_job, available_job.claimed_by_id, available_job.min_bid_amount)
+                for available_job in won
+                if available_job.claimed_by_id == planned[available_job.pk]
+            )
+    return jobs
+
+
+def release(job_id, rider):
+    """Give up ``rider``'s hold on ``job_id`` early. Returns whether they held it."""
+    released = AvailableJob.objects.filter(pk=job_id, claimed_by=rider).update(
+        claimed_by=None, claim_expires_at=None,
+    )
+    if released:
+        _republish(AvailableJob.objects.filter(pk=job_id))
+    return bool(released)
+
+
+def release_expired(now=None):
+    """Clear every expired hold and show those jobs to riders again. Returns how many."""
+    now = now or timezone.now()
+    expired = AvailableJob.objects.filter(claim_expires_at__lte=now)
+    job_ids = list(expired.values_list('pk', flat=True))
+    if not job_ids:
+        return 0
+    # Re-test expiry: a rider may have renewed a hold since the SELECT.
+    released = AvailableJob.objects.filter(pk__in=job_ids, claim_expires_at__lte=now).update(
+        claimed_by=None, claim_expires_at=None,
+    )
+    _republish(AvailableJob.objects.filter(pk__in=job_ids, claimed_by__isnull=True))
+    return released
+
+
+def _republish(queryset):
+    jobs = [listing(job) for job in queryset.select_related('parcel')]
+    transaction.on_commit(lambda: publish_many(("jobs", "job_available", job) for job in jobs))
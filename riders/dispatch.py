@@ -0,0 +1,222 @@
+# riders/dispatch.py
+"""
+Automatic dispatch: match open AvailableJobs to nearby riders in batches.
+
+``manage.py dispatch_jobs --loop`` runs ``dispatch()`` every few seconds.
+A cycle reads what it needs in three queries: the open jobs with their
+pickup shop's position, the available riders (riders.geo.available_riders),
+and how many jobs each rider has in hand. Then it plans in memory:
+
+1. candidates: the ``DISPATCH_CANDIDATES`` nearest riders within
+   ``DISPATCH_MAX_KM`` of each job's pickup shop, from riders.geo.rider_index
+   (one lookup per shop, not per job);
+2. ``score()`` each job/rider pair (lower is better). It counts distance,
+   rating, jobs in hand and probation against the rider, and how long the
+   job has waited in its favour;
+3. greedy matching: all pairs sorted by score, best first. A pair is kept
+   while its job is unmatched and its rider is under both fairness caps:
+   ``DISPATCH_MAX_LOAD`` jobs in hand and ``DISPATCH_MAX_PER_CYCLE`` new
+   jobs this cycle. Jobs left over get one more round with a wider candidate
+   set, so a busy neighbourhood does not strand them.
+
+An optimal assignment (Hungarian method) is cubic in the batch size and out
+of reach for thousands of jobs every few seconds in Python. Greedy matching
+costs a sort of about ``jobs x DISPATCH_CANDIDATES`` pairs.
+
+The plan is applied by riders.claims.take_many(). It issues a few statements
+per 500 jobs and skips any job a rider claimed while the plan was being made.
+
+Jobs stay in the open marketplace for ``DISPATCH_AFTER`` seconds before
+dispatch takes them. Jobs whose parcel has no origin shop with a position
+stay in the marketplace.
+"""
+from collections import Counter
+from datetime import timedelta
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from core.geo import has_position
+from core.pubsub import publish_many
+from parcels.models import Parcel
+
+from .claims import take_many, unheld
+from .geo import available_riders, rider_index
+from .models import AvailableJob, Job, RiderNotification
+
+DISPATCH_AFTER = getattr(settings, "DISPATCH_AFTER", 60)  # seconds a job is left to bids first
+DISPATCH_MAX_KM = getattr(settings, "DISPATCH_MAX_KM", 8)  # furthest pickup offered to a rider
+DISPATCH_CANDIDATES = getattr(settings, "DISPATCH_CANDIDATES", 15)  # nearest riders scored per job
+DISPATCH_MAX_LOAD = getattr(settings, "DISPATCH_MAX_LOAD", 3)  # jobs in hand before a rider gets no more
+DISPATCH_MAX_PER_CYCLE = getattr(settings, "DISPATCH_MAX_PER_CYCLE", 2)  # new jobs per rider per cycle
+DISPATCH_BATCH = getattr(settings, "DISPATCH_BATCH", 5000)  # oldest open jobs planned per cycle
+
+ACTIVE_JOB_STATUSES = ('IN_PROGRESS', 'ARRIVED')
+
+# score() weights. Each term is scaled to about 0..1 first.
+WEIGHT_DISTANCE = 1.0
+WEIGHT_RATING = 0.3
+WEIGHT_LOAD = 0.5
+WEIGHT_PROBATION = 0.3
+WEIGHT_WAITING = 0.4
+UNRATED = 0.5  # rating term of a rider nobody has rated yet, as for a 3/5
+WAITING_FULL = 30 * 60  # seconds after which waiting longer earns nothing more
+
+
+class OpenJob(NamedTuple):
+    id: int
+    lat: float
+    lon: float
+    waited: float  # seconds since it was listed
+
+
+class RiderState(NamedTuple):
+    id: int
+    rating: float
+    rated: bool
+    load: int  # jobs in hand
+    probation: bool
+
+
+class Assignment(NamedTuple):
+    job_id: int
+    rider_id: int
+    km: float
+    score: float
+
+
+class DispatchResult(NamedTuple):
+    jobs: int  # open jobs considered
+    riders: int  # riders available
+    assignments: list  # the plan
+    created: list  # Jobs actually created (empty for a dry run)
+
+
+def score(job, rider, km, load=None):
+    """Cost of giving ``job`` to ``rider`` ``km`` away with ``load`` jobs in hand; lower is better."""
+    load = rider.load if load is None else load
+    rating = (5 - rider.rating) / 4 if rider.rated else UNRATED
+    return (
+        WEIGHT_DISTANCE * km / DISPATCH_MAX_KM
+        + WEIGHT_RATING * rating
+        + WEIGHT_LOAD * load / DISPATCH_MAX_LOAD
+        + (WEIGHT_PROBATION if rider.probation else 0.0)
+        - WEIGHT_WAITING * min(job.waited / WAITING_FULL, 1.0)
+    )
+
+
+# -------------------------
+# Planning (no database)
+# -------------------------
+def plan(jobs, riders, nearest, max_load=DISPATCH_MAX_LOAD, max_per_cycle=DISPATCH_MAX_PER_CYCLE,
+         rounds=(DISPATCH_CANDIDATES, DISPATCH_CANDIDATES * 4)):
+    """
+    Match ``jobs`` (OpenJobs) to ``riders`` (``{id: RiderState}``).
+    ``nearest(lat, lon, k, max_km)`` returns ``(rider_id, km)`` pairs, as
+    core.geo.KDTree.nearest does; riders it returns that are not in
+    ``riders`` are ignored. ``rounds`` is the candidate count of each round.
+    Returns Assignments in the order they were made.
+    """
+    load = {rider_id: rider.load for rider_id, rider in riders.items()}
+    new = Counter()
+    assignments = []
+    waiting = list(jobs)
+
+    def has_room(rider_id):
+        return load[rider_id] < max_load and new[rider_id] < max_per_cycle
+
+    for k in rounds:
+        pairs = []
+        candidates = {}  # jobs from one shop share a pickup point and a lookup
+        for job in waiting:
+            point = (job.lat, job.lon)
+            if point not in candidates:
+                candidates[point] = nearest(job.lat, job.lon, k, DISPATCH_MAX_KM)
+            for rider_id, km in candidates[point]:
+                if rider_id in riders and has_room(rider_id):
+                    pairs.append((score(job, riders[rider_id], km, load[rider_id]), km, job.id, rider_id))
+        pairs.sort()
+        matched = set()
+        for cost, km, job_id, rider_id in pairs:
+            if job_id in matched or not has_room(rider_id):
+                continue
+            matched.add(job_id)
+            load[rider_id] += 1
+            new[rider_id] += 1
+            assignments.append(Assignment(job_id, rider_id, km, cost))
+        waiting = [job for job in waiting if job.id not in matched]
+        if not waiting or not any(has_room(rider_id) for rider_id in riders):
+            break
+    return assignments
+
+
+# -------------------------
+# Dispatch cycle
+# -------------------------
+def open_jobs(now, limit=DISPATCH_BATCH):
+    """The oldest ``limit`` unheld jobs listed at least DISPATCH_AFTER ago whose pickup shop has a position."""
+    rows = (
+        AvailableJob.objects.filter(
+            unheld(now),
+            created_at__lte=now - timedelta(seconds=DISPATCH_AFTER),
+            parcel__origin_shop__latitude__isnull=False,
+            parcel__origin_shop__longitude__isnull=False,
+        )
+        .order_by('created_at', 'pk')
+        .values_list('pk', 'created_at', 'parcel__origin_shop__latitude', 'parcel__origin_shop__longitude')[:limit]
+    )
+    return [
+        OpenJob(pk, lat, lon, (now - created_at).total_seconds())
+        for pk, created_at, lat, lon in rows
+        if has_position(lat, lon)
+    ]
+
+
+def rider_states(now):
+    """``{rider_id: RiderState}`` for every available rider."""
+    loads = dict(
+        Job.objects.filter(status__in=ACTIVE_JOB_STATUSES).order_by()
+        .values_list('rider').annotate(n=Count('pk'))
+    )
+    return {
+        pk: RiderState(pk, rating, rating_count > 0, loads.get(pk, 0), status == 'PROBATION')
+        for pk, rating, rating_count, status in available_riders(now).values_list(
+            'pk', 'rating', 'rating_count', 'status',
+        )
+    }
+
+
+def dispatch(dry_run=False, now=None, limit=DISPATCH_BATCH):
+    """Run one dispatch cycle. Nothing is written when ``dry_run``. Returns a DispatchResult."""
+    now = now or timezone.now()
+    jobs = open_jobs(now, limit)
+    if not jobs:
+        return DispatchResult(0, 0, [], [])
+    riders = rider_states(now)
+    assignments = plan(jobs, riders, rider_index.nearest)
+    if dry_run or not assignments:
+        return DispatchResult(len(jobs), len(riders), assignments, [])
+    created = take_many(((a.job_id, a.rider_id) for a in assignments), now)
+    notify(created)
+    return DispatchResult(len(jobs), len(riders), assignments, created)
+
+
+@transaction.atomic
+def notify(jobs):
+    """Tell each rider about the jobs they were given, in one insert."""
+    if not jobs:
+        return
+    references = dict(Parcel.objects.filter(pk__in=[job.parcel_id for job in jobs]).values_list('pk', 'reference'))
+    notifications = RiderNotification.objects.bulk_create([
+        RiderNotification(rider_id=job.rider_id, message=f"Parcel {references[job.parcel_id]} has been assigned to you.")
+        for job in jobs
+        if job.parcel_id in references
+    ])
+    messages = [
+        (f"rider:{n.rider_id}", "notification", {"message": n.message, "created_at": n.created_at})
+        for n in notifications
+    ]
+    transaction.on_commit(lambda: publish_many(messages))
@@ -0,0 +1,150 @@
+# riders/feed.py
+"""
+The rider app's job feed (riders.views.job_feed): open AvailableJobs,
+newest first, a page at a time.
+
+Pages use keysets rather than offsets. ``next`` is an opaque cursor holding
+the ``(created_at, id)`` of the last job on the page, and the next page
+starts strictly after it. Page 50 then costs the same as page 1, and a job
+posted or taken between requests never shifts a row into the wrong page.
+The ``availablejob_newest`` index serves this ordering.
+
+Filters:
+- ``radius_km`` around the rider: the shops in range come from the
+  in-memory shops.geo.shop_index, so the database only sees
+  ``origin_shop IN (...)``;
+- ``min_bid`` on ``min_bid_amount``;
+- ``category`` by id (an int) or name; ``parse_query`` tells them apart.
+
+Jobs another rider is holding are left out, as in the HTML list.
+
+A page is one query. It reads only the columns the payload needs, joined
+from the parcel, its category and its shop. Items are small and
+keys with no value are dropped.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from core.geo import has_position, haversine_km
+from shops.geo import shop_index
+
+from .claims import claimable
+from .models import AvailableJob
+
+JOB_FEED_PAGE_SIZE = getattr(settings, "JOB_FEED_PAGE_SIZE", 20)
+JOB_FEED_MAX_PAGE_SIZE = 100
+JOB_FEED_MAX_RADIUS_KM = 50
+MAX_ID = 2 ** 63 - 1  # largest id a category column can hold
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+FIELDS = (
+    'pk', 'created_at', 'min_bid_amount',
+    'parcel__reference', 'parcel__destination', 'parcel__category__name',
+    'parcel__origin_shop__name', 'parcel__origin_shop__latitude', 'parcel__origin_shop__longitude',
+)
+
+
+class InvalidFeedQuery(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    return f"{(created_at - EPOCH) // timedelta(microseconds=1):x}.{pk:x}"
+
+
+def decode_cursor(cursor):
+    try:
+        micros, pk = (int(part, 16) for part in cursor.split("."))
+        return EPOCH + timedelta(microseconds=micros), pk
+    except (AttributeError, ValueError, OverflowError):
+        raise InvalidFeedQuery(f"Invalid cursor {cursor!r}")
+
+
+def parse_category(value):
+    """A category id (ASCII digits) as an int, else a name. Raises InvalidFeedQuery for other numbers."""
+    value = value.strip()
+    if value.isascii() and value.isdigit():
+        if len(value) > 19 or int(value) > MAX_ID:
+            raise InvalidFeedQuery(f"Invalid category id {value!r}")
+        return int(value)
+    if value.isnumeric():  # superscripts, other scripts' digits, fractions
+        raise InvalidFeedQuery(f"Invalid category {value!r}")
+    return value
+
+
+def parse_query(params):
+    """Validated feed filters from request GET ``params``. Raises InvalidFeedQuery."""
+    query = {}
+    try:
+        if params.get('limit'):
+            query['limit'] = max(1, min(int(params['limit']), JOB_FEED_MAX_PAGE_SIZE))
+        if params.get('lat') or params.get('lon'):
+            query['lat'], query['lon'] = float(params['lat']), float(params['lon'])
+            if not has_position(query['lat'], query['lon']):
+                raise ValueError
+        if params.get('radius_km'):
+            radius_km = float(params['radius_km'])
+            if not radius_km >= 0:  # also refuses NaN
+                raise ValueError
+            query['radius_km'] = min(radius_km, JOB_FEED_MAX_RADIUS_KM)
+        if params.get('min_bid'):
+            query['min_bid'] = Decimal(params['min_bid'])
+            if not query['min_bid'].is_finite():
+                raise ValueError
+    except (KeyError, ValueError, InvalidOperation):
+        raise InvalidFeedQuery("lat/lon, radius_km, min_bid and limit must be numbers; radius_km cannot be negative")
+    if params.get('category'):
+        query['category'] = parse_category(params['category'])
+    if params.get('after'):
+        query['after'] = decode_cursor(params['after'])
+    return query
+
+
+def job_feed(rider_id, lat=None, lon=None, radius_km=None, min_bid=None, category=None, after=None,
+             limit=JOB_FEED_PAGE_SIZE, now=None):
+    """
+    One page of the feed for rider ``rider_id``: ``(items, next_cursor)``.
+    ``next_cursor`` is None on the last page. ``radius_km`` needs the
+    rider's ``lat``/``lon``; with a position every item carries ``km``.
+    """
+    jobs = AvailableJob.objects.filter(claimable(rider_id, now or timezone.now()))
+    if radius_km is not None:
+        if lat is None:
+            raise InvalidFeedQuery("radius_km needs the rider's position")
+        shop_ids = [shop_id for shop_id, _ in shop_index.within(lat, lon, radius_km)]
+        jobs = jobs.filter(parcel__origin_shop_id__in=shop_ids)
+    if min_bid is not None:
+        jobs = jobs.filter(min_bid_amount__gte=min_bid)
+    if category:
+        jobs = jobs.filter(
+            Q(parcel__category_id=category) if isinstance(category, int) else Q(parcel__category__name__iexact=category)
+        )
+    if after is not None:
+        created_at, pk = after
+        jobs = jobs.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    rows = list(jobs.order_by('-created_at', '-pk').values_list(*FIELDS)[:limit + 1])
+    items = [_item(row, lat, lon) for row in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return items, next_cursor
+
+
+def _item(row, lat, lon):
+    pk, created_at, min_bid, reference, destination, category, shop, shop_lat, shop_lon = row
+    item = {
+        "id": pk,
+        "ref": reference,
+        "to": destination,
+        "min_bid": str(min_bid),
+        "at": int(created_at.timestamp()),
+        "cat": category,
+        "shop": shop,
+    }
+    if lat is not None and has_position(shop_lat, shop_lon):
+        item["km"] = round(haversine_km(lat, lon, shop_lat, shop_lon), 1)
+    return {key: value for key, value in item.items() if value is not None}
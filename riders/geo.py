@@ -0,0 +1,63 @@
+# riders/geo.py
+"""
+Rider positions and nearest-rider lookups ("which riders are near this
+parcel").
+
+``set_position()`` stores a rider's last position with its geohash and
+invalidates ``rider_index``, a core.geo.SpatialIndex over riders who are not
+SUSPENDED and whose position is less than ``RIDER_POSITION_MAX_AGE`` seconds old. Positions
+change all the time, so the tree is rebuilt at most once per
+``RIDER_INDEX_MIN_INTERVAL`` seconds; between rebuilds queries see positions
+that are at most that old.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from core.geo import SpatialIndex, geohash_encode, has_position
+
+from .models import RiderProfile
+
+RIDER_POSITION_MAX_AGE = getattr(settings, "RIDER_POSITION_MAX_AGE", 15 * 60)  # seconds
+RIDER_INDEX_MIN_INTERVAL = getattr(settings, "RIDER_INDEX_MIN_INTERVAL", 5)  # seconds
+
+
+def available_riders(now=None):
+    """Riders who may be offered work: not suspended, with a fresh position."""
+    fresh_since = (now or timezone.now()) - timedelta(seconds=RIDER_POSITION_MAX_AGE)
+    return RiderProfile.objects.exclude(status='SUSPENDED').filter(position_at__gte=fresh_since)
+
+
+def _positions():
+    return available_riders().values_list('pk', 'latitude', 'longitude').iterator(chunk_size=5000)
+
+
+rider_index = SpatialIndex(
+    "riders", _positions, min_interval=RIDER_INDEX_MIN_INTERVAL, max_age=RIDER_INDEX_MIN_INTERVAL * 6,
+)
+
+
+def set_position(rider_id, lat, lon, at=None):
+    """Record where rider ``rider_id`` is. Raises ValueError for impossible coordinates."""
+    if not has_position(lat, lon):
+        raise ValueError("Invalid position")
+    RiderProfile.objects.filter(pk=rider_id).update(
+        latitude=lat, longitude=lon, geohash=geohash_encode(lat, lon), position_at=at or timezone.now(),
+    )
+    rider_index.invalidate()
+
+
+def _with_riders(pairs):
+    riders = RiderProfile.objects.select_related('user').in_bulk([pk for pk, _ in pairs])
+    return [(riders[pk], km) for pk, km in pairs if pk in riders]
+
+
+def nearest_riders(lat, lon, k=5, max_km=None):
+    """Up to ``k`` ``(rider, km)`` pairs of available riders, nearest first."""
+    return _with_riders(rider_index.nearest(lat, lon, k, max_km))
+
+
+def riders_within(lat, lon, radius_km):
+    """Every available ``(rider, km)`` pair within ``radius_km``, nearest first."""
+    return _with_riders(rider_index.within(lat, lon, radius_km))
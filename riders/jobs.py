@@ -0,0 +1,159 @@
+# riders/jobs.py
+"""
+Job lifecycle and the rider counters that follow it.
+
+``RiderProfile`` keeps running totals so profile pages and dispatch never
+aggregate a rider's history:
+
+- ``rating_sum`` / ``rating_count`` (and the ``rating`` average derived from
+  them), adjusted by ``rate()`` as ratings are added, changed or deleted;
+- ``total_jobs``, bumped when a Job is created (riders.signals, or
+  ``assign_many()`` for batches, which bypass signals);
+- ``completed_jobs``, bumped when a job moves to DELIVERED (``move()``).
+
+A job handed to another rider (``reassign()``) moves its share with it.
+Deleting a rating or a job takes its share back out.
+
+Every adjustment is one ``F()`` UPDATE of the rider row inside the caller's
+transaction, so it costs the same for a rider's first rating as for their
+ten-thousandth. ``manage.py rebuild_rider_stats`` recomputes all of them
+from the Job and RiderRating tables if they ever drift.
+"""
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.utils import timezone
+
+from parcels.tariffs import quote_parcel
+
+from .models import AvailableJob, Job, RiderProfile, RiderRating
+
+JOB_TRANSITIONS = {
+    'IN_PROGRESS': {'ARRIVED', 'DELIVERED'},
+    'ARRIVED': {'DELIVERED'},
+    'DELIVERED': set(),
+}
+
+
+class InvalidJobTransition(ValueError):
+    pass
+
+
+def _average(rating_sum, rating_count):
+    return Cast(rating_sum, FloatField()) / Greatest(rating_count, Value(1))
+
+
+def rate(rider_id, delta_sum, delta_count=0):
+    """Add ``delta_sum`` points over ``delta_count`` ratings to the rider's running totals."""
+    new_sum = F('rating_sum') + delta_sum
+    new_count = F('rating_count') + delta_count
+    RiderProfile.objects.filter(pk=rider_id).update(
+        rating_sum=new_sum, rating_count=new_count, rating=_average(new_sum, new_count),
+    )
+
+
+def pay_for(parcel, bid_amount, at=None):
+    """What delivering ``parcel`` pays: the tariff's rider pay at ``at``, or the accepted bid off priced routes."""
+    quote = quote_parcel(parcel, at=at)
+    return quote.rider_pay if quote is not None else bid_amount
+
+
+@transaction.atomic
+def assign(available_job, rider, bid_amount):
+    """Give ``available_job`` to ``rider``: create the Job and drop the offer together."""
+    parcel = available_job.parcel
+    job = Job.objects.create(parcel=parcel, rider=rider, bid_amount=bid_amount, rider_pay=pay_for(parcel, bid_amount))
+    available_job.delete()
+    return job
+
+
+@transaction.atomic
+def assign_many(assignments):
+    """
+    ``assign()`` for a batch of ``(available_job, rider_id, bid_amount)``, with
+    the parcels selected alongside the offers: one
+    insert for the Jobs, one delete for the offers and one counter UPDATE per
+    distinct number of new jobs, however many riders are involved.
+    """
+    assignments = list(assignments)
+    if not assignments:
+        return []
+    jobs = Job.objects.bulk_create([
+        Job(
+            parcel_id=available_job.parcel_id, rider_id=rider_id, bid_amount=bid_amount,
+            rider_pay=pay_for(available_job.parcel, bid_amount),
+        )
+        for available_job, rider_id, bid_amount in assignments
+    ])
+    AvailableJob.objects.filter(pk__in=[available_job.pk for available_job, _, _ in assignments]).delete()
+    riders_by_total = defaultdict(list)
+    for rider_id, total in Counter(rider_id for _, rider_id, _ in assignments).items():
+        riders_by_total[total].append(rider_id)
+    for total, rider_ids in riders_by_total.items():
+        RiderProfile.objects.filter(pk__in=rider_ids).update(total_jobs=F('total_jobs') + total)
+    return jobs
+
+
+def count_jobs(rider_id, total=0, completed=0):
+    RiderProfile.objects.filter(pk=rider_id).update(
+        total_jobs=F('total_jobs') + total, completed_jobs=F('completed_jobs') + completed,
+    )
+
+
+@transaction.atomic
+def move(job, to_status):
+    """
+    Move ``job`` to ``to_status`` with one conditional UPDATE. Raises
+    InvalidJobTransition if its current status does not allow it (e.g. a
+    second delivery scan), so side effects such as earnings run once.
+    """
+    if to_status not in JOB_TRANSITIONS:
+        raise InvalidJobTransition(f"Unknown job status {to_status!r}")
+    sources = [status for status, targets in JOB_TRANSITIONS.items() if to_status in targets]
+    changes = {'status': to_status}
+    if to_status == 'DELIVERED':
+        changes['completed_at'] = timezone.now()
+    if not Job.objects.filter(pk=job.pk, status__in=sources).update(**changes):
+        current = Job.objects.filter(pk=job.pk).values_list('status', flat=True).first()
+        raise InvalidJobTransition(f"Job for parcel {job.parcel_id} is {current}; cannot move to {to_status}")
+    if to_status == 'DELIVERED':
+        count_jobs(job.rider_id, completed=1)
+    for name, value in changes.items():
+        setattr(job, name, value)
+    return job
+
+
+@transaction.atomic
+def reassign(job, rider):
+    """
+    Hand ``job`` to ``rider``. The job, and its completion if delivered, moves
+    from the previous rider's counters to the new rider's.
+    """
+    current = Job.objects.select_for_update().filter(pk=job.pk).values('rider_id', 'status').get()
+    if current['rider_id'] != rider.pk:
+        Job.objects.filter(pk=job.pk).update(rider=rider)
+        completed = int(current['status'] == 'DELIVERED')
+        count_jobs(current['rider_id'], total=-1, completed=-completed)
+        count_jobs(rider.pk, total=1, completed=completed)
+    job.rider = rider
+    return job
+
+
+def rebuild_stats():
+    """Recompute every rider's counters from source in one UPDATE. Returns riders updated."""
+    ratings = RiderRating.objects.filter(rider=OuterRef('pk')).order_by().values('rider')
+    jobs = Job.objects.filter(rider=OuterRef('pk')).order_by().values('rider')
+    rating_sum = Coalesce(Subquery(ratings.annotate(n=Sum('rating')).values('n')), 0, output_field=IntegerField())
+    rating_count = Coalesce(Subquery(ratings.annotate(n=Count('id')).values('n')), 0, output_field=IntegerField())
+    return RiderProfile.objects.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating=_average(rating_sum, rating_count),
+        total_jobs=Coalesce(Subquery(jobs.annotate(n=Count('id')).values('n')), 0, output_field=IntegerField()),
+        completed_jobs=Coalesce(
+            Subquery(jobs.annotate(n=Count('id', filter=Q(status='DELIVERED'))).values('n')), 0,
+            output_field=IntegerField(),
+        ),
+    )
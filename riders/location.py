@@ -0,0 +1,276 @@
+# riders/location.py
+"""
+Live rider positions from the rider app's GPS pings.
+
+The app posts pings in batches (riders.views.rider_location). ``ingest()``
+only touches memory:
+
+- the newest ping per rider goes into ``buffer.latest`` and into the cache
+  under ``position_key(rider_id)``, so ``latest_position()`` is current
+  within a request;
+- the trail is down-sampled as it arrives. A ping is kept when it is at
+  least ``LOCATION_TRAIL_MIN_METERS`` from the last kept one, or
+  ``LOCATION_TRAIL_MAX_GAP`` seconds after it. A parked rider costs one row
+  a minute; a moving rider costs one row per road segment.
+
+A daemon thread per process flushes every ``LOCATION_FLUSH_INTERVAL``
+seconds, or sooner once ``LOCATION_BUFFER_LIMIT`` points are waiting. It
+runs one ``bulk_create`` of RiderLocation rows and one ``bulk_update`` of
+the RiderProfile position columns of the riders that moved, skipping riders
+deleted meanwhile. Then it invalidates riders.geo.rider_index. So RiderProfile rows are written once
+per flush, not once per ping. Points still buffered when a process dies
+are lost; the newest position survives in the cache.
+"""
+import atexit
+import logging
+import os
+import threading
+from datetime import datetime, timezone as dt_timezone
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from core.geo import geohash_encode, has_position, haversine_km
+
+from .geo import RIDER_POSITION_MAX_AGE, rider_index
+from .models import RiderLocation, RiderProfile
+
+LOCATION_FLUSH_INTERVAL = getattr(settings, "LOCATION_FLUSH_INTERVAL", 5)  # seconds; 0 flushes on every batch
+LOCATION_TRAIL_MIN_METERS = getattr(settings, "LOCATION_TRAIL_MIN_METERS", 25)
+LOCATION_TRAIL_MAX_GAP = getattr(settings, "LOCATION_TRAIL_MAX_GAP", 60)  # seconds
+LOCATION_MAX_ACCURACY_M = getattr(settings, "LOCATION_MAX_ACCURACY_M", 200)  # coarser fixes are dropped
+LOCATION_BUFFER_LIMIT = 50_000  # trail points held before flushing early
+
+RIDER_ID_CACHE_TTL = 300  # seconds a user -> active rider lookup is reused; dropped when the profile changes
+
+MAX_PINGS_PER_BATCH = 500
+MAX_PING_AGE = 24 * 60 * 60  # seconds
+MAX_CLOCK_SKEW = 60  # seconds a phone's clock may run ahead
+
+logger = logging.getLogger(__name__)
+
+
+class Ping(NamedTuple):
+    lat: float
+    lon: float
+    t: float  # epoch seconds
+    accuracy: Optional[float] = None
+
+    @property
+    def recorded_at(self):
+        return datetime.fromtimestamp(self.t, tz=dt_timezone.utc)
+
+
+def position_key(rider_id):
+    return f"rider-position:{rider_id}"
+
+
+def rider_of_user_key(user_id):
+    return f"rider-of-user:{user_id}"
+
+
+def active_rider_id(user):
+    """The id of ``user``'s rider profile unless it is suspended, else None. Cached; see riders.signals."""
+    key = rider_of_user_key(user.pk)
+    rider_id = cache.get(key)
+    if rider_id is None:
+        rider_id = RiderProfile.objects.filter(user=user).exclude(status='SUSPENDED').values_list('pk', flat=True).first()
+        cache.set(key, rider_id or 0, RIDER_ID_CACHE_TTL)
+    return rider_id or None
+
+
+def parse_pings(items, now=None):
+    """
+    Valid ``Ping``s from ``[{"lat", "lon", "t" (epoch ms), "acc"}]``, oldest
+    first, and how many were rejected. Raises ValueError if ``items`` is not
+    a list of at most MAX_PINGS_PER_BATCH objects.
+    """
+    if not isinstance(items, list) or len(items) > MAX_PINGS_PER_BATCH:
+        raise ValueError(f"Expected a list of at most {MAX_PINGS_PER_BATCH} pings")
+    now = now if now is not None else timezone.now().timestamp()
+    pings, rejected = [], 0
+    for item in items:
+        try:
+            ping = Ping(
+                float(item["lat"]), float(item["lon"]), float(item["t"]) / 1000,
+                float(item["acc"]) if item.get("acc") is not None else None,
+            )
+        except (KeyError, TypeError, ValueError, AttributeError):
+            rejected += 1
+            continue
+        if (
+            not has_position(ping.lat, ping.lon)
+            or not now - MAX_PING_AGE <= ping.t <= now + MAX_CLOCK_SKEW
+            or (ping.accuracy is not None and ping.accuracy > LOCATION_MAX_ACCURACY_M)
+        ):
+            rejected += 1
+            continue
+        pings.append(ping)
+    pings.sort(key=lambda ping: ping.t)
+    return pings, rejected
+
+
+class LocationBuffer:
+    """Per-process latest positions and down-sampled trail, flushed in bulk."""
+
+    def __init__(self, flush_interval=LOCATION_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.latest = {}  # rider_id -> newest Ping seen by this process
+        self.kept = {}  # rider_id -> last Ping kept in the trail
+        self.moved = set()  # riders whose latest Ping is not flushed yet
+        self.trail = []  # (rider_id, Ping) waiting for the flush
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add(self, rider_id, pings):
+        """Take a rider's ``pings`` (oldest first). Returns how many went into the trail."""
+        kept_count = 0
+        with self.lock:
+            latest = self.latest.get(rider_id)
+            newest = latest
+            for ping in pings:
+                if newest is not None and ping.t <= newest.t:
+                    continue  # duplicate or out of order
+                newest = ping
+                kept = self.kept.get(rider_id)
+                if (
+                    kept is None
+                    or ping.t - kept.t >= LOCATION_TRAIL_MAX_GAP
+                    or haversine_km(kept.lat, kept.lon, ping.lat, ping.lon) * 1000 >= LOCATION_TRAIL_MIN_METERS
+                ):
+                    self.trail.append((rider_id, ping))
+                    self.kept[rider_id] = ping
+                    kept_count += 1
+            if newest is not latest:
+                self.latest[rider_id] = newest
+                self.moved.add(rider_id)
+            overflowing = len(self.trail) >= LOCATION_BUFFER_LIMIT
+
+        if newest is not latest:
+            cache.set(position_key(rider_id), tuple(newest), RIDER_POSITION_MAX_AGE)
+        if self.flush_interval == 0:
+            self.flush()
+        elif self.flush_interval is not None:  # None: the caller flushes
+            self._start()
+            if overflowing:
+                self._wake.set()
+        return kept_count
+
+    def flush(self):
+        """Write the buffered trail and latest positions. Returns ``(points, riders)`` written."""
+        with self.lock:
+            trail, self.trail = self.trail, []
+            moved, self.moved = self.moved, set()
+            latest = {rider_id: self.latest[rider_id] for rider_id in moved}
+        if not trail and not latest:
+            return 0, 0
+        try:
+            with transaction.atomic():
+                written = self._write(trail, latest)
+        except Exception:
+            # Put everything back for the next flush; newer pings stay newest.
+            with self.lock:
+                self.trail[:0] = trail
+                self.moved |= moved
+            raise
+        if written[1]:
+            rider_index.invalidate()
+        return written
+
+    def _write(self, trail, latest):
+        # A rider deleted since their pings arrived would fail the whole
+        # batch on its foreign key, every flush, forever; drop them instead.
+        rider_ids = latest.keys() | {rider_id for rider_id, _ in trail}
+        existing = set(RiderProfile.objects.filter(pk__in=rider_ids).values_list('pk', flat=True))
+        if existing != rider_ids:
+            trail = [(rider_id, ping) for rider_id, ping in trail if rider_id in existing]
+            latest = {rider_id: ping for rider_id, ping in latest.items() if rider_id in existing}
+            with self.lock:
+                for rider_id in rider_ids - existing:
+                    self.latest.pop(rider_id, None)
+                    self.kept.pop(rider_id, None)
+
+        RiderLocation.objects.bulk_create([
+            RiderLocation(
+                rider_id=rider_id, latitude=ping.lat, longitude=ping.lon,
+                accuracy_m=ping.accuracy, recorded_at=ping.recorded_at,
+            )
+            for rider_id, ping in trail
+        ], batch_size=1000)
+        RiderProfile.objects.bulk_update([
+            RiderProfile(
+                pk=rider_id, latitude=ping.lat, longitude=ping.lon,
+                geohash=geohash_encode(ping.lat, ping.lon), position_at=ping.recorded_at,
+            )
+            for rider_id, ping in latest.items()
+        ], ['latitude', 'longitude', 'geohash', 'position_at'], batch_size=500)
+        return len(trail), len(latest)
+
+    def _start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self.lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="rider-location-flush", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Flushing rider locations failed; retrying next interval")
+            finally:
+                close_old_connections()
+
+
+buffer = LocationBuffer()
+
+
+def _reset_after_fork():
+    global buffer
+    buffer = LocationBuffer()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@atexit.register
+def _flush_at_exit():
+    try:
+        buffer.flush()
+    except Exception:
+        logger.exception("Could not flush rider locations at exit")
+
+
+# -------------------------
+# API
+# -------------------------
+def ingest(rider_id, items):
+    """Parse and buffer one batch of pings. Returns ``(accepted, kept, rejected)``."""
+    pings, rejected = parse_pings(items)
+    kept = buffer.add(rider_id, pings) if pings else 0
+    return len(pings), kept, rejected
+
+
+def latest_position(rider_id):
+    """The rider's newest ``Ping``: this process, then the cache, then the database."""
+    ping = buffer.latest.get(rider_id)
+    if ping is not None:
+        return ping
+    cached = cache.get(position_key(rider_id))
+    if cached is not None:
+        return Ping(*cached)
+    row = RiderProfile.objects.filter(pk=rider_id, position_at__isnull=False).values_list(
+        'latitude', 'longitude', 'position_at',
+    ).first()
+    if row is None:
+        return None
+    return Ping(row[0], row[1], row[2].timestamp())
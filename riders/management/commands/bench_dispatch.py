@@ -0,0 +1,128 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.geo import KDTree, haversine_km
+from riders.dispatch import (
+    DISPATCH_MAX_KM, DISPATCH_MAX_LOAD, DISPATCH_MAX_PER_CYCLE, OpenJob, RiderState, plan, score,
+)
+
+NAIROBI = (-1.40, 36.65, -1.15, 37.00)  # min lat, min lon, max lat, max lon
+
+
+def per_job(jobs, riders):
+    """Dispatch without batching: oldest job first, every rider scored, best one with room wins."""
+    load = {rider_id: rider.state.load for rider_id, rider in riders.items()}
+    new = dict.fromkeys(riders, 0)
+    assignments = []
+    for job in sorted(jobs, key=lambda job: -job.waited):
+        best = None
+        for rider_id, rider in riders.items():
+            if load[rider_id] >= DISPATCH_MAX_LOAD or new[rider_id] >= DISPATCH_MAX_PER_CYCLE:
+                continue
+            km = haversine_km(job.lat, job.lon, rider.lat, rider.lon)
+            if km <= DISPATCH_MAX_KM:
+                cost = score(job, rider.state, km, load[rider_id])
+                if best is None or cost < best[0]:
+                    best = (cost, km, rider_id)
+        if best is not None:
+            load[best[2]] += 1
+            new[best[2]] += 1
+            assignments.append((job.id, best[2], best[1], best[0]))
+    return assignments
+
+
+class SimRider:
+    def __init__(self, state, lat, lon):
+        self.state, self.lat, self.lon = state, lat, lon
+
+
+class Command(BaseCommand):
+    help = "Simulate dispatch cycles in memory: plan time, jobs assigned and pickup distance per cycle."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=5000, help="Open jobs per cycle.")
+        parser.add_argument("--riders", type=int, default=2000)
+        parser.add_argument("--shops", type=int, default=300, help="Pickup points the jobs start from.")
+        parser.add_argument("--cycles", type=int, default=5)
+        parser.add_argument("--cycle-seconds", type=int, default=30, help="Simulated time between cycles.")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--baseline", action="store_true",
+            help="Also time dispatching the first cycle one job at a time over every rider.",
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        min_lat, min_lon, max_lat, max_lon = NAIROBI
+        riders = {}
+        positions = []
+        for rider_id in range(1, options["riders"] + 1):
+            rated = rng.random() > 0.1
+            state = RiderState(
+                rider_id, rng.uniform(3, 5) if rated else 0.0, rated, rng.choice((0, 0, 0, 1, 2)), rng.random() < 0.05,
+            )
+            lat, lon = rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)
+            riders[rider_id] = state
+            positions.append((rider_id, lat, lon))
+
+        started = time.perf_counter()
+        tree = KDTree(positions)
+        self.stdout.write(f"{options['riders']} riders, index built in {(time.perf_counter() - started) * 1000:.0f} ms")
+        shops = [(rng.uniform(min_lat, max_lat), rng.uniform(min_lon, max_lon)) for _ in range(options["shops"])]
+
+        next_id = 1
+        waiting = []
+        self.stdout.write(
+            f"{'cycle':>5}{'open':>7}{'assigned':>10}{'left':>7}{'riders used':>13}"
+            f"{'mean km':>9}{'p95 km':>8}{'plan ms':>9}"
+        )
+        timings = []
+        for cycle in range(1, options["cycles"] + 1):
+            waiting = [job._replace(waited=job.waited + options["cycle_seconds"]) for job in waiting]
+            while len(waiting) < options["jobs"]:
+                lat, lon = rng.choice(shops)  # jobs are picked up at their origin shop
+                waiting.append(OpenJob(next_id, lat, lon, rng.uniform(60, 600)))
+                next_id += 1
+            if cycle == 1 and options["baseline"]:
+                first_cycle = (list(waiting), dict(riders))
+
+            started = time.perf_counter()
+            assignments = plan(waiting, riders, tree.nearest)
+            elapsed = time.perf_counter() - started
+            timings.append(elapsed)
+
+            kms = sorted(a.km for a in assignments)
+            assigned = {a.job_id for a in assignments}
+            self.stdout.write(
+                f"{cycle:>5}{len(waiting):>7}{len(assignments):>10}{len(waiting) - len(assignments):>7}"
+                f"{len({a.rider_id for a in assignments}):>13}"
+                f"{statistics.fmean(kms) if kms else 0:>9.2f}{kms[int(len(kms) * 0.95)] if kms else 0:>8.2f}"
+                f"{elapsed * 1000:>9.0f}"
+            )
+            waiting = [job for job in waiting if job.id not in assigned]
+            # Between cycles riders take their new jobs and finish about half of what they hold.
+            new = {}
+            for a in assignments:
+                new[a.rider_id] = new.get(a.rider_id, 0) + 1
+            for rider_id, state in riders.items():
+                load = state.load + new.get(rider_id, 0)
+                riders[rider_id] = state._replace(load=sum(rng.random() < 0.5 for _ in range(load)))
+
+        self.stdout.write(f"median plan time {statistics.median(timings) * 1000:.0f} ms per cycle")
+
+        if options["baseline"]:
+            jobs, states = first_cycle
+            sim = {rider_id: SimRider(states[rider_id], lat, lon) for rider_id, lat, lon in positions}
+            started = time.perf_counter()
+            sequential = per_job(jobs, sim)
+            elapsed = time.perf_counter() - started
+            batched = plan(jobs, states, tree.nearest)
+            self.stdout.write(
+                f"cycle 1 one job at a time: {len(sequential)} assigned, "
+                f"mean {statistics.fmean(a[2] for a in sequential):.2f} km, {elapsed * 1000:.0f} ms; "
+                f"batched: {len(batched)} assigned, mean {statistics.fmean(a.km for a in batched):.2f} km"
+            )
+        self.stdout.write(self.style.SUCCESS("Done."))
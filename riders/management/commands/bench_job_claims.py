@@ -0,0 +1,109 @@
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from parcels.models import Parcel
+from riders import claims
+from riders.models import AvailableJob, Job, RiderProfile
+
+
+def naive_take(job_id, rider):
+    """The old bid_job: read the listing, create the Job, delete the listing, no locking."""
+    available_job = AvailableJob.objects.get(pk=job_id)
+    job = Job.objects.create(parcel=available_job.parcel, rider=rider, bid_amount=available_job.min_bid_amount)
+    available_job.delete()
+    return job
+
+
+class Command(BaseCommand):
+    help = "Race many riders for the same AvailableJobs and report claims per second and lost races."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--riders", type=int, default=200, help="Concurrent riders (one thread and connection each).")
+        parser.add_argument("--jobs", type=int, default=1000)
+        parser.add_argument(
+            "--mode", choices=["take", "next", "naive"], default="take",
+            help="take: everyone bids on the oldest job left; next: claim_next() then take; "
+                 "naive: the unlocked read/create/delete bid_job used to do.",
+        )
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8].upper()
+        prefix = f"BENCH-{tag}-"
+        User = get_user_model()
+        users = User.objects.bulk_create([User(username=f"bench-{tag}-{i}") for i in range(options["riders"])])
+        try:
+            riders = RiderProfile.objects.bulk_create([RiderProfile(user=user) for user in users])
+            parcels = Parcel.objects.bulk_create([
+                Parcel(reference=f"{prefix}{i}", tracking_number=f"{prefix}{i}", customer_name="Bench", destination="Nairobi")
+                for i in range(options["jobs"])
+            ])
+            AvailableJob.objects.bulk_create([AvailableJob(parcel=parcel) for parcel in parcels])
+            bench_jobs = AvailableJob.objects.filter(parcel__reference__startswith=prefix)
+            job_ids = list(bench_jobs.order_by("pk").values_list("pk", flat=True))
+            result = self.race(options["mode"], riders, job_ids, bench_jobs)
+            assigned = Job.objects.filter(parcel__reference__startswith=prefix).count()
+        finally:
+            Parcel.objects.filter(reference__startswith=prefix).delete()
+            User.objects.filter(username__startswith=f"bench-{tag}-").delete()
+
+        won, lost, errors, elapsed = result
+        self.stdout.write(f"{options['mode']}: {options['riders']} riders, {options['jobs']} jobs on {connection.vendor}")
+        self.stdout.write(f"{'jobs won':<22}{won:>10}")
+        self.stdout.write(f"{'jobs assigned':<22}{assigned:>10}")
+        self.stdout.write(f"{'lost races':<22}{lost:>10}")
+        self.stdout.write(f"{'errors (HTTP 500s)':<22}{len(errors):>10}")
+        self.stdout.write(f"{'seconds':<22}{elapsed:>10.2f}")
+        self.stdout.write(f"{'claims/s':<22}{won / elapsed:>10.0f}")
+        for error in sorted({f"{type(e).__name__}: {e}" for e in errors})[:5]:
+            self.stdout.write(f"  {error}")
+        if won != assigned or errors:
+            self.stdout.write(self.style.ERROR("Some riders won a job they did not get, or saw an error."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Every job went to exactly one rider."))
+
+    def race(self, mode, riders, job_ids, bench_jobs):
+        taken = set()  # what the riders' live feeds have already removed
+        won, lost, errors = [], [], []
+        start = threading.Barrier(len(riders) + 1)
+
+        def bid(rider):
+            try:
+                start.wait()
+                while True:
+                    if mode == "next":
+                        held = claims.claim_next(rider, queryset=bench_jobs)
+                        if held is None:
+                            break
+                        job_id = held.pk
+                    else:
+                        job_id = next((job_id for job_id in job_ids if job_id not in taken), None)
+                        if job_id is None:
+                            break
+                    try:
+                        job = naive_take(job_id, rider) if mode == "naive" else claims.take(job_id, rider)
+                    except AvailableJob.DoesNotExist:
+                        job = None
+                    except Exception as e:
+                        errors.append(e)
+                        taken.add(job_id)
+                        continue
+                    taken.add(job_id)
+                    (won if job else lost).append(job_id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=bid, args=(rider,)) for rider in riders]
+        for thread in threads:
+            thread.start()
+        start.wait()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return len(won), len(lost), errors, time.perf_counter() - started
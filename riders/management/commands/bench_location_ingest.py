@@ -0,0 +1,117 @@
+import json
+import random
+import threading
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from riders import location
+from riders.models import RiderLocation, RiderProfile
+
+
+def batches(rider_ids, pings_per_batch, rounds, seed=1):
+    """One app upload per rider per round: ``pings_per_batch`` one-second fixes along a jittery line."""
+    rng = random.Random(seed)
+    start = timezone.now().timestamp() - rounds * pings_per_batch - 60
+    positions = {rider_id: [rng.uniform(-1.35, -1.20), rng.uniform(36.70, 36.95)] for rider_id in rider_ids}
+    for round_no in range(rounds):
+        for rider_id in rider_ids:
+            pings = []
+            for i in range(pings_per_batch):
+                position = positions[rider_id]
+                position[0] += rng.uniform(-0.00005, 0.00012)  # up to ~13 m a second
+                position[1] += rng.uniform(-0.00005, 0.00012)
+                t = start + round_no * pings_per_batch + i
+                pings.append({"lat": position[0], "lon": position[1], "t": t * 1000, "acc": 8})
+            yield rider_id, pings
+
+
+class Command(BaseCommand):
+    help = "Measure rider GPS ping ingest: in-process throughput, bulk flush cost and the HTTP endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--riders", type=int, default=2000)
+        parser.add_argument("--pings-per-batch", type=int, default=10, help="Fixes per upload (one a second).")
+        parser.add_argument("--rounds", type=int, default=6)
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--http-requests", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        User = get_user_model()
+        users = User.objects.bulk_create([User(username=f"bench-{tag}-{i}") for i in range(options["riders"])])
+        try:
+            riders = RiderProfile.objects.bulk_create([RiderProfile(user=user) for user in users])
+            rider_ids = [rider.pk for rider in riders]
+            uploads = list(batches(rider_ids, options["pings_per_batch"], options["rounds"]))
+            total = sum(len(pings) for _, pings in uploads)
+
+            buffer = location.LocationBuffer(flush_interval=None)
+            original, location.buffer = location.buffer, buffer
+            try:
+                self.bench_ingest(uploads, total, options["threads"])
+                self.bench_flush(buffer, total)
+                self.bench_http(users[0], options["http_requests"], options["pings_per_batch"])
+            finally:
+                location.buffer = original
+        finally:
+            RiderLocation.objects.filter(rider__user__username__startswith=f"bench-{tag}-").delete()
+            User.objects.filter(username__startswith=f"bench-{tag}-").delete()
+
+    def bench_ingest(self, uploads, total, threads):
+        started = time.perf_counter()
+        for rider_id, pings in uploads[: len(uploads) // 2]:
+            location.ingest(rider_id, pings)
+        half = sum(len(pings) for _, pings in uploads[: len(uploads) // 2])
+        single = half / (time.perf_counter() - started)
+
+        rest = uploads[len(uploads) // 2:]
+        chunks = [rest[i::threads] for i in range(threads)]
+        workers = [
+            threading.Thread(target=lambda chunk: [location.ingest(r, p) for r, p in chunk], args=(chunk,))
+            for chunk in chunks
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        threaded = (total - half) / (time.perf_counter() - started)
+        self.stdout.write(f"{total} pings in {len(uploads)} uploads")
+        self.stdout.write(f"{'ingest, 1 thread':<32}{single:>12,.0f} pings/s")
+        self.stdout.write(f"{f'ingest, {threads} threads':<32}{threaded:>12,.0f} pings/s")
+
+    def bench_flush(self, buffer, total):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            written, moved = buffer.flush()
+            elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{'flush':<32}{elapsed * 1000:>12,.0f} ms for {written} trail rows "
+            f"(of {total} pings) and {moved} riders, {len(queries)} queries"
+        )
+
+    def bench_http(self, user, requests, pings_per_batch):
+        client = Client()
+        client.force_login(user)
+        url = reverse("rider_location")
+        rider_id = RiderProfile.objects.get(user=user).pk
+        bodies = [json.dumps({"pings": pings}) for _, pings in batches([rider_id], pings_per_batch, requests, seed=2)]
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for body in bodies:
+                client.post(url, body, content_type="application/json")
+            elapsed = time.perf_counter() - started
+        writes = sum(1 for query in queries if query["sql"].startswith(("INSERT", "UPDATE", "DELETE")))
+        self.stdout.write(
+            f"{'HTTP endpoint, 1 thread':<32}{requests / elapsed:>12,.0f} req/s = "
+            f"{requests * pings_per_batch / elapsed:,.0f} pings/s, {len(queries) / requests:.1f} queries/req, "
+            f"{writes} writes"
+        )
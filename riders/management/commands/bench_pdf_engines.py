@@ -0,0 +1,103 @@
+import re
+import statistics
+import time
+from datetime import datetime
+from decimal import Decimal
+from io import BytesIO
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+
+from riders.pdf import render_html
+
+# The templates pull the logo from applemall.co.ke; leave it out unless asked
+# so the numbers measure rendering, not the network.
+REMOTE_IMAGE = re.compile(r"<img[^>]+src=\"https?://[^>]+>")
+
+
+def sample_receipt():
+    parcel = SimpleNamespace(
+        reference="REF-BENCH-0001", customer="Jane Wanjiku", customer_email="jane@example.com",
+    )
+    return SimpleNamespace(parcel=parcel, amount=Decimal("1250.00"), created_at=datetime(2025, 10, 18, 9, 30))
+
+
+def weasyprint_pdf(html):
+    from weasyprint import HTML
+
+    return HTML(string=html).write_pdf()
+
+
+def reportlab_pdf(receipt):
+    """The receipt drawn directly with ReportLab (no HTML layer)."""
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    output = BytesIO()
+    pdf = canvas.Canvas(output, pagesize=A4)
+    width, height = A4
+    pdf.setFont("Helvetica-Bold", 21)
+    pdf.drawCentredString(width / 2, height - 90, "Payment Receipt")
+    pdf.setFont("Helvetica-Bold", 13.5)
+    pdf.drawString(45, height - 140, "Parcel Details")
+    rows = (
+        ("Parcel Reference", receipt.parcel.reference),
+        ("Customer Name", receipt.parcel.customer),
+        ("Email", receipt.parcel.customer_email),
+        ("Amount Paid", f"KES {receipt.amount}"),
+        ("Date", str(receipt.created_at)),
+    )
+    y = height - 160
+    for label, value in rows:
+        pdf.rect(45, y - 25, width - 90, 25)
+        pdf.line(220, y - 25, 220, y)
+        pdf.setFont("Helvetica-Bold", 10)
+        pdf.drawString(52, y - 17, label)
+        pdf.setFont("Helvetica", 10)
+        pdf.drawString(227, y - 17, value)
+        y -= 25
+    pdf.setFont("Helvetica", 9)
+    pdf.drawCentredString(width / 2, y - 40, "Thank you for using Applemall.")
+    pdf.showPage()
+    pdf.save()
+    return output.getvalue()
+
+
+class Command(BaseCommand):
+    help = "Compare xhtml2pdf, WeasyPrint and ReportLab on the rider receipt."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=50)
+        parser.add_argument("--with-images", action="store_true", help="Keep the remote logo image.")
+
+    def handle(self, *args, **options):
+        receipt = sample_receipt()
+        html = render_to_string("riders/receipt_pdf.html", {"invoice": receipt})
+        if not options["with_images"]:
+            html = REMOTE_IMAGE.sub("", html)
+
+        engines = (
+            ("xhtml2pdf", lambda: render_html(html)),
+            ("weasyprint", lambda: weasyprint_pdf(html)),
+            ("reportlab", lambda: reportlab_pdf(receipt)),
+        )
+
+        self.stdout.write(f"{options['runs']} receipt renders per engine")
+        self.stdout.write(f"{'engine':<12}{'mean ms':>10}{'p95 ms':>10}{'first ms':>10}{'bytes':>10}")
+        for name, render in engines:
+            timings = []
+            try:
+                for _ in range(options["runs"] + 1):
+                    started = time.perf_counter()
+                    pdf = render()
+                    timings.append((time.perf_counter() - started) * 1000)
+            except (ImportError, OSError) as exc:
+                # WeasyPrint needs the Pango system libraries.
+                self.stdout.write(f"{name:<12}unavailable: {str(exc).splitlines()[0]}")
+                continue
+            first, timings = timings[0], sorted(timings[1:])
+            p95 = timings[max(0, int(len(timings) * 0.95) - 1)]
+            self.stdout.write(
+                f"{name:<12}{statistics.mean(timings):>10.1f}{p95:>10.1f}{first:>10.1f}{len(pdf):>10}"
+            )
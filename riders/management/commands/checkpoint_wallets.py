@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from riders.models import RiderWallet
+from riders.wallet import WALLET_CHECKPOINT_EVERY, checkpoint
+
+
+class Command(BaseCommand):
+    help = "Checkpoint rider wallet ledgers and report wallets whose balance columns drifted from them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--every", type=int, default=WALLET_CHECKPOINT_EVERY,
+            help="Checkpoint a wallet once it has this many postings since its last checkpoint.",
+        )
+        parser.add_argument(
+            "--opening-balances", action="store_true",
+            help="Once, after deploying the ledger: record existing balances as opening checkpoints.",
+        )
+        parser.add_argument("--loop", action="store_true", help="Keep checkpointing.")
+        parser.add_argument("--sleep", type=float, default=300.0, help="Seconds between passes.")
+
+    def handle(self, *args, **options):
+        created = drifted = 0
+        while True:
+            for wallet_id in RiderWallet.objects.order_by("pk").values_list("pk", flat=True).iterator():
+                point, drift = checkpoint(
+                    wallet_id, min_transactions=options["every"], opening=options["opening_balances"],
+                )
+                created += point is not None
+                if any(drift):
+                    drifted += 1
+                    self.stderr.write(self.style.ERROR(
+                        f"Wallet {wallet_id} differs from its ledger by balance {drift[0]}, held {drift[1]}"
+                    ))
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Created {created} checkpoint(s); {drifted} wallet(s) drifted."))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from riders.dispatch import DISPATCH_BATCH, dispatch
+
+
+class Command(BaseCommand):
+    help = "Match open AvailableJobs to nearby riders in batches (see riders.dispatch)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep dispatching as jobs come in.")
+        parser.add_argument("--sleep", type=float, default=10.0, help="Seconds between cycles.")
+        parser.add_argument("--limit", type=int, default=DISPATCH_BATCH, help="Oldest open jobs planned per cycle.")
+        parser.add_argument("--dry-run", action="store_true", help="Print the plan without assigning anything.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            started = time.perf_counter()
+            result = dispatch(dry_run=options["dry_run"], limit=options["limit"])
+            elapsed = time.perf_counter() - started
+            if options["dry_run"]:
+                for assignment in result.assignments:
+                    self.stdout.write(
+                        f"job {assignment.job_id:>8} -> rider {assignment.rider_id:>6}"
+                        f"{assignment.km:>8.2f} km  score {assignment.score:.3f}"
+                    )
+            done = len(result.assignments) if options["dry_run"] else len(result.created)
+            total += done
+            if result.jobs:
+                self.stdout.write(
+                    f"{'Planned' if options['dry_run'] else 'Assigned'} {done} of {result.jobs} open job(s) "
+                    f"among {result.riders} rider(s) in {elapsed:.2f}s"
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        verb = "Would assign" if options["dry_run"] else "Assigned"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} job(s)."))
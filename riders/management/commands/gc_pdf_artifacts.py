@@ -0,0 +1,36 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from riders.pdf import ARTIFACT_DIR
+
+
+class Command(BaseCommand):
+    help = "Delete cached receipt/delivery-note PDFs older than --days (they are re-rendered on demand)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=30)
+        parser.add_argument("--dry-run", action="store_true", help="Only list the files that would be removed.")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        try:
+            _, files = default_storage.listdir(ARTIFACT_DIR)
+        except FileNotFoundError:
+            files = []
+
+        removed = 0
+        for filename in files:
+            name = f"{ARTIFACT_DIR}/{filename}"
+            if default_storage.get_modified_time(name) >= cutoff:
+                continue
+            if options["dry_run"]:
+                self.stdout.write(f"Would remove {name}")
+            else:
+                default_storage.delete(name)
+            removed += 1
+
+        verb = "Would remove" if options["dry_run"] else "Removed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {removed} cached PDF(s) older than {options['days']} days."))
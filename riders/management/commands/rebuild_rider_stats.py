@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from riders.jobs import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute every rider's rating and job counters from the RiderRating and Job tables."
+
+    def handle(self, *args, **options):
+        count = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {count} rider(s)."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from riders.claims import release_expired
+
+
+class Command(BaseCommand):
+    help = "Release rider holds on AvailableJobs that have expired and show those jobs to riders again."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep releasing as holds expire.")
+        parser.add_argument("--sleep", type=float, default=5.0, help="Seconds between passes.")
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            released = release_expired()
+            total += released
+            if released:
+                self.stdout.write(f"Released {released} job(s)")
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+        self.stdout.write(self.style.SUCCESS(f"Released {total} job(s)."))
@@ -8,7 +8,7 @@ from parcels.models import Parcel  # Ensure Parcel model exists
 # -------------------------# riders/models.py
 from decimal import Decimal
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from parcels.models import Parcel
 
 # -------------------------
@@ -24,13 +24,39 @@ class RiderProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     phone = models.CharField(max_length=20, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ACTIVE')
-    rating = models.FloatField(default=0.0)
+    rating = models.FloatField(default=0.0)  # rating_sum / rating_count
     total_jobs = models.IntegerField(default=0)
+    # Running totals kept by riders.jobs; rebuild with `manage.py rebuild_rider_stats`.
+    rating_sum = models.BigIntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    completed_jobs = models.IntegerField(default=0)
+    # Last reported position; written by riders.geo.set_position().
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, default='', db_index=True)
+    position_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.status}"
 
 
+# -------------------------
+# Rider location history
+# -------------------------
+class RiderLocation(models.Model):
+    """Down-sampled GPS trail, written in bulk by riders.location."""
+    rider = models.ForeignKey(RiderProfile, on_delete=models.CASCADE, related_name='locations')
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    accuracy_m = models.FloatField(null=True, blank=True)
+    recorded_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['rider', 'recorded_at'], name='riderlocation_rider_time'),
+        ]
+
+
 # -------------------------
 # Available jobs to bid
 # -------------------------
@@ -38,6 +64,17 @@ class AvailableJob(models.Model):
     parcel = models.OneToOneField(Parcel, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     min_bid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('60.00'))  # Optional
+    # Held by a rider until claim_expires_at; set and cleared by riders.claims only.
+    claimed_by = models.ForeignKey(
+        RiderProfile, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_jobs',
+    )
+    claim_expires_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Newest-first job feeds, paged by (created_at, id) keysets (riders.feed).
+            models.Index(fields=["-created_at", "-id"], name="availablejob_newest"),
+        ]
 
     def __str__(self):
         return f"Parcel {self.parcel.reference} available"
@@ -57,6 +94,8 @@ class Job(models.Model):
     rider = models.ForeignKey(RiderProfile, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='IN_PROGRESS')
     bid_amount = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('60.00'))
+    # What delivering pays, fixed when the job is taken (riders.jobs.pay_for).
+    rider_pay = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     assigned_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(null=True, blank=True)
 
@@ -76,27 +115,36 @@ class RiderRating(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        # Update rider's average rating
-        all_ratings = self.rider.ratings.all()
-        if all_ratings.exists():
-            avg_rating = sum(r.rating for r in all_ratings) / all_ratings.count()
-            self.rider.rating = avg_rating
-            self.rider.save()
+        # Adjust the rider's running totals (one UPDATE) instead of re-reading every rating.
+        from .jobs import rate
+
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = RiderRating.objects.filter(pk=self.pk).values_list('rider_id', 'rating').first()
+            super().save(*args, **kwargs)
+            if previous == (self.rider_id, self.rating):
+                return
+            if previous:
+                rate(previous[0], -previous[1], -1)
+            rate(self.rider_id, self.rating, 1)
 
 
 # -------------------------
 # Rider wallet for earnings
 # -------------------------
 class RiderWallet(models.Model):
+    # ``balance`` (available) and ``held`` (pending withdrawals) are running totals of
+    # the WalletTransaction ledger, changed only through riders.wallet.
     rider = models.OneToOneField(RiderProfile, on_delete=models.CASCADE)
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    held = models.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+
+    def add_earning(self, amount, reference=None):
+        """Credit ``amount`` (a parcels.tariffs rider pay). A repeated ``reference`` (e.g. ``job:12``) is paid once."""
+        from .wallet import earn
 
-    def add_earning(self, km_travelled):
-        if not isinstance(km_travelled, Decimal):
-            km_travelled = Decimal(km_travelled)
-        self.balance += Decimal('60.00') * km_travelled  # 60 KSH per km
-        self.save()
+        earn(self, amount, reference=reference)
 
     def withdraw(self, amount):
         """
@@ -108,27 +156,116 @@ class RiderWallet(models.Model):
         Raises:
             ValueError: If the amount is greater than the current balance or non-positive.
         """
-        if not isinstance(amount, Decimal):
-            try:
-                amount = Decimal(amount)
-            except (InvalidOperation, TypeError):
-                raise ValueError("Invalid amount")
-
-        if amount <= 0:
-            raise ValueError("Withdrawal amount must be greater than zero")
-
-        if amount > self.balance:
-            raise ValueError("Insufficient balance")
+        from .wallet import pay_out
 
-        self.balance -= amount
-        self.save()
+        pay_out(self, amount)
 
         # Create notification
         RiderNotification.objects.create(
             rider=self.rider,
-            message=f"Wallet withdrawal of Ksh {amount:.2f} successful."
+            message=f"Wallet withdrawal of Ksh {Decimal(amount):.2f} successful."
         )
 
+    def request_withdrawal(self, amount):
+        """Hold ``amount`` for a superadmin to approve. Returns the pending Withdrawal."""
+        from .wallet import request_withdrawal
+
+        return request_withdrawal(self, amount)
+
+
+# -------------------------
+# Wallet ledger
+# -------------------------
+class LedgerAccount(models.TextChoices):
+    # Per wallet: mirrored by RiderWallet.balance / RiderWallet.held.
+    AVAILABLE = 'AVAILABLE', 'Available balance'
+    HELD = 'HELD', 'Held for withdrawal'
+    # Outside the wallet: where earnings come from and payouts go to.
+    PLATFORM = 'PLATFORM', 'Platform'
+    PAYOUT = 'PAYOUT', 'Paid out'
+
+
+class WalletTransaction(models.Model):
+    """
+    One append-only, double-entry posting: ``amount`` leaves ``credit`` and
+    enters ``debit``. Rows are never updated or deleted; corrections are new
+    postings.
+    """
+    KIND_CHOICES = [
+        ('EARNING', 'Earning'),
+        ('WITHDRAWAL', 'Withdrawal'),
+        ('HOLD', 'Withdrawal requested'),
+        ('PAYOUT', 'Withdrawal approved'),
+        ('RELEASE', 'Withdrawal rejected'),
+        ('ADJUSTMENT', 'Adjustment'),
+    ]
+
+    wallet = models.ForeignKey(RiderWallet, on_delete=models.PROTECT, related_name='transactions')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    debit = models.CharField(max_length=20, choices=LedgerAccount.choices)
+    credit = models.CharField(max_length=20, choices=LedgerAccount.choices)
+    # Idempotency key, e.g. "job:12" or "withdrawal:7:payout".
+    reference = models.CharField(max_length=64, unique=True, null=True, blank=True)
+    memo = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=models.Q(amount__gt=0), name='wallettx_amount_positive'),
+            models.CheckConstraint(check=~models.Q(debit=models.F('credit')), name='wallettx_two_accounts'),
+        ]
+        indexes = [
+            models.Index(fields=['wallet', 'id'], name='wallettx_wallet_id'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.amount} {self.credit} → {self.debit}"
+
+
+class WalletCheckpoint(models.Model):
+    """Ledger balances of a wallet up to and including ``last_transaction_id``."""
+    wallet = models.ForeignKey(RiderWallet, on_delete=models.CASCADE, related_name='checkpoints')
+    last_transaction_id = models.BigIntegerField()
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    held = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', '-last_transaction_id'], name='walletckpt_wallet_last'),
+        ]
+
+
+class Withdrawal(models.Model):
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('APPROVED', 'Approved'),
+        ('REJECTED', 'Rejected'),
+    ]
+
+    wallet = models.ForeignKey(RiderWallet, on_delete=models.PROTECT, related_name='withdrawals')
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    requested_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    processed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+',
+    )
+
+    def approve(self, admin_user=None):
+        from .wallet import settle_withdrawal
+
+        settle_withdrawal(self, 'APPROVED', admin_user)
+
+    def reject(self, admin_user=None):
+        from .wallet import settle_withdrawal
+
+        settle_withdrawal(self, 'REJECTED', admin_user)
+
+    def __str__(self):
+        return f"{self.wallet.rider.user.username} withdrawal {self.amount} ({self.status})"
+
 
 # -------------------------
 # Rider notifications
@@ -139,5 +276,10 @@ class RiderNotification(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["rider", "read", "-created_at"], name="ridernotif_rider_read_time"),
+        ]
+
     def __str__(self):
         return f"Notification for {self.rider.user.username}: {self.message[:50]}"
@@ -0,0 +1,184 @@
+# riders/pdf.py
+"""
+PDF render service for receipts and delivery notes.
+
+Rendering happens in a small process pool, never in the request thread.
+Finished PDFs are stored under ``pdf_artifacts/<key>.pdf``, where the key
+hashes the template and the ``updated_at`` of what it shows. Documents are
+served from GET URLs (``riders.views.parcel_pdf``): later requests get the
+stored file with an ETag, and a matching ``If-None-Match`` gets a 304.
+
+A request waits up to ``PDF_RENDER_WAIT`` seconds for a fresh render. If the
+render is not done by then, the response is 202 with ``Retry-After`` and the
+render finishes in the background; the client polls the same URL. When ``PDF_QUEUE_LIMIT`` renders are
+already in flight, new ones are refused with 503, so a burst of slow
+documents cannot tie up every web worker.
+"""
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from django.template.loader import render_to_string
+from django.utils.http import parse_etags
+from xhtml2pdf import pisa
+
+ARTIFACT_DIR = "pdf_artifacts"
+
+PDF_RENDER_WORKERS = getattr(settings, "PDF_RENDER_WORKERS", 2)
+PDF_QUEUE_LIMIT = getattr(settings, "PDF_QUEUE_LIMIT", 8)
+PDF_RENDER_WAIT = getattr(settings, "PDF_RENDER_WAIT", 2)
+RETRY_AFTER = 5
+
+
+class RenderBusy(Exception):
+    """Too many renders in flight; try again later."""
+
+
+class RenderFailed(Exception):
+    pass
+
+
+_pool = None
+_inflight = {}
+_lock = threading.Lock()
+
+
+def _reset():
+    global _pool
+    _pool = None
+    _inflight.clear()
+
+
+def _discard_pool():
+    """Shut down a broken pool so its surviving workers exit; the next render starts a new one."""
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+        _inflight.clear()
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+if hasattr(os, "register_at_fork"):
+    # A forked web worker must start its own pool, not share its parent's.
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS)
+    return _pool
+
+
+def render_html(html):
+    """HTML to PDF bytes with xhtml2pdf. Runs in a pool worker."""
+    output = BytesIO()
+    status = pisa.CreatePDF(html, dest=output)
+    if status.err:
+        raise RenderFailed(f"xhtml2pdf reported {status.err} error(s)")
+    return output.getvalue()
+
+
+def artifact_key(template_name, *versions):
+    """Key for a render of ``template_name`` showing objects at ``versions``."""
+    parts = [template_name, *(str(v) for v in versions)]
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def artifact_name(key):
+    return f"{ARTIFACT_DIR}/{key}.pdf"
+
+
+def _store(key, future):
+    try:
+        pdf = future.result()
+    except Exception:
+        pdf = None
+    name = artifact_name(key)
+    if pdf and not default_storage.exists(name):
+        saved = default_storage.save(name, ContentFile(pdf))
+        if saved != name:
+            # Another worker stored the same artifact first.
+            default_storage.delete(saved)
+    with _lock:
+        _inflight.pop(key, None)
+
+
+def submit(key, template_name, context):
+    """
+    Start rendering ``template_name`` unless the same key is already being
+    rendered, and return its future. Raises ``RenderBusy`` when full.
+    """
+    with _lock:
+        future = _inflight.get(key)
+        if future is not None:
+            return future
+        if len(_inflight) >= PDF_QUEUE_LIMIT:
+            raise RenderBusy()
+        html = render_to_string(template_name, context)
+        future = _get_pool().submit(render_html, html)
+        _inflight[key] = future
+    future.add_done_callback(lambda f: _store(key, f))
+    return future
+
+
+def _serve(name, etag, filename):
+    response = FileResponse(default_storage.open(name, "rb"), content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="{filename}"'
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=0, must-revalidate"
+    return response
+
+
+def pdf_response(request, template_name, context, versions, filename):
+    """
+    Serve ``template_name`` rendered with ``context`` as a PDF, in answer to
+    a GET that can be repeated until the render is done. ``versions`` (for
+    example ``updated_at`` values) must change whenever the output would.
+    """
+    key = artifact_key(template_name, *versions)
+    etag = f'"{key}"'
+    name = artifact_name(key)
+
+    if etag in parse_etags(request.headers.get("If-None-Match", "")) and default_storage.exists(name):
+        response = HttpResponse(status=304)
+        response["ETag"] = etag
+        return response
+    if default_storage.exists(name):
+        return _serve(name, etag, filename)
+
+    try:
+        future = submit(key, template_name, context)
+        pdf = future.result(timeout=PDF_RENDER_WAIT)
+    except BrokenProcessPool:
+        # A worker died (out of memory, killed); start a fresh pool next time.
+        _discard_pool()
+        response = HttpResponse("PDF rendering is busy, please retry shortly.", status=503)
+        response["Retry-After"] = str(RETRY_AFTER)
+        return response
+    except RenderBusy:
+        response = HttpResponse("PDF rendering is busy, please retry shortly.", status=503)
+        response["Retry-After"] = str(RETRY_AFTER)
+        return response
+    except FutureTimeout:
+        response = HttpResponse("Your PDF is being prepared, please retry shortly.", status=202)
+        response["Retry-After"] = str(RETRY_AFTER)
+        return response
+    except RenderFailed:
+        return HttpResponse("Error generating PDF", status=500)
+
+    # The done-callback may not have stored it yet; serve what we have.
+    response = HttpResponse(pdf, content_type="application/pdf")
+    response["Content-Disposition"] = f'inline; filename="{filename}"'
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=0, must-revalidate"
+    return response
@@ -0,0 +1,63 @@
+# riders/signals.py
+# Live job feed (riders.views.job_stream): every active rider listens on
+# "jobs", and each rider on "rider:<id>" for their own notifications.
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.pubsub import publish
+
+from .claims import listing
+from .jobs import count_jobs, rate
+from .location import rider_of_user_key
+from .models import AvailableJob, Job, RiderNotification, RiderProfile, RiderRating
+
+
+@receiver(post_save, sender=AvailableJob)
+def publish_new_job(sender, instance, created, **kwargs):
+    if not created:
+        return
+    job = listing(instance)
+    transaction.on_commit(lambda: publish("jobs", "job_available", job))
+
+
+@receiver(post_delete, sender=AvailableJob)
+def publish_taken_job(sender, instance, **kwargs):
+    job_id = instance.id
+    transaction.on_commit(lambda: publish("jobs", "job_taken", {"id": job_id}))
+
+
+@receiver(post_save, sender=RiderNotification)
+def publish_rider_notification(sender, instance, created, **kwargs):
+    if not created:
+        return
+    notification = {"message": instance.message, "created_at": instance.created_at}
+    channel = f"rider:{instance.rider_id}"
+    transaction.on_commit(lambda: publish(channel, "notification", notification))
+
+
+# Rider counters (riders.jobs): new jobs count at once; completions are
+# counted by riders.jobs.move().
+@receiver(post_save, sender=Job)
+def count_new_job(sender, instance, created, **kwargs):
+    if created:
+        count_jobs(instance.rider_id, total=1, completed=int(instance.status == 'DELIVERED'))
+
+
+@receiver(post_delete, sender=Job)
+def uncount_deleted_job(sender, instance, **kwargs):
+    count_jobs(instance.rider_id, total=-1, completed=-int(instance.status == 'DELIVERED'))
+
+
+@receiver(post_delete, sender=RiderRating)
+def uncount_deleted_rating(sender, instance, **kwargs):
+    rate(instance.rider_id, -instance.rating, -1)
+
+
+# riders.location.active_rider_id caches user -> rider; a suspension or a
+# deleted profile takes effect on the next request, not minutes later.
+@receiver(post_save, sender=RiderProfile)
+@receiver(post_delete, sender=RiderProfile)
+def forget_active_rider(sender, instance, **kwargs):
+    cache.delete(rider_of_user_key(instance.user_id))
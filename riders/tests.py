@@ -1,3 +1,618 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import render_to_string
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import formats, timezone
+
+from core.geo import KDTree
+from parcels import tariffs
+from parcels.models import Category, DeliveryZone, Parcel, Receipt, Tariff
+from shops.geo import shop_index
+from shops.models import Shop
+
+from . import claims, dispatch, jobs, location, pdf, wallet
+from . import geo as rider_geo
+from .models import (
+    AvailableJob, Job, RiderLocation, RiderNotification, RiderProfile, RiderRating, RiderWallet, WalletTransaction,
+    Withdrawal,
+)
+
+
+class RiderStatsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.client_user = User.objects.create(username="client")
+        cls.rider = RiderProfile.objects.create(user=User.objects.create(username="rider"))
+
+    def make_job(self, n, **kwargs):
+        parcel = Parcel.objects.create(reference=f"JOB-{n}", customer_name="C", destination="Nakuru")
+        return Job.objects.create(parcel=parcel, rider=self.rider, **kwargs)
+
+    def rate(self, job, rating):
+        return RiderRating.objects.create(rider=self.rider, client=self.client_user, job=job, rating=rating)
+
+    def test_rating_cost_does_not_grow_with_history(self):
+        job = self.make_job(1)
+        with CaptureQueriesContext(connection) as first:
+            self.rate(job, 5)
+        for rating in [4, 3] * 50:
+            self.rate(job, rating)
+        with CaptureQueriesContext(connection) as later:
+            self.rate(job, 2)
+        self.assertEqual(len(first), len(later))
+
+        self.rider.refresh_from_db()
+        self.assertEqual((self.rider.rating_sum, self.rider.rating_count), (357, 102))
+        self.assertAlmostEqual(self.rider.rating, 357 / 102)
+
+    def test_changed_and_deleted_ratings_are_taken_back_out(self):
+        job = self.make_job(1)
+        first, second = self.rate(job, 5), self.rate(job, 1)
+        second.rating = 3
+        second.save()
+        first.delete()
+        self.rider.refresh_from_db()
+        self.assertEqual((self.rider.rating_sum, self.rider.rating_count, self.rider.rating), (3, 1, 3.0))
+
+    def test_job_counters_follow_transitions_once(self):
+        job = self.make_job(1)
+        self.make_job(2)
+        jobs.move(job, 'ARRIVED')
+        jobs.move(job, 'DELIVERED')
+        with self.assertRaises(jobs.InvalidJobTransition):
+            jobs.move(job, 'DELIVERED')
+
+        self.rider.refresh_from_db()
+        self.assertEqual((self.rider.total_jobs, self.rider.completed_jobs), (2, 1))
+
+    def test_admin_reassignment_moves_the_counters(self):
+        other = RiderProfile.objects.create(user=get_user_model().objects.create(username="other"))
+        job = self.make_job(1)
+        jobs.move(job, 'DELIVERED')
+        self.make_job(2)
+        self.client.force_login(get_user_model().objects.create(username="boss", is_staff=True, is_superuser=True))
+        url = reverse('admin:riders_job_change', args=[job.pk])
+        form = {'parcel': job.parcel_id, 'rider': other.pk, 'status': 'DELIVERED', 'bid_amount': '60.00'}
+        self.assertEqual(self.client.post(url, form).status_code, 302)
+
+        counters = dict(RiderProfile.objects.values_list('pk', 'total_jobs'))
+        completed = dict(RiderProfile.objects.values_list('pk', 'completed_jobs'))
+        self.assertEqual((counters[self.rider.pk], completed[self.rider.pk]), (1, 0))
+        self.assertEqual((counters[other.pk], completed[other.pk]), (1, 1))
+        self.assertEqual(Job.objects.get(pk=job.pk).rider, other)
+
+    def test_rebuild_matches_incremental_counters(self):
+        job = self.make_job(1)
+        jobs.move(job, 'DELIVERED')
+        self.rate(job, 4)
+        self.make_job(2)
+        expected = RiderProfile.objects.values('rating', 'rating_sum', 'rating_count', 'total_jobs', 'completed_jobs').get()
+
+        RiderProfile.objects.update(rating=0, rating_sum=0, rating_count=0, total_jobs=0, completed_jobs=0)
+        self.assertEqual(jobs.rebuild_stats(), 1)
+        rebuilt = RiderProfile.objects.values('rating', 'rating_sum', 'rating_count', 'total_jobs', 'completed_jobs').get()
+        self.assertEqual(rebuilt, expected)
+
+
+class WalletLedgerTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.admin = User.objects.create(username="admin", is_superuser=True)
+        cls.rider = RiderProfile.objects.create(user=User.objects.create(username="rider"))
+
+    def setUp(self):
+        self.wallet = RiderWallet.objects.create(rider=self.rider)
+
+    def assertBalances(self, balance, held):
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.wallet.balance, self.wallet.held), (Decimal(balance), Decimal(held)))
+        self.assertEqual(wallet.ledger_balances(self.wallet.pk)[:2], (Decimal(balance), Decimal(held)))
+
+    def test_earning_is_paid_once_per_reference(self):
+        self.wallet.add_earning(Decimal('150.00'), reference="job:1")
+        self.wallet.add_earning(Decimal('150.00'), reference="job:1")
+        self.assertBalances('150.00', '0.00')
+        self.assertEqual(WalletTransaction.objects.count(), 1)
+
+    def test_delivery_scan_pays_the_tariff_not_a_posted_distance(self):
+        shop = Shop.objects.create(name="CBD", latitude=-1.2864, longitude=36.8172)
+        DeliveryZone.objects.create(name="Thika", latitude=-1.0333, longitude=37.0693)
+        tariffs.tables.invalidate()
+        parcel = Parcel.objects.create(reference="PAY-1", customer_name="C", destination="Thika", origin_shop=shop)
+        job = Job.objects.create(parcel=parcel, rider=self.rider)
+
+        self.client.force_login(self.rider.user)
+        url = reverse('scan_parcel', args=[parcel.pk])
+        self.client.post(url, {'action': 'delivery', 'distance_km': '1000'})
+        self.assertBalances(tariffs.quote_parcel(parcel, at=job.assigned_at).rider_pay, '0.00')
+
+    def test_pay_is_fixed_when_the_job_is_taken(self):
+        shop = Shop.objects.create(name="CBD", latitude=-1.2864, longitude=36.8172)
+        tariff = Tariff.objects.create(
+            zone=DeliveryZone.objects.create(name="Kiambu", latitude=-1.17, longitude=36.83), rider_base=100,
+        )
+        tariffs.tables.invalidate()
+        parcel = Parcel.objects.create(reference="FIX-1", customer_name="C", destination="Kiambu", origin_shop=shop)
+        listing = AvailableJob.objects.create(parcel=parcel, min_bid_amount=Decimal('80.00'))
+        job = claims.take(listing.pk, self.rider)
+        self.assertEqual(job.rider_pay, Decimal('100.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tariff.rider_base = 10
+            tariff.save()
+        self.client.force_login(self.rider.user)
+        self.client.post(reverse('scan_parcel', args=[parcel.pk]), {'action': 'delivery'})
+        self.assertBalances('100.00', '0.00')
+
+    def test_unpaid_delivery_does_not_fail_the_scan(self):
+        shop = Shop.objects.create(name="CBD", latitude=-1.2864, longitude=36.8172)
+        Tariff.objects.create(zone=DeliveryZone.objects.create(name="Ruiru", latitude=-1.15, longitude=36.96))
+        tariffs.tables.invalidate()
+        free = Job.objects.create(rider=self.rider, parcel=Parcel.objects.create(
+            reference="FREE-1", customer_name="C", destination="Ruiru", origin_shop=shop,
+        ))
+        refused = Job.objects.create(rider=self.rider, bid_amount=Decimal('70.00'), parcel=Parcel.objects.create(
+            reference="PAY-2", customer_name="C", destination="Nowhere",
+        ))
+        self.client.force_login(self.rider.user)
+
+        response = self.client.post(reverse('scan_parcel', args=[free.parcel.pk]), {'action': 'delivery'})
+        self.assertEqual(response.status_code, 302)
+        free.refresh_from_db()
+        self.assertEqual(free.status, 'DELIVERED')
+        self.assertBalances('0.00', '0.00')
+
+        with mock.patch.object(RiderWallet, "add_earning", side_effect=ValueError("Invalid amount")):
+            response = self.client.post(reverse('scan_parcel', args=[refused.parcel.pk]), {'action': 'delivery'})
+        self.assertEqual(response.status_code, 302)
+        refused.refresh_from_db()
+        self.assertEqual(refused.status, 'IN_PROGRESS')
+
+    def test_withdrawals_cannot_overdraw(self):
+        wallet.earn(self.wallet, '100')
+        with self.assertRaises(wallet.InsufficientFunds):
+            self.wallet.withdraw('100.01')
+        with self.assertRaises(ValueError):
+            self.wallet.withdraw('-5')
+        self.wallet.withdraw('40')
+        self.assertBalances('60.00', '0.00')
+
+    def test_requested_withdrawal_is_held_until_settled(self):
+        wallet.earn(self.wallet, '100')
+        approved = self.wallet.request_withdrawal('70')
+        self.assertBalances('30.00', '70.00')
+        with self.assertRaises(wallet.InsufficientFunds):
+            self.wallet.request_withdrawal('31')
+        self.assertEqual(Withdrawal.objects.count(), 1)
+
+        approved.approve(admin_user=self.admin)
+        with self.assertRaises(ValueError):
+            approved.reject(admin_user=self.admin)
+        self.assertBalances('30.00', '0.00')
+
+        self.wallet.request_withdrawal('30').reject(admin_user=self.admin)
+        self.assertBalances('30.00', '0.00')
+
+    def test_balance_read_starts_from_latest_checkpoint(self):
+        for _ in range(5):
+            wallet.earn(self.wallet, '10')
+        point, drift = wallet.checkpoint(self.wallet.pk, min_transactions=5)
+        self.assertEqual((point.balance, drift), (Decimal('50.00'), (0, 0)))
+        self.assertIsNone(wallet.checkpoint(self.wallet.pk, min_transactions=5)[0])
+
+        self.wallet.withdraw('20')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(wallet.ledger_balances(self.wallet.pk), (Decimal('30.00'), Decimal('0.00'), point.last_transaction_id + 1))
+        self.assertEqual(len(queries), 2)
+
+    def test_opening_balance_and_drift(self):
+        RiderWallet.objects.filter(pk=self.wallet.pk).update(balance=Decimal('500.00'))  # before the ledger
+        wallet.earn(self.wallet, '10')
+        self.assertEqual(wallet.checkpoint(self.wallet.pk, min_transactions=1)[1], (Decimal('500.00'), 0))
+
+        point, drift = wallet.checkpoint(self.wallet.pk, min_transactions=1, opening=True)
+        self.assertEqual((point.balance, drift), (Decimal('510.00'), (0, 0)))
+
+
+class WalletConcurrencyTests(TransactionTestCase):
+    THREADS = 8
+    ROUNDS = 40
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("in-memory SQLite cannot be shared by writer threads; use a file or server database")
+
+    def test_no_lost_updates_under_concurrent_postings(self):
+        rider = RiderProfile.objects.create(user=get_user_model().objects.create(username="rider"))
+        target = RiderWallet.objects.create(rider=rider)
+        withdrawn, refused, errors = [], [], []
+        start = threading.Barrier(self.THREADS)
+
+        def hammer(n):
+            try:
+                start.wait()
+                for i in range(self.ROUNDS):
+                    wallet.earn(target.pk, '10', reference=f"job:{n}:{i}")
+                    try:
+                        wallet.pay_out(target.pk, '7' if n % 2 else '13')
+                        withdrawn.append(Decimal('7' if n % 2 else '13'))
+                    except wallet.InsufficientFunds:
+                        refused.append(n)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=hammer, args=(n,)) for n in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        expected = Decimal('10') * self.THREADS * self.ROUNDS - sum(withdrawn)
+        target.refresh_from_db()
+        self.assertEqual(target.balance, expected)
+        self.assertGreaterEqual(target.balance, 0)
+        self.assertEqual(wallet.ledger_balances(target.pk)[:2], (expected, Decimal('0.00')))
+        self.assertEqual(
+            WalletTransaction.objects.filter(wallet=target).count(),
+            self.THREADS * self.ROUNDS + len(withdrawn),
+        )
+
+
+class JobClaimTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.first, cls.second = (
+            RiderProfile.objects.create(user=User.objects.create(username=name)) for name in ("first", "second")
+        )
+
+    def setUp(self):
+        parcel = Parcel.objects.create(reference="CLAIM-1", customer_name="C", destination="Thika")
+        self.listing = AvailableJob.objects.create(parcel=parcel, min_bid_amount=Decimal('80.00'))
+
+    def test_only_one_rider_gets_a_held_job(self):
+        self.assertEqual(claims.claim(self.listing.pk, self.first).claimed_by, self.first)
+        self.assertIsNone(claims.claim(self.listing.pk, self.second))
+        self.assertIsNone(claims.take(self.listing.pk, self.second))
+
+        job = claims.take(self.listing.pk, self.first, Decimal('95.00'))
+        self.assertEqual((job.rider, job.bid_amount), (self.first, Decimal('95.00')))
+        self.assertFalse(AvailableJob.objects.exists())
+        self.assertIsNone(claims.take(self.listing.pk, self.second))
+
+    def test_bids_below_the_minimum_are_refused(self):
+        claims.claim(self.listing.pk, self.first)
+        for bid in ('79.99', '0', '-5', 'NaN'):
+            with self.assertRaises(claims.InvalidBid):
+                claims.take(self.listing.pk, self.first, Decimal(bid))
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.claimed_by, self.first)
+        self.assertFalse(Job.objects.exists())
+
+        self.client.force_login(self.first.user)
+        response = self.client.post(reverse('bid_job', args=[self.listing.pk]), {'bid_amount': '10'})
+        self.assertRedirects(response, reverse('bid_job', args=[self.listing.pk]), fetch_redirect_response=False)
+        self.assertEqual(claims.take(self.listing.pk, self.first).bid_amount, Decimal('80.00'))
+
+    def test_expired_holds_are_claimable_and_released(self):
+        claims.claim(self.listing.pk, self.first, ttl=60)
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch("riders.claims.timezone.now", return_value=later):
+            self.assertEqual(claims.claim_next(self.second).pk, self.listing.pk)
+
+        claims.claim(self.listing.pk, self.second, ttl=-1)
+        self.assertEqual(claims.release_expired(), 1)
+        self.listing.refresh_from_db()
+        self.assertIsNone(self.listing.claimed_by)
+
+    def test_losing_bid_redirects_with_a_message(self):
+        claims.take(self.listing.pk, self.first)
+        self.client.force_login(self.second.user)
+        response = self.client.post(reverse('bid_job', args=[self.listing.pk]), {'bid_amount': '90'}, follow=True)
+        self.assertRedirects(response, reverse('available_jobs'))
+        self.assertIn("taken by another rider", str(list(response.context['messages'])[0]))
+
+
+@mock.patch.object(rider_geo.rider_index, "min_interval", 0)
+class NearestRiderTests(TestCase):
+
+    def test_only_active_riders_with_fresh_positions(self):
+        User = get_user_model()
+        near, far, stale, suspended = (
+            RiderProfile.objects.create(user=User.objects.create(username=name)) for name in ("near", "far", "stale", "off")
+        )
+        RiderProfile.objects.filter(pk=suspended.pk).update(status='SUSPENDED')
+        rider_geo.set_position(near.pk, -1.2864, 36.8172)
+        rider_geo.set_position(far.pk, -1.3200, 36.9000)
+        rider_geo.set_position(stale.pk, -1.2860, 36.8170, at=timezone.now() - timedelta(hours=1))
+        rider_geo.set_position(suspended.pk, -1.2864, 36.8172)
+        with self.assertRaises(ValueError):
+            rider_geo.set_position(near.pk, 91, 0)
+
+        self.assertEqual([rider for rider, _ in rider_geo.nearest_riders(-1.2833, 36.8167, k=5)], [near, far])
+        self.assertEqual([rider for rider, _ in rider_geo.riders_within(-1.2833, 36.8167, 2)], [near])
+
+
+class LocationIngestTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = RiderProfile.objects.create(user=get_user_model().objects.create(username="rider"))
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(location, "buffer", location.LocationBuffer(flush_interval=None))
+        self.buffer = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.t0 = timezone.now().timestamp() - 600
+
+    def ping(self, seconds, lat=-1.2864, lon=36.8172, **extra):
+        return {"lat": lat, "lon": lon, "t": (self.t0 + seconds) * 1000, **extra}
+
+    def test_trail_is_down_sampled_and_flushed_in_bulk(self):
+        pings = [self.ping(s, lat=-1.2864 + s * 1e-6) for s in range(10)]  # parked: ~1 m apart
+        pings += [self.ping(20, lat=-1.2855), self.ping(90, lat=-1.2855), self.ping(5), {"lat": "x"}]
+        self.assertEqual(location.ingest(self.rider.pk, pings), (13, 3, 1))
+        self.assertEqual(location.latest_position(self.rider.pk).t, self.t0 + 90)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.buffer.flush(), (3, 1))
+        self.assertLessEqual(len(queries), 5)
+        self.assertEqual(RiderLocation.objects.filter(rider=self.rider).count(), 3)
+        self.rider.refresh_from_db()
+        self.assertEqual((self.rider.latitude, self.rider.position_at.timestamp()), (-1.2855, self.t0 + 90))
+        self.assertEqual(self.buffer.flush(), (0, 0))
+
+    def test_endpoint_buffers_without_writing(self):
+        self.client.force_login(self.rider.user)
+        url = reverse('rider_location')
+        body = json.dumps({"pings": [self.ping(0), self.ping(1, acc=5000), self.ping(2, lat=-1.29)]})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, body, content_type="application/json")
+        self.assertEqual(response.json(), {"accepted": 2, "kept": 2, "rejected": 1})
+        self.assertFalse([q for q in queries if q["sql"].startswith(("UPDATE", "INSERT"))])
+
+        self.assertEqual(self.client.post(url, "{}", content_type="application/json").status_code, 400)
+        self.rider.status = 'SUSPENDED'
+        self.rider.save()
+        self.assertEqual(self.client.post(url, body, content_type="application/json").status_code, 403)
+
+    def test_deleted_rider_does_not_block_the_flush(self):
+        gone = RiderProfile.objects.create(user=get_user_model().objects.create(username="gone"))
+        gone_id = gone.pk
+        location.ingest(gone_id, [self.ping(0)])
+        location.ingest(self.rider.pk, [self.ping(0)])
+        gone.delete()
+        self.assertEqual(self.buffer.flush(), (1, 1))
+        self.assertEqual(list(RiderLocation.objects.values_list('rider_id', flat=True)), [self.rider.pk])
+        self.assertNotIn(gone_id, self.buffer.latest)
+
+
+@mock.patch.object(rider_geo.rider_index, "min_interval", 0)
+class DispatchTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.shop = Shop.objects.create(name="CBD", latitude=-1.2864, longitude=36.8172)
+        cls.near, cls.busy, cls.far, cls.suspended = (
+            RiderProfile.objects.create(user=User.objects.create(username=name))
+            for name in ("near", "busy", "far", "off")
+        )
+        RiderProfile.objects.filter(pk=cls.suspended.pk).update(status='SUSPENDED')
+        for n in range(dispatch.DISPATCH_MAX_LOAD):
+            parcel = Parcel.objects.create(reference=f"BUSY-{n}", customer_name="C", destination="Thika")
+            Job.objects.create(parcel=parcel, rider=cls.busy)
+
+    def setUp(self):
+        for rider, (lat, lon) in (
+            (self.near, (-1.2870, 36.8180)), (self.busy, (-1.2864, 36.8172)),
+            (self.far, (-1.3100, 36.8500)), (self.suspended, (-1.2864, 36.8172)),
+        ):
+            rider_geo.set_position(rider.pk, lat, lon)
+        listed_at = timezone.now() - timedelta(seconds=dispatch.DISPATCH_AFTER + 1)
+        for n in range(4):
+            parcel = Parcel.objects.create(
+                reference=f"DISPATCH-{n}", customer_name="C", destination="Thika", origin_shop=self.shop,
+            )
+            AvailableJob.objects.create(parcel=parcel)
+        AvailableJob.objects.update(created_at=listed_at)
+        self.held = AvailableJob.objects.get(parcel__reference="DISPATCH-3")
+        claims.claim(self.held.pk, self.far)
+
+    def test_plan_prefers_near_riders_within_fairness_caps(self):
+        riders = {
+            1: dispatch.RiderState(1, 5.0, True, 0, False),
+            2: dispatch.RiderState(2, 5.0, True, 0, True),  # on probation
+            3: dispatch.RiderState(3, 4.0, True, 0, False),
+        }
+        tree = KDTree([(1, -1.2864, 36.8172), (2, -1.2864, 36.8172), (3, -1.2900, 36.8300)])
+        open_jobs = [dispatch.OpenJob(n, -1.2864, 36.8172, waited=n * 60) for n in range(1, 6)]
+
+        assignments = dispatch.plan(open_jobs, riders, tree.nearest, max_load=3, max_per_cycle=2)
+        per_rider = {rider_id: [a.job_id for a in assignments if a.rider_id == rider_id] for rider_id in riders}
+        self.assertEqual(per_rider[1], [5, 4])  # the nearest rider gets the longest-waiting jobs first
+        self.assertEqual(len(assignments), 5)
+        self.assertTrue(all(len(job_ids) <= 2 for job_ids in per_rider.values()))
+        self.assertLess(assignments[0].score, assignments[-1].score)
+
+    def test_dry_run_writes_nothing(self):
+        result = dispatch.dispatch(dry_run=True)
+        self.assertEqual((result.jobs, len(result.assignments), result.created), (3, 3, []))
+        self.assertEqual(AvailableJob.objects.count(), 4)
+
+    def test_dispatch_assigns_in_bulk(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = dispatch.dispatch()
+        self.assertLessEqual(len(queries), 20)
+
+        # near takes two (the per-cycle cap) and far the third; busy is full and the suspended rider is skipped.
+        riders = Job.objects.filter(parcel__reference__startswith="DISPATCH-").values_list('rider', flat=True)
+        self.assertEqual(len(result.created), 3)
+        self.assertEqual(sorted(riders), sorted([self.near.pk, self.near.pk, self.far.pk]))
+        self.assertEqual(list(AvailableJob.objects.all()), [self.held])
+        self.near.refresh_from_db()
+        self.assertEqual(self.near.total_jobs, 2)
+        self.assertEqual(RiderNotification.objects.filter(rider=self.near).count(), 2)
+
+        # A job another rider holds is left to them.
+        self.assertEqual(claims.take_many([(self.held.pk, self.near.pk)]), [])
+        self.assertEqual(AvailableJob.objects.get().claimed_by, self.far)
+
+
+class JobFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.rider, cls.other = (
+            RiderProfile.objects.create(user=User.objects.create(username=name)) for name in ("rider", "other")
+        )
+        cbd = Shop.objects.create(name="CBD", latitude=-1.2864, longitude=36.8172)
+        nakuru = Shop.objects.create(name="Nakuru", latitude=-0.3031, longitude=36.0800)
+        phones = Category.objects.create(name="Phones")
+        start = timezone.now() - timedelta(hours=1)
+        for n in range(25):
+            parcel = Parcel.objects.create(
+                reference=f"FEED-{n}", customer_name="C", destination="Thika",
+                origin_shop=cbd if n % 2 else nakuru, category=phones if n % 5 == 0 else None,
+            )
+            AvailableJob.objects.create(parcel=parcel, min_bid_amount=Decimal(50 + n))
+            # Pairs of jobs share a timestamp, so pages must break ties on id.
+            AvailableJob.objects.filter(parcel=parcel).update(created_at=start + timedelta(minutes=n // 2))
+        cls.held = AvailableJob.objects.get(parcel__reference="FEED-24")
+        claims.claim(cls.held.pk, cls.other)
+
+    def setUp(self):
+        cache.clear()
+        shop_index.invalidate()
+        self.client.force_login(self.rider.user)
+        self.url = reverse('job_feed')
+
+    def get(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_keyset_pages_cover_every_open_job_in_constant_queries(self):
+        self.get(limit=1)  # warm the rider lookup and the shop index
+        expected = list(
+            AvailableJob.objects.exclude(pk=self.held.pk).order_by('-created_at', '-pk').values_list('pk', flat=True)
+        )
+        seen, cursor, counts = [], None, []
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.get(limit=10, **({"after": cursor} if cursor else {}))
+            counts.append(len(queries))
+            seen += [job["id"] for job in page["jobs"]]
+            cursor = page["next"]
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+        self.assertEqual(len(set(counts)), 1)
+        self.assertEqual(set(page["jobs"][0]), {"id", "ref", "to", "min_bid", "at", "shop"})
+
+    def test_filters(self):
+        near = self.get(lat=-1.2833, lon=36.8167, radius_km=5)["jobs"]
+        self.assertEqual({job["shop"] for job in near}, {"CBD"})
+        self.assertTrue(all(job["km"] < 5 for job in near))
+        self.assertEqual([job["min_bid"] for job in self.get(min_bid=70)["jobs"]], ["73.00", "72.00", "71.00", "70.00"])
+        self.assertEqual({job["cat"] for job in self.get(category="phones")["jobs"]}, {"Phones"})
+        by_id = self.get(category=Category.objects.get(name="Phones").pk)["jobs"]
+        self.assertEqual(({job["cat"] for job in by_id}, len(by_id)), ({"Phones"}, 5))
+
+        self.assertEqual(self.client.get(self.url, {"after": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"after": "ffffffffffffffff.1"}).status_code, 400)
+        bad_queries = (
+            {"radius_km": -5, "lat": -1.28, "lon": 36.82}, {"radius_km": "nan"}, {"min_bid": "NaN"},
+            {"category": "²"}, {"category": "٣"}, {"category": "9" * 30},
+        )
+        for bad in bad_queries:
+            self.assertEqual(self.client.get(self.url, bad).status_code, 400, bad)
+        self.assertEqual(self.client.get(self.url, {"radius_km": 5}).status_code, 400)  # no position known
+
+    def test_job_list_page_is_constant_queries(self):
+        url = reverse('available_jobs')
+        with CaptureQueriesContext(connection) as all_jobs:
+            self.client.get(url)
+        AvailableJob.objects.filter(pk__in=list(AvailableJob.objects.values_list('pk', flat=True)[:20])).delete()
+        with CaptureQueriesContext(connection) as few_jobs:
+            self.client.get(url)
+        self.assertEqual(len(all_jobs), len(few_jobs))
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(prefix="rider-pdf-tests-"))
+class PdfTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.rider = RiderProfile.objects.create(user=get_user_model().objects.create(username="pdf-rider"))
+        cls.parcel = Parcel.objects.create(reference="PDF-1", customer_name="C", destination="Thika")
+        Job.objects.create(parcel=cls.parcel, rider=cls.rider)
+        cls.receipt = Receipt.objects.create(parcel=cls.parcel, amount=Decimal("250.00"))
+
+    def setUp(self):
+        self.client.force_login(self.rider.user)
+        self.url = reverse('parcel_pdf', args=[self.parcel.pk, 'receipt'])
+        self.key = pdf.artifact_key('riders/receipt_pdf.html', self.receipt.pk, self.receipt.updated_at.isoformat())
+        self.addCleanup(default_storage.delete, pdf.artifact_name(self.key))
+
+    def test_scan_action_redirects_to_a_get_url(self):
+        response = self.client.post(reverse('scan_parcel', args=[self.parcel.pk]), {'action': 'receipt_pdf'})
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertEqual(self.client.post(self.url).status_code, 405)
+
+    def test_stored_artifact_is_revalidated_with_its_etag(self):
+        default_storage.save(pdf.artifact_name(self.key), ContentFile(b"%PDF-1.4 stored"))
+        response = self.client.get(self.url)
+        self.assertEqual((response.status_code, b"".join(response.streaming_content)), (200, b"%PDF-1.4 stored"))
+        self.assertEqual(response["ETag"], f'"{self.key}"')
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=f'"{self.key}"')
+        self.assertEqual(response.status_code, 304)
+
+    def test_slow_render_answers_202_and_the_same_url_is_polled(self):
+        pending = Future()
+        with mock.patch.object(pdf, "submit", return_value=pending), mock.patch.object(pdf, "PDF_RENDER_WAIT", 0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response["Retry-After"], str(pdf.RETRY_AFTER))
+
+        default_storage.save(pdf.artifact_name(self.key), ContentFile(b"%PDF-1.4 done"))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_broken_pool_is_shut_down(self):
+        broken = Future()
+        broken.set_exception(BrokenProcessPool())
+        pool = mock.Mock(**{"submit.return_value": broken})
+        with mock.patch.object(pdf, "_pool", pool):
+            response = self.client.get(self.url)
+            self.assertIsNone(pdf._pool)
+        self.assertEqual(response.status_code, 503)
+        pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+    def test_receipt_shows_its_issue_date(self):
+        html = render_to_string('riders/receipt_pdf.html', {'invoice': self.receipt, 'parcel': self.parcel})
+        self.assertIn(formats.date_format(timezone.localtime(self.receipt.issued_at), "DATETIME_FORMAT"), html)
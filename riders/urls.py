@@ -11,6 +11,7 @@ urlpatterns = [
     path('scan/pickup/', views.scan_pickup, name='scan_pickup'),
     path('scan/delivery/', views.scan_delivery, name='scan_delivery'),
     path('scan/parcel/<int:parcel_id>/', views.scan_parcel, name='scan_parcel'),
+    path('parcel/<int:parcel_id>/<slug:document>.pdf', views.parcel_pdf, name='parcel_pdf'),
 
     # Superadmin routes
     path('admin/dashboard/', views.rider_dashboard_admin, name='rider_dashboard_admin'),
@@ -19,4 +20,14 @@ urlpatterns = [
     path('register/', rider_views.register_rider, name='register_rider'),
     path('withdraw/', views.withdraw_request, name='withdraw_request'),
 
+    # Jobs
+    path('jobs/', views.available_jobs, name='available_jobs'),
+    path('jobs/<int:job_id>/bid/', views.bid_job, name='bid_job'),
+    path('jobs/ongoing/', views.ongoing_jobs, name='ongoing_jobs'),
+    path('jobs/stream/', views.job_stream, name='job_stream'),
+    path('jobs/feed/', views.job_feed, name='job_feed'),
+
+    # Live position
+    path('location/', views.rider_location, name='rider_location'),
+
 ]
@@ -1,15 +1,16 @@
 # riders/views.py
-from decimal import Decimal, InvalidOperation
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import HttpResponse
-from django.template.loader import render_to_string
 
-from parcels.models import Parcel, Invoice, DeliveryNote
+from parcels.models import Parcel, ParcelStatus, Invoice, DeliveryNote
+from parcels.transitions import InvalidTransition, transition_one
+from django.db import transaction
+from django.http import Http404
+from django.views.decorators.http import require_GET
+from .jobs import InvalidJobTransition, move as move_job, pay_for
 from .models import RiderProfile, RiderWallet, RiderNotification
-
-from xhtml2pdf import pisa  # PDF generation
+from .pdf import pdf_response
 
 # -------------------------
 # Superadmin checks
@@ -45,6 +46,8 @@ def edit_rider(request, rider_id):
 # -------------------------
 # Rider dashboard
 # -------------------------
+RIDER_NOTIFICATIONS_SHOWN = 20
+
 @login_required
 def rider_dashboard(request):
     try:
@@ -54,13 +57,16 @@ def rider_dashboard(request):
         return redirect('register_rider')
 
     jobs = rider.job_set.filter(status__in=['ASSIGNED', 'IN_TRANSIT'])
-    notifications = RiderNotification.objects.filter(rider=rider).order_by('-created_at')
+    rider_notifications = RiderNotification.objects.filter(rider=rider)
+    notifications = rider_notifications.order_by('-created_at')[:RIDER_NOTIFICATIONS_SHOWN]
+    unread_count = rider_notifications.filter(read=False).count()
     wallet, _ = RiderWallet.objects.get_or_create(rider=rider)
 
     return render(request, 'riders/rider_dashboard.html', {
         'rider': rider,
         'jobs': jobs,
         'notifications': notifications,
+        'unread_count': unread_count,
         'wallet': wallet,
     })
 
@@ -73,9 +79,12 @@ def scan_pickup(request):
     if request.method == 'POST':
         reference = request.POST.get('reference')
         parcel = get_object_or_404(Parcel, reference=reference)
-        parcel.current_status = 'IN_TRANSIT'
-        parcel.save()
-        messages.success(request, f"Parcel {parcel.reference} is now In Transit")
+        try:
+            transition_one(parcel, ParcelStatus.IN_TRANSIT, actor=request.user)
+        except InvalidTransition as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f"Parcel {parcel.reference} is now In Transit")
         return redirect('rider_dashboard')
     return render(request, 'riders/scan_pickup.html')
 
@@ -86,9 +95,13 @@ def scan_delivery(request):
         reference = request.POST.get('reference')
         parcel = get_object_or_404(Parcel, reference=reference)
         action = request.POST.get('action')
-        parcel.current_status = 'ARRIVED_PICKUP' if action == 'pickup_agent' else 'DELIVERED'
-        parcel.save()
-        messages.success(request, f"Parcel {parcel.reference} status updated to {parcel.current_status}")
+        to_status = ParcelStatus.AT_PICKUP if action == 'pickup_agent' else ParcelStatus.DELIVERED
+        try:
+            transition_one(parcel, to_status, actor=request.user)
+        except InvalidTransition as e:
+            messages.error(request, str(e))
+        else:
+            messages.success(request, f"Parcel {parcel.reference} status updated to {parcel.get_status_display()}")
         return redirect('rider_dashboard')
     return render(request, 'riders/scan_delivery.html')
 
@@ -120,57 +133,84 @@ def scan_parcel(request, parcel_id=None):
         action = request.POST.get('action')
 
         if action == "pickup":
-            job.status = 'ARRIVED'
-            job.save()
+            try:
+                move_job(job, 'ARRIVED')
+            except InvalidJobTransition as e:
+                messages.error(request, str(e))
+                return redirect('rider_dashboard')
             RiderNotification.objects.create(rider=rider, message=f"Parcel {parcel.reference} picked up.")
             messages.success(request, f"Parcel {parcel.reference} picked up successfully.")
 
         elif action == "delivery":
-            distance_str = request.POST.get('distance_km', '0')
-            try:
-                distance = Decimal(distance_str)
-            except (InvalidOperation, TypeError):
-                distance = Decimal('0')
+            # Pay was fixed from the tariff when the job was taken, never from
+            # a distance the app posts. Jobs taken before it was recorded are
+            # priced with today's tariff at the time they were taken.
+            pay = job.rider_pay if job.rider_pay is not None else pay_for(parcel, job.bid_amount, at=job.assigned_at)
 
-            job.status = 'DELIVERED'
-            job.save()
-
-            wallet, _ = RiderWallet.objects.get_or_create(rider=rider)
-            wallet.add_earning(distance)
+            try:
+                with transaction.atomic():
+                    move_job(job, 'DELIVERED')
+                    if pay > 0:
+                        # A free route pays nothing; there is no earning to record.
+                        wallet, _ = RiderWallet.objects.get_or_create(rider=rider)
+                        wallet.add_earning(pay, reference=f"job:{job.pk}")
+            except InvalidJobTransition as e:
+                # Already delivered: a second scan must not pay twice.
+                messages.error(request, str(e))
+                return redirect('rider_dashboard')
+            except ValueError as e:
+                # The pay could not be credited; the delivery is rolled back with it.
+                messages.error(request, f"Could not record pay for {parcel.reference}: {e}")
+                return redirect('rider_dashboard')
 
             RiderNotification.objects.create(rider=rider, message=f"Parcel {parcel.reference} delivered.")
             messages.success(request, f"Parcel {parcel.reference} delivered successfully.")
 
         elif action == "receipt_pdf":
-            return generate_pdf(
-                'riders/receipt_pdf.html',
-                {'parcel': parcel, 'rider': rider},
-                f"Receipt_{parcel.reference}.pdf"
-            )
+            return redirect('parcel_pdf', parcel_id=parcel.pk, document='receipt')
 
         elif action == "delivery_note_pdf":
-            return generate_pdf(
-                'riders/delivery_note_pdf.html',
-                {'parcel': parcel, 'rider': rider},
-                f"DeliveryNote_{parcel.reference}.pdf"
-            )
+            return redirect('parcel_pdf', parcel_id=parcel.pk, document='delivery-note')
 
         return redirect('rider_dashboard')
 
     return render(request, 'riders/scan_parcel.html', {'job': job, 'parcel': parcel})
 
 # -------------------------
-# PDF helper
+# Receipt / delivery note PDFs
 # -------------------------
-def generate_pdf(template_src, context_dict, filename):
-    """Generate PDF using xhtml2pdf."""
-    html_string = render_to_string(template_src, context_dict)
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'inline; filename="{filename}"'
-    pisa_status = pisa.CreatePDF(html_string, dest=response)
-    if pisa_status.err:
-        return HttpResponse('Error generating PDF', status=500)
-    return response
+@login_required
+@require_GET
+def parcel_pdf(request, parcel_id, document):
+    """
+    A parcel's receipt or delivery note as a PDF. A GET, so the client can
+    revalidate with ETags and poll again after a 202 while it renders.
+    """
+    rider = get_object_or_404(RiderProfile, user=request.user)
+    parcel = get_object_or_404(Parcel, id=parcel_id)
+    get_object_or_404(rider.job_set, parcel=parcel)
+
+    if document == 'receipt':
+        receipt = parcel.receipts.order_by("-issued_at").first()
+        if receipt is None:
+            raise Http404(f"Parcel {parcel.reference} has no receipt yet.")
+        return pdf_response(
+            request,
+            'riders/receipt_pdf.html',
+            {'invoice': receipt, 'parcel': parcel},
+            versions=(receipt.pk, receipt.updated_at.isoformat()),
+            filename=f"Receipt_{parcel.reference}.pdf",
+        )
+    if document == 'delivery-note':
+        delivery_note = DeliveryNote.objects.filter(parcel=parcel).first()
+        return pdf_response(
+            request,
+            'riders/delivery_note_pdf.html',
+            {'delivery_note': delivery_note, 'parcel': parcel},
+            versions=(parcel.pk, parcel.updated_at.isoformat()),
+            filename=f"DeliveryNote_{parcel.reference}.pdf",
+        )
+    raise Http404("Unknown document.")
 
 # -------------------------
 # Register rider
@@ -220,7 +260,7 @@ def wallet_withdraw(request):
 
 from django.contrib.auth.decorators import user_passes_test
 from django.utils import timezone
-from .models import RiderWallet, RiderNotification
+from .models import RiderWallet, RiderNotification, Withdrawal
 
 @login_required
 def request_withdrawal(request):
@@ -232,13 +272,12 @@ def request_withdrawal(request):
         amount_str = request.POST.get('amount', '0')
         try:
             amount = Decimal(amount_str)
-            if amount > wallet.balance:
-                messages.error(request, "Insufficient wallet balance.")
-            else:
-                RiderWallet.objects.create(wallet=wallet, amount=amount)
-                messages.success(request, f"Withdrawal request of Ksh {amount} submitted for approval.")
+            wallet.request_withdrawal(amount)
+            messages.success(request, f"Withdrawal request of Ksh {amount} submitted for approval.")
         except (InvalidOperation, TypeError):
             messages.error(request, "Invalid amount entered.")
+        except ValueError as e:
+            messages.error(request, str(e))
 
         return redirect('rider_dashboard')
 
@@ -248,7 +287,7 @@ def request_withdrawal(request):
 # Superadmin approval view
 @user_passes_test(lambda u: u.is_superuser)
 def approve_withdrawal(request, withdrawal_id):
-    withdrawal = get_object_or_404(RiderWallet, id=withdrawal_id)
+    withdrawal = get_object_or_404(Withdrawal, id=withdrawal_id)
     if withdrawal.status != 'PENDING':
         messages.error(request, "This withdrawal has already been processed.")
     else:
@@ -257,13 +296,13 @@ def approve_withdrawal(request, withdrawal_id):
             messages.success(request, f"Withdrawal of Ksh {withdrawal.amount} approved successfully.")
         except ValueError as e:
             messages.error(request, str(e))
-    return redirect('superadmin_withdrawal_dashboard')
+    return redirect('admin:riders_withdrawal_changelist')
 
 from decimal import Decimal, InvalidOperation
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth import get_user_model
+from notifications.fanout import fanout, superadmins
 
 from .models import RiderWallet, RiderNotification, RiderProfile
 
@@ -272,7 +311,6 @@ def withdraw_request(request):
     """Rider submits a withdrawal request."""
     rider = get_object_or_404(RiderProfile, user=request.user)
     wallet, _ = RiderWallet.objects.get_or_create(rider=rider)
-    User = get_user_model()  # Use your custom user model
 
     if request.method == "POST":
         amount_str = request.POST.get('amount', '0')
@@ -283,19 +321,19 @@ def withdraw_request(request):
             return redirect('withdraw_request')
 
         try:
-            # Use the withdraw method defined in RiderWallet
-            wallet.withdraw(amount)
+            # Held until a superadmin approves it (riders.wallet)
+            wallet.request_withdrawal(amount)
         except ValueError as e:
             messages.error(request, str(e))
             return redirect('withdraw_request')
 
         # Notify all superadmins
-        superadmins = User.objects.filter(is_superuser=True)
-        for admin in superadmins:
-            RiderNotification.objects.create(
-                rider=rider,  # optionally link to admin profile if needed
-                message=f"Rider {rider.user.username} requested withdrawal of KSh {amount}."
-            )
+        fanout(
+            superadmins(),
+            "Withdrawal request",
+            "Rider {rider} requested withdrawal of KSh {amount}.",
+            context={"rider": rider.user.username, "amount": amount},
+        )
 
         messages.success(request, f"Withdrawal request for KSh {amount} submitted successfully.")
         return redirect('rider_dashboard')
@@ -305,35 +343,134 @@ def withdraw_request(request):
 # riders/views.py
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.utils import timezone
+from . import claims
 from .models import RiderProfile, AvailableJob, Job
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
+
+JOB_GONE = "Job {id} has just been taken by another rider."
 
+@login_required
 def available_jobs(request):
     rider = get_object_or_404(RiderProfile, user=request.user)
-    jobs = AvailableJob.objects.all()
+    # Jobs another rider is bidding on are hidden until their hold runs out.
+    jobs = (
+        AvailableJob.objects.filter(claims.claimable(rider, timezone.now()))
+        .select_related('parcel').order_by('-created_at', '-pk')
+    )
     return render(request, 'riders/available_jobs.html', {'jobs': jobs, 'rider': rider})
 
+@login_required
 def bid_job(request, job_id):
     rider = get_object_or_404(RiderProfile, user=request.user)
-    available_job = get_object_or_404(AvailableJob, id=job_id)
 
     if request.method == "POST":
-        bid_amount_str = request.POST.get('bid_amount', available_job.min_bid_amount)
-        bid_amount = Decimal(bid_amount_str)
-
-        # Create Job and remove from AvailableJob
-        Job.objects.create(
-            parcel=available_job.parcel,
-            rider=rider,
-            bid_amount=bid_amount
-        )
-        available_job.delete()
-        messages.success(request, f"You accepted job {available_job.parcel.reference} with KSh {bid_amount}")
+        try:
+            bid_amount = Decimal(request.POST['bid_amount']) if request.POST.get('bid_amount') else None
+        except InvalidOperation:
+            messages.error(request, "Invalid bid amount.")
+            return redirect('bid_job', job_id=job_id)
+
+        # Create Job and remove from AvailableJob; only one rider can win it.
+        try:
+            job = claims.take(job_id, rider, bid_amount)
+        except claims.InvalidBid as e:
+            messages.error(request, str(e))
+            return redirect('bid_job', job_id=job_id)
+        if job is None:
+            messages.info(request, JOB_GONE.format(id=job_id))
+            return redirect('available_jobs')
+        messages.success(request, f"You accepted job {job.parcel.reference} with KSh {job.bid_amount}")
         return redirect('ongoing_jobs')
 
+    # Hold the job while the rider decides on a bid.
+    available_job = claims.claim(job_id, rider)
+    if available_job is None:
+        messages.info(request, JOB_GONE.format(id=job_id))
+        return redirect('available_jobs')
     return render(request, 'riders/bid_job.html', {'job': available_job, 'rider': rider})
 
+@login_required
 def ongoing_jobs(request):
     rider = get_object_or_404(RiderProfile, user=request.user)
-    jobs = Job.objects.filter(rider=rider).exclude(status='DELIVERED')
+    jobs = Job.objects.filter(rider=rider).exclude(status='DELIVERED').select_related('parcel')
     return render(request, 'riders/ongoing_jobs.html', {'jobs': jobs, 'rider': rider})
+
+# -------------------------
+# Live job feed (server-sent events)
+# -------------------------
+from django.http import JsonResponse
+from core.sse import event_stream
+
+async def job_stream(request):
+    """
+    New and taken AvailableJobs for every active rider, plus this rider's own
+    notifications, pushed to rider_dashboard and available_jobs. Async: an
+    idle feed holds no thread and no database connection.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+    rider = await RiderProfile.objects.filter(user=user).afirst()
+    if rider is None:
+        return JsonResponse({"error": "No rider profile"}, status=404)
+    if rider.status == 'SUSPENDED':
+        return JsonResponse({"error": "Rider suspended"}, status=403)
+    return event_stream(["jobs", f"rider:{rider.id}"])
+
+# -------------------------
+# Location pings from the rider app
+# -------------------------
+import json
+from django.views.decorators.http import require_POST
+from . import location
+
+@require_POST
+def rider_location(request):
+    """
+    Batched GPS pings: ``{"pings": [{"lat", "lon", "t" (epoch ms), "acc"}]}``.
+    Buffered in memory and written in bulk by riders.location, never per ping.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+    rider_id = location.active_rider_id(request.user)
+    if rider_id is None:
+        return JsonResponse({"error": "No active rider profile"}, status=403)
+    try:
+        accepted, kept, rejected = location.ingest(rider_id, json.loads(request.body)["pings"])
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({"error": "Expected {\"pings\": [...]}"}, status=400)
+    return JsonResponse({"accepted": accepted, "kept": kept, "rejected": rejected})
+
+# -------------------------
+# Job feed for the rider app (JSON, keyset-paginated)
+# -------------------------
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET
+from .feed import InvalidFeedQuery, job_feed as feed_page, parse_query
+
+@gzip_page
+@require_GET
+def job_feed(request):
+    """
+    Open jobs, newest first: ``{"jobs": [...], "next": cursor}``. Pass
+    ``after=<next>`` for the following page. Optional ``radius_km``,
+    ``min_bid``, ``category`` and ``limit``; ``lat``/``lon`` default to the
+    rider's last known position. See riders.feed.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Login required"}, status=401)
+    rider_id = location.active_rider_id(request.user)
+    if rider_id is None:
+        return JsonResponse({"error": "No active rider profile"}, status=403)
+    try:
+        query = parse_query(request.GET)
+        if 'lat' not in query:
+            position = location.latest_position(rider_id)
+            if position is not None:
+                query['lat'], query['lon'] = position.lat, position.lon
+        jobs, next_cursor = feed_page(rider_id, **query)
+    except InvalidFeedQuery as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse({"jobs": jobs, "next": next_cursor}, json_dumps_params={"separators": (",", ":")})
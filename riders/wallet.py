@@ -0,0 +1,205 @@
+# riders/wallet.py
+"""
+Rider wallet ledger.
+
+Every change to a wallet is a ``WalletTransaction``: an append-only,
+double-entry posting that moves an amount from one ``LedgerAccount`` to
+another. Earnings go PLATFORM → AVAILABLE. A withdrawal request holds the money
+(AVAILABLE → HELD) until a superadmin approves it (HELD → PAYOUT) or rejects
+it (HELD → AVAILABLE). Direct withdrawals go AVAILABLE → PAYOUT.
+
+``RiderWallet.balance`` and ``RiderWallet.held`` mirror the two wallet
+accounts. ``post()`` adjusts them in one conditional ``F()`` UPDATE, which
+also refuses to overdraw, then appends the posting in the same transaction.
+Concurrent deliveries and withdrawals therefore serialize on the wallet row
+and never lose an update. Readers use the columns directly.
+
+``WalletCheckpoint`` rows record the ledger balances up to a transaction id.
+``ledger_balances()`` starts from the latest one and sums only newer
+postings, so checking a wallet against its ledger never scans full history.
+``manage.py checkpoint_wallets`` adds checkpoints and reports any drift.
+"""
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max, Q, Sum
+from django.utils import timezone
+
+from .models import LedgerAccount, RiderWallet, WalletCheckpoint, WalletTransaction, Withdrawal
+
+WALLET_CHECKPOINT_EVERY = getattr(settings, "WALLET_CHECKPOINT_EVERY", 100)  # postings
+
+# Wallet accounts and the RiderWallet column each one is mirrored in.
+WALLET_COLUMNS = {
+    LedgerAccount.AVAILABLE: 'balance',
+    LedgerAccount.HELD: 'held',
+}
+
+
+class InsufficientFunds(ValueError):
+    pass
+
+
+def to_amount(amount):
+    """``amount`` as a positive Decimal; ValueError otherwise."""
+    if not isinstance(amount, Decimal):
+        try:
+            amount = Decimal(str(amount))
+        except (InvalidOperation, TypeError):
+            raise ValueError("Invalid amount")
+    if not amount.is_finite():
+        raise ValueError("Invalid amount")
+    if amount <= 0:
+        raise ValueError("Amount must be greater than zero")
+    return amount.quantize(Decimal('0.01'))
+
+
+def post(wallet, kind, amount, credit, debit, reference=None, memo=""):
+    """
+    Move ``amount`` from ``credit`` to ``debit`` and record it. Returns the
+    WalletTransaction; if ``reference`` was already posted, returns that one
+    and changes nothing. Raises InsufficientFunds instead of overdrawing a
+    wallet account.
+    """
+    amount = to_amount(amount)
+    wallet_id = getattr(wallet, 'pk', wallet)
+    changes, guard = {}, {}
+    if credit in WALLET_COLUMNS:
+        column = WALLET_COLUMNS[credit]
+        changes[column] = F(column) - amount
+        guard[f'{column}__gte'] = amount
+    if debit in WALLET_COLUMNS:
+        column = WALLET_COLUMNS[debit]
+        changes[column] = F(column) + amount
+    try:
+        with transaction.atomic():
+            # The UPDATE comes first: it locks the wallet row until commit, so
+            # postings (and checkpoints) of one wallet are strictly ordered.
+            if not RiderWallet.objects.filter(pk=wallet_id, **guard).update(**changes):
+                raise InsufficientFunds("Insufficient balance")
+            return WalletTransaction.objects.create(
+                wallet_id=wallet_id, kind=kind, amount=amount, credit=credit, debit=debit,
+                reference=reference, memo=memo,
+            )
+    except IntegrityError:
+        existing = WalletTransaction.objects.filter(reference=reference).first() if reference else None
+        if existing is None:
+            raise
+        return existing
+
+
+def earn(wallet, amount, reference=None, memo=""):
+    return post(wallet, 'EARNING', amount, LedgerAccount.PLATFORM, LedgerAccount.AVAILABLE, reference, memo)
+
+
+def pay_out(wallet, amount, reference=None, memo=""):
+    return post(wallet, 'WITHDRAWAL', amount, LedgerAccount.AVAILABLE, LedgerAccount.PAYOUT, reference, memo)
+
+
+def adjust(wallet, amount, memo=""):
+    """Correct a wallet by a signed ``amount`` against the platform account."""
+    amount = Decimal(str(amount))
+    if amount < 0:
+        return post(wallet, 'ADJUSTMENT', -amount, LedgerAccount.AVAILABLE, LedgerAccount.PLATFORM, memo=memo)
+    return post(wallet, 'ADJUSTMENT', amount, LedgerAccount.PLATFORM, LedgerAccount.AVAILABLE, memo=memo)
+
+
+@transaction.atomic
+def request_withdrawal(wallet, amount):
+    """Hold ``amount`` and create a pending Withdrawal. Raises InsufficientFunds."""
+    withdrawal = Withdrawal.objects.create(wallet=wallet, amount=to_amount(amount))
+    post(
+        wallet, 'HOLD', withdrawal.amount, LedgerAccount.AVAILABLE, LedgerAccount.HELD,
+        reference=f"withdrawal:{withdrawal.pk}:hold",
+    )
+    return withdrawal
+
+
+@transaction.atomic
+def settle_withdrawal(withdrawal, status, admin_user=None):
+    """Approve (pay out) or reject (release) a pending withdrawal, once."""
+    now = timezone.now()
+    claimed = Withdrawal.objects.filter(pk=withdrawal.pk, status='PENDING').update(
+        status=status, processed_at=now, processed_by=admin_user,
+    )
+    if not claimed:
+        raise ValueError("This withdrawal has already been processed.")
+    if status == 'APPROVED':
+        post(
+            withdrawal.wallet_id, 'PAYOUT', withdrawal.amount, LedgerAccount.HELD, LedgerAccount.PAYOUT,
+            reference=f"withdrawal:{withdrawal.pk}:payout",
+        )
+    else:
+        post(
+            withdrawal.wallet_id, 'RELEASE', withdrawal.amount, LedgerAccount.HELD, LedgerAccount.AVAILABLE,
+            reference=f"withdrawal:{withdrawal.pk}:release",
+        )
+    withdrawal.status, withdrawal.processed_at, withdrawal.processed_by = status, now, admin_user
+    return withdrawal
+
+
+# -------------------------
+# Checkpoints
+# -------------------------
+def ledger_balances(wallet_id):
+    """
+    ``(balance, held, last_transaction_id)`` from the ledger: the latest
+    checkpoint plus one aggregate over the postings after it.
+    """
+    checkpoint = WalletCheckpoint.objects.filter(wallet_id=wallet_id).order_by('-last_transaction_id').first()
+    balance = held = Decimal('0.00')
+    last_id = 0
+    if checkpoint is not None:
+        balance, held, last_id = checkpoint.balance, checkpoint.held, checkpoint.last_transaction_id
+    totals = WalletTransaction.objects.filter(wallet_id=wallet_id, id__gt=last_id).aggregate(
+        last=Max('id'),
+        **{
+            f'{column}_{side}': Sum('amount', filter=Q(**{side: account}))
+            for account, column in WALLET_COLUMNS.items()
+            for side in ('debit', 'credit')
+        },
+    )
+    if totals['last'] is None:
+        return balance, held, last_id
+
+    def net(column):
+        return (totals[f'{column}_debit'] or 0) - (totals[f'{column}_credit'] or 0)
+
+    return balance + net('balance'), held + net('held'), totals['last']
+
+
+@transaction.atomic
+def checkpoint(wallet_id, min_transactions=WALLET_CHECKPOINT_EVERY, opening=False):
+    """
+    Record a checkpoint for the wallet if at least ``min_transactions``
+    postings came after the last one and its columns agree with the ledger. Returns ``(checkpoint or None, drift)``
+    where drift is the RiderWallet columns minus the ledger, ``(0, 0)`` when
+    they agree.
+
+    ``opening=True`` takes a wallet without checkpoints as it stands: money it
+    held before the ledger existed becomes an opening checkpoint at id 0.
+    """
+    # Locking the row waits out postings in flight (see post()), so the ledger
+    # read below includes every posting up to the one the columns reflect.
+    wallet = RiderWallet.objects.select_for_update().get(pk=wallet_id)
+    previous = WalletCheckpoint.objects.filter(wallet_id=wallet_id).order_by('-last_transaction_id').first()
+    balance, held, last_id = ledger_balances(wallet_id)
+    drift = (wallet.balance - balance, wallet.held - held)
+    if opening and previous is None and any(drift):
+        previous = WalletCheckpoint.objects.create(
+            wallet_id=wallet_id, last_transaction_id=0, balance=drift[0], held=drift[1],
+        )
+        balance, held, last_id = ledger_balances(wallet_id)
+        drift = (wallet.balance - balance, wallet.held - held)
+
+    if any(drift):
+        return None, drift  # reported, never checkpointed over
+    since = WalletTransaction.objects.filter(
+        wallet_id=wallet_id, id__gt=previous.last_transaction_id if previous else 0,
+    ).count()
+    if since == 0 or since < min_transactions:
+        return None, drift
+    return WalletCheckpoint.objects.create(
+        wallet_id=wallet_id, last_transaction_id=last_id, balance=balance, held=held,
+    ), drift
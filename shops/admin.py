@@ -8,5 +8,5 @@ from .models import Shop
 
 @admin.register(Shop)
 class ShopAdmin(admin.ModelAdmin):
- list_display = ("name", "contact_phone", "latitude", "longitude")
+ list_display = ("name", "contact_phone", "latitude", "longitude", "geohash")
  search_fields = ("name", "contact_phone")
\ No newline at end of file
@@ -0,0 +1,44 @@
+# shops/geo.py
+"""
+Nearest-shop lookups, e.g. the pickup shop closest to a parcel's destination.
+
+``shop_index`` is a core.geo.SpatialIndex over every shop with a position.
+shops.signals invalidates it when shops are saved or deleted; code that
+writes shops with ``update()``/``bulk_create`` must call
+``shop_index.invalidate()`` itself.
+"""
+from core.geo import SpatialIndex, geohash_filter, haversine_km
+
+from .models import Shop
+
+
+def _positions():
+    return (
+        Shop.objects.exclude(latitude=None).exclude(longitude=None)
+        .values_list("pk", "latitude", "longitude").iterator(chunk_size=5000)
+    )
+
+
+shop_index = SpatialIndex("shops", _positions)
+
+
+def _with_shops(pairs):
+    shops = Shop.objects.in_bulk([pk for pk, _ in pairs])
+    return [(shops[pk], km) for pk, km in pairs if pk in shops]
+
+
+def nearest_shops(lat, lon, k=5, max_km=None):
+    """Up to ``k`` ``(shop, km)`` pairs, nearest first."""
+    return _with_shops(shop_index.nearest(lat, lon, k, max_km))
+
+
+def shops_within(lat, lon, radius_km):
+    """Every ``(shop, km)`` pair within ``radius_km``, nearest first."""
+    return _with_shops(shop_index.within(lat, lon, radius_km))
+
+
+def shops_within_db(lat, lon, radius_km):
+    """shops_within() straight from the database via the geohash column, for one-off use."""
+    candidates = Shop.objects.filter(geohash_filter(lat, lon, radius_km))
+    found = [(shop, haversine_km(lat, lon, shop.latitude, shop.longitude)) for shop in candidates]
+    return sorted([pair for pair in found if pair[1] <= radius_km], key=lambda pair: pair[1])
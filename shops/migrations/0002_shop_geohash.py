@@ -0,0 +1,53 @@
+# Generated by Django 5.0.6 on 2026-10-18 20:59
+
+from django.db import migrations, models
+
+# A frozen copy of core.geo.geohash_encode at precision 9, so this migration
+# does not change if that module does.
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def geohash_encode(lat, lon):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < GEOHASH_PRECISION:
+        value, bounds = (lon, lon_range) if even else (lat, lat_range)
+        middle = (bounds[0] + bounds[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            bounds[0] = middle
+        else:
+            bounds[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    Shop = apps.get_model('shops', 'Shop')
+    shops = list(Shop.objects.exclude(latitude=None).exclude(longitude=None))
+    for shop in shops:
+        if -90 <= shop.latitude <= 90 and -180 <= shop.longitude <= 180:
+            shop.geohash = geohash_encode(shop.latitude, shop.longitude)
+    Shop.objects.bulk_update(shops, ['geohash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shop',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -4,12 +4,22 @@ from django.db import models
 # shops/models.py
 from django.db import models
 
+from core.geo import geohash_encode, has_position
+
 
 class Shop(models.Model):
  name = models.CharField(max_length=120)
  contact_phone = models.CharField(max_length=30, blank=True)
  latitude = models.FloatField(null=True, blank=True)
  longitude = models.FloatField(null=True, blank=True)
+ # Kept in step with latitude/longitude by save(); see core.geo and shops.geo.
+ geohash = models.CharField(max_length=12, blank=True, default="", db_index=True, editable=False)
+
+ def save(self, *args, **kwargs):
+  self.geohash = geohash_encode(self.latitude, self.longitude) if has_position(self.latitude, self.longitude) else ""
+  if kwargs.get("update_fields") is not None and {"latitude", "longitude"} & set(kwargs["update_fields"]):
+   kwargs["update_fields"] = {*kwargs["update_fields"], "geohash"}
+  super().save(*args, **kwargs)
 
 
 def __str__(self):
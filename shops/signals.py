@@ -0,0 +1,13 @@
+# shops/signals.py
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .geo import shop_index
+from .models import Shop
+
+
+@receiver(post_save, sender=Shop)
+@receiver(post_delete, sender=Shop)
+def invalidate_shop_index(sender, **kwargs):
+    transaction.on_commit(shop_index.invalidate)
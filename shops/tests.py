@@ -1,3 +1,30 @@
 from django.test import TestCase
 
-# Create your tests here.
+from .geo import nearest_shops, shops_within, shops_within_db
+from .models import Shop
+
+
+class NearestShopTests(TestCase):
+
+    def setUp(self):
+        # Saving invalidates shops.geo.shop_index once the transaction commits.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cbd = Shop.objects.create(name="CBD", latitude=-1.2864, longitude=36.8172)
+            self.westlands = Shop.objects.create(name="Westlands", latitude=-1.2676, longitude=36.8108)
+            self.nakuru = Shop.objects.create(name="Nakuru", latitude=-0.3031, longitude=36.0800)
+            Shop.objects.create(name="Unmapped")
+
+    def test_nearest_and_radius(self):
+        self.assertEqual(self.cbd.geohash[:6], "kzf0tv")
+        self.assertEqual([shop for shop, _ in nearest_shops(-1.2833, 36.8167, k=2)], [self.cbd, self.westlands])
+        self.assertEqual([shop for shop, _ in shops_within(-1.2833, 36.8167, 5)], [self.cbd, self.westlands])
+        self.assertEqual([shop for shop, _ in shops_within_db(-1.2833, 36.8167, 5)], [self.cbd, self.westlands])
+
+    def test_moving_a_shop_updates_lookups(self):
+        nearest_shops(-0.30, 36.08, k=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.westlands.latitude, self.westlands.longitude = -0.3000, 36.0790
+            self.westlands.save(update_fields=["latitude", "longitude"])
+        self.westlands.refresh_from_db()
+        self.assertTrue(self.westlands.geohash.startswith("kzc"))
+        self.assertEqual(nearest_shops(-0.30, 36.08, k=1)[0][0], self.westlands)
@@ -2,6 +2,7 @@
 from django.contrib.auth.views import LoginView
 from django.shortcuts import redirect, render
 
+from notifications.inbox import page as inbox_page
 from parcels.models import Parcel
 
 class RoleLoginView(LoginView):
@@ -38,7 +39,7 @@ class RiderDashboardView(LoginRequiredMixin, TemplateView):
 
 def client_dashboard(request):
     parcels = Parcel.objects.filter(customer=request.user)
-    notifications = request.user.client_notifications.all()  # example related_name
+    notifications, _ = inbox_page(request.user)
     context = {
         'parcels': parcels,
         'notifications': notifications,
@@ -84,11 +85,8 @@ def role_login_view(request):
     reference = request.GET.get("reference")
     if reference:
         searched = True
-        from parcels.models import Parcel
-        try:
-            tracked_parcel = Parcel.objects.get(reference=reference)
-        except Parcel.DoesNotExist:
-            tracked_parcel = None
+        from parcels.tracking import get_tracking_snapshot
+        tracked_parcel = get_tracking_snapshot(reference)
 
     return render(request, "login.html", {
         "tracked_parcel": tracked_parcel,